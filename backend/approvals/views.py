@@ -100,7 +100,7 @@ class ApprovalRequestViewSet(viewsets.ModelViewSet):
         queryset = ApprovalRequest.objects.filter(
             branch=request.user.branch,
             status='pending'
-        ).select_related('requester', 'branch').order_by('-created_at')
+        ).select_related('requester', 'manager', 'branch').order_by('-created_at')
         
         serializer = ApprovalRequestSerializer(queryset, many=True)
         return Response(serializer.data)
@@ -109,7 +109,7 @@ class ApprovalRequestViewSet(viewsets.ModelViewSet):
     def my_requests(self, request):
         queryset = ApprovalRequest.objects.filter(
             requester=request.user
-        ).select_related('manager', 'branch').order_by('-created_at')[:20]
+        ).select_related('requester', 'manager', 'branch').order_by('-created_at')[:20]
         
         serializer = ApprovalRequestSerializer(queryset, many=True)
         return Response(serializer.data)
@@ -0,0 +1,139 @@
+"""JWT authentication without a user query on every request.
+
+`CachedJWTAuthentication` loads the user together with their branch in one
+query and keeps both in the cache under the token's ``jti`` for
+JWT_USER_CACHE_SECONDS. Saving a user or branch records when it changed,
+and entries older than that change are reloaded.
+
+`ClaimsJWTAuthentication` goes further for the till endpoints: when
+JWT_TRUST_TOKEN_CLAIMS is on it builds the user from the role and branch
+claims written into the token at login and takes the branch from the
+cache, so a request needs no auth query at all. Claims are only as fresh
+as the login that issued them; a user changed since then is loaded as in
+the cached mode instead.
+
+Change markers live in the Django cache, so they only reach other
+processes when CACHES points at a shared backend; a system check refuses
+JWT_TRUST_TOKEN_CLAIMS with a per-process cache. The password hash and
+other fields authentication does not use are never cached.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .metrics import record_cache
+from .models import User, Branch
+
+# User fields written into access tokens; the user id claim comes from simplejwt
+CLAIM_FIELDS = ['username', 'first_name', 'last_name', 'role', 'branch_id', 'is_staff', 'is_superuser']
+CLAIMS_AT = 'claims_at'
+# Left out of cached users; they load from the database if something reads them
+UNCACHED_USER_FIELDS = {'password', 'last_login'}
+
+
+def _changed_key(model, pk):
+    return f'auth:{model}-changed:{pk}'
+
+
+def _mark_changed(model, pk):
+    # Kept as long as a refresh token can carry claims issued before the change
+    timeout = int(settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds())
+    cache.set(_changed_key(model, pk), time.time(), timeout)
+
+
+def mark_user_changed(user_id):
+    _mark_changed('user', user_id)
+
+
+def mark_branch_changed(branch_id):
+    _mark_changed('branch', branch_id)
+    cache.delete(f'auth:branch:{branch_id}')
+
+
+def _changed_since(timestamp, user_id=None, branch_id=None):
+    keys = []
+    if user_id is not None:
+        keys.append(_changed_key('user', user_id))
+    if branch_id is not None:
+        keys.append(_changed_key('branch', branch_id))
+    return any(changed > timestamp for changed in cache.get_many(keys).values())
+
+
+def _field_values(instance, exclude=()):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields
+            if field.attname not in exclude}
+
+
+def _from_values(model, values):
+    # Fields missing from `values` stay deferred and load on first access
+    return model.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+
+
+def token_claims(user):
+    """Claims `ClaimsJWTAuthentication` rebuilds `user` from."""
+    claims = {field: getattr(user, field) for field in CLAIM_FIELDS}
+    claims[CLAIMS_AT] = int(time.time())
+    return claims
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = f"auth:token:{validated_token.get(api_settings.JTI_CLAIM)}"
+        entry = cache.get(key)
+        if entry and _changed_since(entry['cached_at'], user_id, entry['user']['branch_id']):
+            entry = None
+        record_cache('auth_user', entry is not None)
+        if entry:
+            user = _from_values(User, entry['user'])
+            user.branch = _from_values(Branch, entry['branch']) if entry['branch'] else None
+        else:
+            cached_at = time.time()
+            try:
+                user = User.objects.select_related('branch').get(**{api_settings.USER_ID_FIELD: user_id})
+            except User.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, {
+                'cached_at': cached_at,
+                'user': _field_values(user, exclude=UNCACHED_USER_FIELDS),
+                'branch': _field_values(user.branch) if user.branch else None,
+            }, settings.JWT_USER_CACHE_SECONDS)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class ClaimsJWTAuthentication(CachedJWTAuthentication):
+    def get_user(self, validated_token):
+        claims_at = validated_token.get(CLAIMS_AT)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if (not settings.JWT_TRUST_TOKEN_CLAIMS or claims_at is None or user_id is None
+                or _changed_since(claims_at, user_id)):
+            return super().get_user(validated_token)
+
+        values = {'id': user_id, 'is_active': True}
+        values.update({field: validated_token.get(field) for field in CLAIM_FIELDS})
+        user = _from_values(User, values)
+        user.branch = self.get_branch(user.branch_id) if user.branch_id else None
+        return user
+
+    def get_branch(self, branch_id):
+        key = f'auth:branch:{branch_id}'
+        values = cache.get(key)
+        record_cache('auth_branch', values is not None)
+        if values is None:
+            branch = Branch.objects.filter(pk=branch_id).first()
+            if not branch:
+                return None
+            values = _field_values(branch)
+            cache.set(key, values, settings.JWT_USER_CACHE_SECONDS)
+        return _from_values(Branch, values)
@@ -0,0 +1,318 @@
+"""Micro-benchmarks for the checkout and reporting code (see `run_benchmarks`).
+
+Each benchmark gets a `Benchmark` object and the dataset, in the style of
+pytest-benchmark's fixture:
+
+    @register('pricing')
+    def price_line_16_percent(benchmark, data):
+        benchmark(price_line, Decimal('116.00'), 3, Decimal('0.00'), Decimal('16.00'))
+
+The target is called until it has run for `min_time` seconds, and at least
+`min_rounds` times. A `setup` callable runs untimed before each round, for
+targets that consume their input, such as finalizing a pending sale.
+Benchmarks registered with ``sized=True`` run once per entry in SIZES.
+Every benchmark runs in a transaction that is rolled back, so each one
+sees the same data. Receipt blocks never commit there, so benchmarks that
+create sales reserve one up front with `_hold_receipt_block`, as a till
+would have, instead of timing a reservation on every round.
+
+Results are JSON. `compare` flags benchmarks whose median grew by more
+than a threshold against a baseline run.
+"""
+import gc
+import platform
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from inventory.models import Product
+from inventory.serializers import ProductSerializer
+from sales.models import Discount, Sale, SaleItem
+from sales.numbering import hold_block, reset_blocks
+from sales.pricing import included_tax, price_line
+from sales.serializers import SaleSerializer
+from .dataset import generate
+from .dates import local_today
+from .models import Branch, User
+
+# Generated dataset per size; the seed keeps each size's rows apart
+SIZES = {
+    'small': {'seed': 9001, 'products': 200, 'customers': 200, 'sales': 500},
+    'large': {'seed': 9002, 'products': 1000, 'customers': 1000, 'sales': 5000},
+}
+DATASET_DAYS = 30
+
+BENCHMARKS = []  # (group, name, function, sized)
+
+
+def register(group, name=None, sized=False):
+    def decorator(func):
+        BENCHMARKS.append((group, name or func.__name__, func, sized))
+        return func
+    return decorator
+
+
+class Benchmark:
+    """Times one target; `stats` holds the result once called."""
+
+    def __init__(self, min_time=0.5, min_rounds=5, max_rounds=10000, warmup_rounds=1):
+        self.min_time = min_time
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.warmup_rounds = warmup_rounds
+        self.stats = None
+
+    def __call__(self, target, *args, setup=None, **kwargs):
+        for _ in range(self.warmup_rounds):
+            if setup:
+                setup()
+            target(*args, **kwargs)
+
+        timings = []
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            while len(timings) < self.max_rounds and (len(timings) < self.min_rounds
+                                                      or sum(timings) < self.min_time):
+                if setup:
+                    setup()
+                started = time.perf_counter()
+                result = target(*args, **kwargs)
+                timings.append(time.perf_counter() - started)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.stats = summarize(timings)
+        return result
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    quartiles = statistics.quantiles(ordered, n=4) if len(ordered) > 1 else [ordered[0]] * 3
+    mean = statistics.fmean(ordered)
+    return {
+        'rounds': len(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': mean,
+        'stddev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        'median': statistics.median(ordered),
+        'iqr': quartiles[2] - quartiles[0],
+        'ops': 1 / mean if mean else 0.0,
+    }
+
+
+def build_dataset(size):
+    """Generate (or reuse) the dataset for `size` and return what benchmarks need from it."""
+    spec = SIZES[size]
+    seed = spec['seed']
+    if not Branch.objects.filter(tax_id__startswith=f'GEN{seed}-').exists():
+        generate(1, spec['products'], spec['customers'], spec['sales'], days=DATASET_DAYS, seed=seed,
+                 cashiers_per_branch=2)
+    branch = Branch.objects.get(tax_id=f'GEN{seed}-0000')
+    return {
+        'size': size,
+        'branch': branch,
+        'manager': User.objects.get(branch=branch, role='manager'),
+        'cashier': User.objects.filter(branch=branch, role='cashier').order_by('username').first(),
+        'products': list(branch.products.order_by('id')[:50]),
+        'date_from': (local_today() - timedelta(days=DATASET_DAYS - 1)).isoformat(),
+        'date_to': local_today().isoformat(),
+    }
+
+
+def run(select=None, min_time=0.5, progress=None):
+    """Run the registered benchmarks whose ``group.name`` contains `select`; returns the results document."""
+    datasets = {}
+    results = []
+    for group, name, func, sized in BENCHMARKS:
+        for size in (SIZES if sized else ['small']):
+            full_name = f'{group}.{name}[{size}]' if sized else f'{group}.{name}'
+            if select and select not in full_name:
+                continue
+            if size not in datasets:
+                datasets[size] = build_dataset(size)
+            benchmark = Benchmark(min_time=min_time)
+            with transaction.atomic():
+                func(benchmark, datasets[size])
+                transaction.set_rollback(True)
+            # Blocks held in memory were reserved by the rolled-back transaction
+            reset_blocks()
+            results.append({'name': full_name, 'group': group, 'size': size if sized else None,
+                            'stats': benchmark.stats})
+            if progress:
+                progress(results[-1])
+    return {
+        'datetime': timezone.now().isoformat(),
+        'machine_info': {'python': platform.python_version(), 'machine': platform.machine(),
+                         'system': platform.system(), 'database': connection.vendor},
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, current, threshold=20.0):
+    """`[(name, baseline median, current median, change %, regressed)]` for benchmarks in both runs."""
+    before = {entry['name']: entry['stats']['median'] for entry in baseline['benchmarks']}
+    rows = []
+    for entry in current['benchmarks']:
+        if entry['name'] in before and before[entry['name']]:
+            change = (entry['stats']['median'] - before[entry['name']]) / before[entry['name']] * 100
+            rows.append((entry['name'], before[entry['name']], entry['stats']['median'], change, change > threshold))
+    return rows
+
+
+def _client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def _ok(request, *args, **kwargs):
+    """Make a test client request, failing instead of timing an error response."""
+    response = request(*args, **kwargs)
+    if response.status_code >= 400:
+        raise AssertionError(f'HTTP {response.status_code}: {getattr(response, "data", "")}')
+    return response
+
+
+def _hold_receipt_block(benchmark, data):
+    """Reserve enough sale numbers for every round, so no round reserves a block."""
+    hold_block('sale', data['branch'].id, size=benchmark.warmup_rounds + benchmark.max_rounds)
+
+
+def _create_sale(data, lines=5, status='pending'):
+    """A sale with `lines` items straight through the ORM, as checkout leaves it before payment."""
+    sale = Sale.objects.create(branch=data['branch'], cashier=data['cashier'], subtotal=Decimal('0.00'),
+                               tax_amount=Decimal('0.00'), total_amount=Decimal('0.00'), status=status)
+    subtotal = tax = Decimal('0.00')
+    for product in data['products'][:lines]:
+        line_subtotal, line_tax = price_line(product.price, 1, Decimal('0.00'), product.tax_rate)
+        SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price,
+                                subtotal=line_subtotal, tax_rate=product.tax_rate, tax_amount=line_tax)
+        subtotal += line_subtotal
+        tax += line_tax
+    sale.subtotal, sale.tax_amount, sale.total_amount = subtotal, tax, subtotal
+    sale.save()
+    return sale
+
+
+# Checkout
+
+@register('pricing')
+def price_line_basket(benchmark, data):
+    lines = [(Decimal('116.00'), 3, Decimal('0.00'), Decimal('16.00')),
+             (Decimal('249.50'), 1, Decimal('10.00'), Decimal('16.00')),
+             (Decimal('85.00'), 2, Decimal('0.00'), Decimal('0.00'))] * 10
+
+    def price_basket():
+        return [price_line(*line) for line in lines]
+    benchmark(price_basket)
+
+
+@register('pricing')
+def tax_extraction(benchmark, data):
+    amounts = [Decimal(cents) / 100 for cents in range(1000, 101000, 1000)]
+    benchmark(lambda: [included_tax(amount, Decimal('16.00')).quantize(Decimal('0.01')) for amount in amounts])
+
+
+@register('checkout')
+def sale_create(benchmark, data):
+    client = _client(data['cashier'])
+    body = {'items': [{'product_id': product.id, 'quantity': 1} for product in data['products'][:5]]}
+    _hold_receipt_block(benchmark, data)
+    benchmark(_ok, client.post, reverse('sale-list'), body, format='json')
+
+
+@register('checkout')
+def sale_create_with_discount_code(benchmark, data):
+    now = timezone.now()
+    Discount.objects.create(code='BENCH10', name='Benchmark', discount_type='percentage', value=Decimal('10.00'),
+                            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+    client = _client(data['cashier'])
+    body = {'items': [{'product_id': product.id, 'quantity': 1} for product in data['products'][:5]],
+            'discount_code': 'BENCH10'}
+    _hold_receipt_block(benchmark, data)
+    benchmark(_ok, client.post, reverse('sale-list'), body, format='json')
+
+
+@register('checkout')
+def validate_discount_code(benchmark, data):
+    now = timezone.now()
+    Discount.objects.create(code='BENCH10', name='Benchmark', discount_type='percentage', value=Decimal('10.00'),
+                            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+    client = _client(data['cashier'])
+    benchmark(_ok, client.post, reverse('discount-validate-code'), {'code': 'BENCH10'}, format='json')
+
+
+@register('checkout')
+def sale_finalize(benchmark, data):
+    Product.objects.filter(id__in=[product.id for product in data['products']]).update(stock_quantity=1000000)
+    pending = []
+    benchmark(lambda: pending.pop().finalize(user=data['cashier']),
+              setup=lambda: pending.append(_create_sale(data)))
+
+
+@register('receipts')
+def etims_qr(benchmark, data):
+    sale = _create_sale(data, status='completed')
+
+    def reset():
+        sale.etims_response = None
+    benchmark(sale.simulate_etims, setup=reset)
+
+
+@register('receipts')
+def receipt_pdf(benchmark, data):
+    sale = _create_sale(data, lines=20, status='completed')
+    sale.simulate_etims()
+    client = _client(data['cashier'])
+    # Never send benchmark receipts to a real printer
+    with mock.patch('sales.views.shutil.which', return_value=None):
+        benchmark(_ok, client.post, reverse('sale-print-receipt', args=[sale.id]))
+
+
+# Serializers
+
+@register('serializers')
+def sale_serializer_100(benchmark, data):
+    sales = list(Sale.objects.filter(branch=data['branch']).select_related('cashier', 'branch', 'customer')
+                 .prefetch_related('items__product').order_by('-created_at')[:100])
+    benchmark(lambda: SaleSerializer(sales, many=True).data)
+
+
+@register('serializers')
+def product_serializer_100(benchmark, data):
+    products = list(Product.objects.filter(branch=data['branch'])
+                    .select_related('category', 'branch', 'supplier').order_by('id')[:100])
+    benchmark(lambda: ProductSerializer(products, many=True).data)
+
+
+# Reports, at every dataset size
+
+def _report(url_name, **params):
+    def report(benchmark, data):
+        client = _client(data['manager'])
+        query = {key: data[value[1:]] if str(value).startswith('@') else value for key, value in params.items()}
+        benchmark(_ok, client.get, reverse(url_name), query)
+    report.__name__ = url_name
+    return report
+
+
+REPORTS = {
+    'daily_sales_report': {},
+    'cashier_performance': {'date_from': '@date_from', 'date_to': '@date_to'},
+    'stock_alerts': {},
+    'tax_report': {'date_from': '@date_from', 'date_to': '@date_to'},
+    'sales_summary': {'period': 'month'},
+    'cash_flow_report': {'date_from': '@date_from', 'date_to': '@date_to'},
+    'dashboard': {'refresh': '1'},
+    'revenue_chart_data': {},
+    'sales_channels_data': {'date_from': '@date_from', 'date_to': '@date_to'},
+}
+for _url_name, _params in REPORTS.items():
+    register('reports', _url_name, sized=True)(_report(_url_name, **_params))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Caches that other processes cannot see
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.security)
+def check_trusted_claims_cache(app_configs, **kwargs):
+    """Trusted token claims rely on change markers that every process must see."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.JWT_TRUST_TOKEN_CLAIMS and backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            'JWT_TRUST_TOKEN_CLAIMS needs a shared cache backend.',
+            hint=(f'With {backend.rsplit(".", 1)[-1]} a role change or deactivation only reaches the process '
+                  'that made it, and other workers trust the old claims until the access token expires. '
+                  'Point CACHES at Redis, Memcached or the database cache.'),
+            id='core.E001',
+        )]
+    return []
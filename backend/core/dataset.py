@@ -0,0 +1,414 @@
+"""Synthetic, reproducible data for load testing (see `generate_dataset`).
+
+Everything is derived from one seed, so the same arguments always produce
+the same rows. Rows are written with `bulk_create` in chunks. Branches are
+independent after the shared customers exist, so each branch can be
+generated in its own process.
+
+The distributions aim for a plausible supermarket:
+- trading hours 07:00 to 22:00, busiest at lunch and after work
+- more trade on Fridays, Saturdays and after month-end paydays
+- mostly small baskets (median about three lines) with a long tail
+- a few best-selling products
+- M-Pesa ahead of cash, with card a distant third
+"""
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import Branch, Category, User
+from .dates import local_today
+from .partitioning import ensure_partitions
+from customers.models import Customer
+from inventory.models import Product, StockMovement
+from payments.models import Payment
+from sales.models import Sale, SaleItem
+from sales.numbering import allocate_block, format_receipt_number
+from shifts.models import Shift, ShiftTransaction
+
+# Relative traffic per opening hour, 07:00 to 21:00
+HOUR_WEIGHTS = {7: 2, 8: 4, 9: 5, 10: 6, 11: 7, 12: 9, 13: 10, 14: 8,
+                15: 7, 16: 8, 17: 10, 18: 11, 19: 9, 20: 6, 21: 3}
+# Monday first
+WEEKDAY_WEIGHTS = [0.9, 0.9, 0.95, 1.0, 1.15, 1.35, 1.1]
+PAYDAY_FROM = 25
+PAYDAY_WEIGHT = 1.2
+
+PAYMENT_METHODS = ['mpesa', 'cash', 'card', 'airtel_money']
+PAYMENT_WEIGHTS = [55, 33, 9, 3]
+
+CATEGORIES = ['Beverages', 'Dairy', 'Bakery', 'Produce', 'Meat & Fish', 'Household',
+              'Personal Care', 'Snacks', 'Cereals & Grains', 'Frozen', 'Baby', 'Electronics']
+SHIFT_CHANGE = dt_time(14, 30)
+OPENING_CASH = Decimal('5000.00')
+RESTOCK_QUANTITY = 1000
+
+_shared = {}  # set before branch processes fork, read inside them
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+@contextmanager
+def historical_timestamps(*models):
+    """Let bulk_create keep the given created_at/opening_time values instead of stamping now()."""
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def basket_size(rng):
+    """Lines per sale: lognormal, median about three, capped at 40. The load test uses it too."""
+    return max(1, min(40, int(rng.lognormvariate(1.1, 0.7))))
+
+
+def line_quantity(rng):
+    roll = rng.random()
+    if roll < 0.7:
+        return 1
+    if roll < 0.9:
+        return 2
+    return rng.randint(3, 6)
+
+
+def product_price(rng):
+    """Shelf price in KES, lognormal around 150 and rounded like a real price tag."""
+    price = min(max(math.exp(rng.gauss(5.0, 1.0)), 20), 20000)
+    return _money(round(price / 5) * 5 or 5)
+
+
+def popularity_weights(count, exponent=0.9):
+    """Cumulative Zipf weights: the first products sell far more often than the last."""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def daily_sale_counts(rng, days, total):
+    """Spread `total` sales over `days` by weekday and payday weights."""
+    weights = []
+    for day in days:
+        weight = WEEKDAY_WEIGHTS[day.weekday()]
+        if day.day >= PAYDAY_FROM:
+            weight *= PAYDAY_WEIGHT
+        weights.append(weight)
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Hand out what rounding left over
+    for index in rng.sample(range(len(days)), total - sum(counts)):
+        counts[index] += 1
+    return counts
+
+
+def sale_times(rng, day, count):
+    hours = list(HOUR_WEIGHTS)
+    picked = rng.choices(hours, weights=list(HOUR_WEIGHTS.values()), k=count)
+    tz = timezone.get_current_timezone()
+    return sorted(
+        timezone.make_aware(datetime.combine(day, dt_time(hour, rng.randrange(60), rng.randrange(60))), tz)
+        for hour in picked
+    )
+
+
+def create_customers(count, seed, chunk_size):
+    """Bulk-create `count` customers with phone numbers unique to `seed`; returns their ids."""
+    rng = random.Random(f'{seed}-customers')
+    ids = []
+    for start in range(0, count, chunk_size):
+        batch = [
+            Customer(name=f'Customer {seed}-{n}', phone=f'2547{seed}{n:08d}',
+                     email='' if rng.random() < 0.6 else f'customer{seed}.{n}@example.com')
+            for n in range(start, min(start + chunk_size, count))
+        ]
+        ids += [customer.id for customer in Customer.objects.bulk_create(batch)]
+    return ids
+
+
+def create_branches(count, seed):
+    Branch.objects.bulk_create([
+        Branch(name=f'Generated Branch {seed}-{index}', location=f'Nairobi {index}',
+               phone=f'0700{index:06d}', tax_id=f'GEN{seed}-{index:04d}')
+        for index in range(count)
+    ])
+    return list(Branch.objects.filter(tax_id__startswith=f'GEN{seed}-').order_by('tax_id'))
+
+
+def create_categories():
+    existing = set(Category.objects.filter(name__in=CATEGORIES).values_list('name', flat=True))
+    Category.objects.bulk_create([Category(name=name) for name in CATEGORIES if name not in existing])
+    return list(Category.objects.filter(name__in=CATEGORIES).order_by('name'))
+
+
+def generate_branch(options):
+    """Generate products, cashiers, shifts and sales for one branch.
+
+    `options` holds `branch_id`, `index`, `seed`, `products`, `sales`,
+    `cashiers`, `password`, `start`, `days` and `chunk_size`. Returns row
+    counts.
+    """
+    rng = random.Random(f"{options['seed']}-branch-{options['index']}")
+    branch = Branch.objects.get(pk=options['branch_id'])
+    chunk_size = options['chunk_size']
+    counts = {'products': 0, 'cashiers': 0, 'managers': 0, 'shifts': 0, 'sales': 0, 'items': 0, 'payments': 0,
+              'shift_transactions': 0, 'movements': 0}
+
+    categories = _shared.get('categories') or create_categories()
+    customer_ids = _shared.get('customer_ids', [])
+    started = options['start']
+    days = [started + timedelta(days=offset) for offset in range(options['days'])]
+    opened_at = timezone.make_aware(datetime.combine(started, dt_time(6, 0)))
+
+    with historical_timestamps(Product, StockMovement, User, Shift, Sale, SaleItem, Payment, ShiftTransaction):
+        # Products, each with an opening stock delivery
+        products = []
+        for start in range(0, options['products'], chunk_size):
+            batch = []
+            for n in range(start, min(start + chunk_size, options['products'])):
+                price = product_price(rng)
+                category = rng.choice(categories)
+                batch.append(Product(
+                    name=f'{category.name} item {branch.id}-{n}',
+                    barcode=f"G{options['seed']}{branch.id:04d}{n:07d}",
+                    category=category,
+                    price=price, cost_price=_money(price * Decimal(rng.uniform(0.6, 0.85))),
+                    stock_quantity=0, reorder_level=rng.randint(5, 50), branch=branch,
+                    tax_rate=Decimal('16.00') if rng.random() < 0.8 else Decimal('0.00'),
+                    created_at=opened_at, updated_at=opened_at,
+                ))
+            with transaction.atomic():
+                products += Product.objects.bulk_create(batch)
+        counts['products'] = len(products)
+        stock = {product.id: rng.randint(200, 2000) for product in products}
+        movements = [
+            StockMovement(product_id=product.id, movement_type='purchase', quantity=stock[product.id],
+                          previous_quantity=0, new_quantity=stock[product.id], reason='Opening stock',
+                          branch=branch, created_at=opened_at, updated_at=opened_at)
+            for product in products
+        ]
+        for batch in _chunks(movements, chunk_size):
+            StockMovement.objects.bulk_create(batch)
+        counts['movements'] += len(movements)
+        # Shuffled so the best sellers are spread over categories and price points
+        rng.shuffle(products)
+        cumulative = popularity_weights(len(products))
+
+        # Cashiers: half open the day, half close it. One hash serves every user.
+        password = make_password(options['password'])
+        cashiers = User.objects.bulk_create([
+            User(username=f"gen{options['seed']}-{branch.id}-cashier{n}", password=password, role='cashier',
+                 branch=branch, first_name='Cashier', last_name=str(n), date_joined=opened_at,
+                 created_at=opened_at, updated_at=opened_at)
+            for n in range(options['cashiers'])
+        ])
+        counts['cashiers'] = len(cashiers)
+        User.objects.create(username=f"gen{options['seed']}-{branch.id}-manager", password=password, role='manager',
+                            branch=branch, first_name='Manager', last_name=str(branch.id), date_joined=opened_at,
+                            created_at=opened_at, updated_at=opened_at)
+        counts['managers'] = 1
+        half = max(1, len(cashiers) // 2)
+        teams = (cashiers[:half], cashiers[half:] or cashiers[:half])
+
+        shifts = []
+        tz = timezone.get_current_timezone()
+        for day in days:
+            change = timezone.make_aware(datetime.combine(day, SHIFT_CHANGE), tz)
+            bounds = ((timezone.make_aware(datetime.combine(day, dt_time(6, 45)), tz), change),
+                      (change, timezone.make_aware(datetime.combine(day, dt_time(22, 15)), tz)))
+            for team, (opening, closing) in zip(teams, bounds):
+                for cashier in team:
+                    shifts.append(Shift(cashier=cashier, branch=branch, opening_time=opening, closing_time=closing,
+                                        opening_cash=OPENING_CASH, status='closed', created_at=opening,
+                                        updated_at=closing, closed_by=cashier))
+        for batch in _chunks(shifts, chunk_size):
+            Shift.objects.bulk_create(batch)
+        counts['shifts'] = len(shifts)
+        shift_index = {(shift.opening_time.date(), shift.opening_time.time() < SHIFT_CHANGE, shift.cashier_id): shift
+                       for shift in shifts}
+
+        # Sales, in time order so stock levels run forward
+        receipt_number = allocate_block('sale', branch.id, size=max(options['sales'], 1))[0]
+        pending = []
+
+        def write(pending):
+            with transaction.atomic():
+                sales = Sale.objects.bulk_create([sale for sale, _, _, _, _ in pending])
+                items, payments, sale_movements = [], [], []
+                for sale, sale_items, sale_payments, movements, _ in pending:
+                    for row in sale_items + sale_payments:
+                        row.sale_id = sale.id
+                    items += sale_items
+                    payments += sale_payments
+                    sale_movements += movements
+                SaleItem.objects.bulk_create(items)
+                Payment.objects.bulk_create(payments)
+                StockMovement.objects.bulk_create(sale_movements)
+                # Ledger entries point at the payment they record, so they go in after it
+                ledger = []
+                for sale, _, sale_payments, _, entries in pending:
+                    for entry in entries:
+                        entry.sale_id = sale.id
+                        entry.payment_id = sale_payments[0].id
+                    ledger += entries
+                ShiftTransaction.objects.bulk_create(ledger)
+            counts['sales'] += len(sales)
+            counts['items'] += len(items)
+            counts['payments'] += len(payments)
+            counts['shift_transactions'] += len(ledger)
+            counts['movements'] += len(sale_movements)
+
+        for day, day_count in zip(days, daily_sale_counts(rng, days, options['sales'])):
+            for created_at in sale_times(rng, day, day_count):
+                morning = created_at.astimezone(tz).time() < SHIFT_CHANGE
+                cashier = rng.choice(teams[0] if morning else teams[1])
+                shift = shift_index[(day, morning, cashier.id)]
+                sale_number = format_receipt_number('sale', branch.id, receipt_number)
+                receipt_number += 1
+
+                items, movements = [], []
+                subtotal = tax_amount = Decimal('0.00')
+                picked = rng.choices(products, cum_weights=cumulative, k=basket_size(rng))
+                for product in dict.fromkeys(picked):
+                    quantity = line_quantity(rng)
+                    line_total = product.price * quantity
+                    line_tax = _money(line_total * product.tax_rate / (Decimal('100.00') + product.tax_rate))
+                    previous = stock[product.id]
+                    if previous < quantity:
+                        # Deliveries arrive just in time; the restock is part of the history too
+                        movements.append(StockMovement(
+                            product_id=product.id, movement_type='purchase', quantity=RESTOCK_QUANTITY,
+                            previous_quantity=previous, new_quantity=previous + RESTOCK_QUANTITY,
+                            reason='Restock', branch_id=branch.id, created_at=created_at, updated_at=created_at))
+                        previous += RESTOCK_QUANTITY
+                    stock[product.id] = previous - quantity
+                    items.append(SaleItem(product_id=product.id, quantity=quantity, unit_price=product.price,
+                                          subtotal=line_total, tax_rate=product.tax_rate, tax_amount=line_tax))
+                    movements.append(StockMovement(
+                        product_id=product.id, movement_type='sale', quantity=-quantity,
+                        previous_quantity=previous, new_quantity=previous - quantity,
+                        reason=f'Sale {sale_number}', reference_id=sale_number, branch_id=branch.id,
+                        created_by_id=cashier.id, created_at=created_at, updated_at=created_at))
+                    subtotal += line_total
+                    tax_amount += line_tax
+
+                method = rng.choices(PAYMENT_METHODS, weights=PAYMENT_WEIGHTS)[0]
+                # Cash is tendered in round notes; everything else is exact
+                paid = _money(math.ceil(subtotal / 100) * 100) if method == 'cash' else subtotal
+                change = paid - subtotal
+                sale = Sale(sale_number=sale_number, branch_id=branch.id, cashier_id=cashier.id, shift_id=shift.id,
+                            customer_id=rng.choice(customer_ids) if customer_ids and rng.random() < 0.3 else None,
+                            subtotal=subtotal, tax_amount=tax_amount, total_amount=subtotal, amount_paid=paid,
+                            change_given=change, status='completed', created_by_id=cashier.id,
+                            created_at=created_at, updated_at=created_at)
+                payment = Payment(branch_id=branch.id, payment_method=method, amount=paid, status='completed',
+                                  reference_number='' if method == 'cash' else f'GEN{rng.randrange(16 ** 10):010X}',
+                                  processed_by_id=cashier.id, processed_at=created_at)
+
+                # The shift ledger and running balances, as checkout records them
+                entries = [ShiftTransaction(shift_id=shift.id, transaction_type='sale', amount=paid,
+                                            payment_method=method, created_by_id=cashier.id, created_at=created_at)]
+                if change:
+                    entries.append(ShiftTransaction(shift_id=shift.id, transaction_type='change', amount=-change,
+                                                    payment_method='cash', created_by_id=cashier.id,
+                                                    created_at=created_at))
+                shift.total_sales += subtotal
+                shift.total_transactions += 1
+                setattr(shift, f'{method}_total', getattr(shift, f'{method}_total') + paid)
+                shift.change_total += change
+
+                pending.append((sale, items, [payment], movements, entries))
+                if len(pending) >= chunk_size:
+                    write(pending)
+                    pending = []
+        if pending:
+            write(pending)
+
+        # Shift totals and closing counts follow from the sales above
+        for shift in shifts:
+            shift.expected_cash = shift.closing_cash = OPENING_CASH + shift.cash_total - shift.change_total
+            shift.cash_difference = Decimal('0.00')
+        for batch in _chunks(shifts, chunk_size):
+            Shift.objects.bulk_update(batch, ['total_sales', 'total_transactions', 'cash_total', 'mpesa_total',
+                                              'card_total', 'airtel_money_total', 'change_total', 'expected_cash',
+                                              'closing_cash', 'cash_difference'])
+        for batch in _chunks(products, chunk_size):
+            for product in batch:
+                product.stock_quantity = stock[product.id]
+            Product.objects.bulk_update(batch, ['stock_quantity'])
+
+    return counts
+
+
+def _run_in_worker(options):
+    # A forked worker must open its own database connection
+    connections.close_all()
+    try:
+        return generate_branch(options)
+    finally:
+        connections.close_all()
+
+
+def generate(branches, products, customers, sales, days=365, seed=1, workers=1, chunk_size=5000,
+             cashiers_per_branch=4, password=None, end=None, progress=None):
+    """Generate a whole dataset; `products` and `sales` are totals split evenly over the branches.
+
+    With `workers` above one each branch is generated in its own forked
+    process. Cashiers log in with `password`, or cannot log in when it is
+    None. Returns the row counts summed over branches.
+    """
+    if Branch.objects.filter(tax_id__startswith=f'GEN{seed}-').exists():
+        raise ValueError(f'A dataset with seed {seed} already exists')
+
+    end = end or local_today()
+    start = end - timedelta(days=days - 1)
+    _shared['categories'] = create_categories()
+    _shared['customer_ids'] = create_customers(customers, seed, chunk_size)
+    ensure_partitions('inventory_stockmovement', settings.PARTITION_MONTHS_AHEAD, first_month=start)
+
+    jobs = [
+        {'branch_id': branch.id, 'index': index, 'seed': seed, 'start': start, 'days': days,
+         'products': products // branches + (index < products % branches),
+         'sales': sales // branches + (index < sales % branches),
+         'cashiers': cashiers_per_branch, 'password': password, 'chunk_size': chunk_size}
+        for index, branch in enumerate(create_branches(branches, seed))
+    ]
+    totals = {'branches': len(jobs), 'customers': len(_shared['customer_ids'])}
+
+    def add(counts):
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+        if progress:
+            progress(counts)
+
+    if workers > 1:
+        connections.close_all()
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            for counts in pool.map(_run_in_worker, jobs):
+                add(counts)
+    else:
+        for job in jobs:
+            add(generate_branch(job))
+    _shared.clear()
+    return totals
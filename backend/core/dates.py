@@ -0,0 +1,102 @@
+"""Local-date windows for filtering timestamp columns.
+
+Filtering with ``created_at__date=...`` wraps the column in a timezone
+conversion, which stops PostgreSQL from using the ``(branch, -created_at)``
+style indexes. These helpers turn local (Africa/Nairobi) calendar dates into
+half-open ``[start, end)`` aware datetime ranges so the column is compared
+directly.
+"""
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def local_today():
+    return timezone.localdate()
+
+
+def parse_date(value, default=None):
+    """Parse a YYYY-MM-DD string, returning `default` for empty values.
+
+    Raises ValueError for malformed dates.
+    """
+    if not value:
+        return default
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def start_of_day(day):
+    """Aware datetime for local midnight at the start of `day`."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    day = month_start(day)
+    if day.month == 12:
+        return day.replace(year=day.year + 1, month=1)
+    return day.replace(month=day.month + 1)
+
+
+def previous_month(day):
+    return month_start(month_start(day) - timedelta(days=1))
+
+
+def day_range(date_from, date_to=None):
+    """Half-open datetime range covering the local dates `date_from`..`date_to` inclusive."""
+    date_to = date_to or date_from
+    return start_of_day(date_from), start_of_day(date_to + timedelta(days=1))
+
+
+def month_range(day):
+    """Half-open datetime range covering the local calendar month containing `day`."""
+    return start_of_day(month_start(day)), start_of_day(next_month(day))
+
+
+def date_filter(field, date_from=None, date_to=None):
+    """Filter kwargs restricting `field` to local dates `date_from`..`date_to` inclusive.
+
+    Either bound may be omitted for an open-ended window.
+    """
+    filters = {}
+    if date_from:
+        filters[f'{field}__gte'] = start_of_day(date_from)
+    if date_to:
+        filters[f'{field}__lt'] = start_of_day(date_to + timedelta(days=1))
+    return filters
+
+
+def range_filter(field, window):
+    """Filter kwargs for a `(start, end)` datetime range from `day_range`/`month_range`."""
+    start, end = window
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+def parse_window(spec, today=None):
+    """Resolve a window spec into a `(start, end)` datetime range.
+
+    Accepts ``today``, ``week`` (Monday to date), ``month`` (month to date),
+    a single ``YYYY-MM-DD`` day or an inclusive ``YYYY-MM-DD..YYYY-MM-DD``
+    range. Raises ValueError for anything else.
+    """
+    today = today or local_today()
+    if spec == 'today':
+        return day_range(today)
+    if spec == 'week':
+        return day_range(today - timedelta(days=today.weekday()), today)
+    if spec == 'month':
+        return day_range(month_start(today), today)
+
+    date_from, separator, date_to = spec.partition('..')
+    try:
+        date_from = parse_date(date_from)
+        date_to = parse_date(date_to) if separator else date_from
+    except ValueError:
+        date_from = None
+    if not date_from or not date_to or date_to < date_from:
+        raise ValueError(f'Invalid window: {spec}')
+    return day_range(date_from, date_to)
@@ -0,0 +1,268 @@
+"""End-to-end load test of the till and reporting API (see `loadtest`).
+
+Every simulated till is one thread logged in as one cashier. It opens a
+shift, then rings up sales the way the frontend does until the run ends:
+- look up each barcode
+- create the sale
+- pay it, sometimes split between M-Pesa and cash
+- complete it and print the receipt
+At the end it closes the shift. Manager threads meanwhile poll the
+dashboard and reports. Each request is timed under an endpoint name such
+as ``POST /api/sales/{id}/complete/``. `summarize` turns the timings into
+throughput and p50/p95/p99 latency per endpoint.
+
+The users and barcodes come from a `generate_dataset` run in the database
+the server uses. The server can be ``runserver`` or gunicorn.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from decimal import Decimal
+import requests
+from .dataset import basket_size
+
+MANAGER_REQUESTS = [
+    # (weight, endpoint name, path, query params)
+    (4, 'GET /api/reports/dashboard/', '/api/reports/dashboard/', {}),
+    (2, 'GET /api/reports/daily-sales/', '/api/reports/daily-sales/', {}),
+    (2, 'GET /api/reports/sales-summary/', '/api/reports/sales-summary/', {'period': 'week'}),
+    (1, 'GET /api/reports/cashier-performance/', '/api/reports/cashier-performance/', {}),
+    (1, 'GET /api/reports/stock-alerts/', '/api/reports/stock-alerts/', {}),
+    (1, 'GET /api/reports/tax-report/', '/api/reports/tax-report/', {}),
+    (1, 'GET /api/sales/', '/api/sales/', {}),
+]
+
+_SERVER_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+_HTML_TITLE = re.compile(r'<title>(.*?)</title>', re.DOTALL)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Recorder:
+    """Latencies, errors and server query counts per endpoint, shared by all threads."""
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> [(seconds, ok, queries), ...]
+        self.flows = {'sales': 0, 'failed_sales': 0}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok, queries=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((seconds, ok, queries))
+
+    def count(self, flow):
+        with self.lock:
+            self.flows[flow] += 1
+
+
+def summarize(recorder, duration):
+    """Totals and per-endpoint throughput and latency percentiles, in milliseconds."""
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+        queries = [count for _, _, count in samples if count is not None]
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok, _ in samples if not ok),
+            'rps': round(len(samples) / duration, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 1),
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'max_ms': round(latencies[-1], 1),
+            'db_queries': round(sum(queries) / len(queries), 1) if queries else None,
+        }
+    total = sum(e['requests'] for e in endpoints.values())
+    return {
+        'duration_s': round(duration, 1),
+        'requests': total,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'rps': round(total / duration, 2) if duration else 0,
+        'sales': recorder.flows['sales'],
+        'failed_sales': recorder.flows['failed_sales'],
+        'sales_per_s': round(recorder.flows['sales'] / duration, 2) if duration else 0,
+        'endpoints': endpoints,
+    }
+
+
+def compare(previous, current):
+    """`[(endpoint, previous p95, current p95, change %)]` for endpoints in both results."""
+    rows = []
+    for endpoint, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(endpoint)
+        if before and before['p95_ms']:
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            rows.append((endpoint, before['p95_ms'], stats['p95_ms'], round(change, 1)))
+    return rows
+
+
+class FlowError(Exception):
+    pass
+
+
+class Client:
+    """A logged-in API session that times every request into a `Recorder`."""
+
+    def __init__(self, base_url, username, password, recorder, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def login(self):
+        response = self.request('POST', '/api/auth/token/', 'POST /api/auth/token/',
+                                json={'username': self.username, 'password': self.password}, auth=False)
+        self.session.headers['Authorization'] = f"Bearer {response.json()['access']}"
+
+    def request(self, method, path, endpoint, expect=(200, 201), auth=True, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, False)
+            raise FlowError(f'{endpoint}: {e}')
+        elapsed = time.perf_counter() - started
+        match = _SERVER_QUERIES.search(response.headers.get('Server-Timing', ''))
+        ok = response.status_code in expect
+        self.recorder.add(endpoint, elapsed, ok, int(match.group(1)) if match else None)
+        if response.status_code == 401 and auth:
+            # Access token expired during a long run
+            self.login()
+        if not ok:
+            title = _HTML_TITLE.search(response.text)
+            detail = ' '.join((title.group(1) if title else response.text).split())
+            raise FlowError(f'{endpoint}: HTTP {response.status_code} {detail[:200]}')
+        return response
+
+
+def run_till(client, barcodes, rng, deadline, stop, think_time=0.0, max_sales=None, on_error=None):
+    """Ring up sales as one cashier until `deadline`, `stop` or `max_sales`."""
+    client.login()
+    try:
+        shift = client.request('POST', '/api/shifts/open_shift/', 'POST /api/shifts/open_shift/',
+                               json={'opening_cash': '5000.00', 'notes': 'Load test'}).json()
+    except FlowError:
+        # Left open by an earlier, interrupted run
+        shift = client.request('GET', '/api/shifts/current/', 'GET /api/shifts/current/').json()
+
+    sales = 0
+    while time.monotonic() < deadline and not stop.is_set() and (max_sales is None or sales < max_sales):
+        try:
+            ring_up_sale(client, rng.sample(barcodes, min(basket_size(rng), len(barcodes))), rng, think_time)
+            client.recorder.count('sales')
+        except FlowError as e:
+            client.recorder.count('failed_sales')
+            if on_error:
+                on_error(str(e))
+        sales += 1
+
+    client.request('POST', f"/api/shifts/{shift['id']}/close_shift/", 'POST /api/shifts/{id}/close_shift/',
+                   json={'closing_cash': '5000.00', 'notes': 'Load test'})
+
+
+def ring_up_sale(client, barcodes, rng, think_time=0.0):
+    items = []
+    for barcode in barcodes:
+        product = client.request('GET', '/api/products/lookup/', 'GET /api/products/lookup/',
+                                 params={'barcode': barcode}).json()
+        items.append({'product_id': product['id'], 'quantity': 1 if rng.random() < 0.7 else rng.randint(2, 4)})
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+
+    sale = client.request('POST', '/api/sales/', 'POST /api/sales/', json={'items': items}).json()
+    total = Decimal(sale['total_amount'])
+    if total > 500 and rng.random() < 0.3:
+        # Split tender: part on M-Pesa, the rest in cash
+        mpesa = (total / 2).quantize(Decimal('1'))
+        tenders = [('mpesa', mpesa), ('cash', total - mpesa)]
+    else:
+        method = rng.choices(['mpesa', 'cash', 'card'], weights=[55, 35, 10])[0]
+        tenders = [(method, total)]
+    for method, amount in tenders:
+        client.request('POST', '/api/payments/', 'POST /api/payments/',
+                       json={'sale_id': sale['id'], 'payment_method': method, 'amount': str(amount),
+                             'reference_number': '' if method == 'cash' else f'LT{rng.randrange(10 ** 8):08d}'})
+    client.request('POST', f"/api/sales/{sale['id']}/complete/", 'POST /api/sales/{id}/complete/')
+    client.request('POST', f"/api/sales/{sale['id']}/print_receipt/", 'POST /api/sales/{id}/print_receipt/')
+
+
+def run_manager(client, rng, deadline, stop, think_time=1.0, on_error=None):
+    """Poll the dashboard and reports as one manager until `deadline` or `stop`."""
+    client.login()
+    weights = [weight for weight, _, _, _ in MANAGER_REQUESTS]
+    while time.monotonic() < deadline and not stop.is_set():
+        _, endpoint, path, params = rng.choices(MANAGER_REQUESTS, weights=weights)[0]
+        try:
+            client.request('GET', path, endpoint, params=params)
+        except FlowError as e:
+            if on_error:
+                on_error(str(e))
+        if think_time:
+            stop.wait(rng.uniform(0, 2 * think_time))
+
+
+def run(base_url, cashiers, managers, barcodes, password, duration, ramp_up=0.0, think_time=0.0,
+        manager_think_time=1.0, max_sales=None, seed=1, on_error=None):
+    """Run tills for `cashiers` and report pollers for `managers` concurrently; returns `summarize` output.
+
+    `barcodes` maps each cashier's username to the barcodes their branch sells.
+    """
+    recorder = Recorder()
+    stop = threading.Event()
+    started = time.monotonic()
+    deadline = started + ramp_up + duration
+    threads = []
+
+    def start(target, username, index, *args, **kwargs):
+        def body():
+            # Spread logins over the ramp-up so they do not all arrive at once
+            if stop.wait(ramp_up * index / max(1, len(cashiers) + len(managers))):
+                return
+            try:
+                target(Client(base_url, username, password, recorder), *args, **kwargs)
+            except FlowError as e:
+                if on_error:
+                    on_error(f'{username}: {e}')
+        thread = threading.Thread(target=body, name=f'loadtest-{username}', daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    for index, username in enumerate(cashiers):
+        start(run_till, username, index, barcodes[username], random.Random(f'{seed}-{username}'), deadline, stop,
+              think_time=think_time, max_sales=max_sales, on_error=on_error)
+    for index, username in enumerate(managers, start=len(cashiers)):
+        start(run_manager, username, index, random.Random(f'{seed}-{username}'), deadline, stop,
+              think_time=manager_think_time, on_error=on_error)
+
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+                if max_sales is not None and all(not t.is_alive() for t in threads[:len(cashiers)]):
+                    # Every till is done; the managers stop with them
+                    stop.set()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return summarize(recorder, time.monotonic() - started)
+
+
+def save_results(path, results):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.dataset import generate
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset (branches, products, customers, sales) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=5, help='Number of branches')
+        parser.add_argument('--products', type=int, default=100000, help='Products in total, split over branches')
+        parser.add_argument('--customers', type=int, default=1000000, help='Customers shared by all branches')
+        parser.add_argument('--sales', type=int, default=10000000, help='Sales in total, split over branches')
+        parser.add_argument('--days', type=int, default=365, help='Days of history, ending today')
+        parser.add_argument('--seed', type=int, default=1, help='Same seed, same data; one dataset per seed')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Branches generated in parallel, each in its own process (not on SQLite)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--cashiers-per-branch', type=int, default=4, help='Cashiers per branch')
+        parser.add_argument('--password', help='Password for the generated cashiers (default: cannot log in)')
+
+    def handle(self, *args, **options):
+        for name in ('branches', 'days', 'workers', 'chunk_size', 'cashiers_per_branch'):
+            if options[name] <= 0:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        for name in ('products', 'customers', 'sales'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} cannot be negative')
+        if options['sales'] and options['products'] < options['branches']:
+            raise CommandError('Every branch needs at least one product to sell')
+
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite allows one writer at a time; using a single worker'))
+            workers = 1
+
+        started = time.monotonic()
+
+        def progress(counts):
+            self.stdout.write(f"Branch done: {counts['products']} products, {counts['sales']} sales, "
+                              f"{counts['items']} items ({time.monotonic() - started:.0f}s)")
+
+        try:
+            totals = generate(
+                options['branches'], options['products'], options['customers'], options['sales'],
+                days=options['days'], seed=options['seed'], workers=workers, chunk_size=options['chunk_size'],
+                cashiers_per_branch=options['cashiers_per_branch'], password=options['password'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        summary = ', '.join(f'{value} {name}' for name, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,107 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.loadtest import compare, load_results, run, save_results
+from core.models import Branch, User
+from inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent tills and managers against a running server and report '
+            'throughput and p50/p95/p99 latency per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server to test')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the generate_dataset run to use')
+        parser.add_argument('--password', required=True, help='Password given to generate_dataset')
+        parser.add_argument('--tills', type=int, default=10, help='Concurrent tills, one cashier each')
+        parser.add_argument('--managers', type=int, default=2, help='Concurrent managers polling reports')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run after the ramp-up')
+        parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which the users log in')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Up to this many seconds between scans at a till')
+        parser.add_argument('--manager-think-time', type=float, default=1.0,
+                            help='Average seconds between a manager\'s requests')
+        parser.add_argument('--sales-per-till', type=int, help='Stop each till after this many sales')
+        parser.add_argument('--output', help='Results file (default: logs/loadtest/<timestamp>.json)')
+        parser.add_argument('--compare', help='Earlier results file to compare p95 latencies against')
+
+    def handle(self, *args, **options):
+        if options['tills'] < 0 or options['managers'] < 0 or options['tills'] + options['managers'] == 0:
+            raise CommandError('Run at least one till or manager')
+        if options['duration'] <= 0:
+            raise CommandError('--duration must be positive')
+
+        branches = list(Branch.objects.filter(tax_id__startswith=f"GEN{options['seed']}-").order_by('tax_id'))
+        if not branches:
+            raise CommandError(f"No generated dataset with seed {options['seed']}; run generate_dataset first")
+        cashiers = self.users('cashier', options['seed'], options['tills'], branches)
+        managers = self.users('manager', options['seed'], options['managers'], branches)
+        barcodes = {}
+        for username, branch_id in cashiers:
+            if branch_id not in barcodes:
+                barcodes[branch_id] = list(Product.objects.filter(branch_id=branch_id, is_active=True)
+                                           .values_list('barcode', flat=True)[:5000])
+        previous = load_results(options['compare']) if options['compare'] else None
+
+        self.stdout.write(f"{len(cashiers)} tills and {len(managers)} managers against {options['base_url']} "
+                          f"for {options['duration']:.0f}s after a {options['ramp_up']:.0f}s ramp-up")
+        errors = []
+        started_at = timezone.now()
+        results = run(
+            options['base_url'], [username for username, _ in cashiers], [username for username, _ in managers],
+            {username: barcodes[branch_id] for username, branch_id in cashiers}, options['password'],
+            options['duration'], ramp_up=options['ramp_up'], think_time=options['think_time'],
+            manager_think_time=options['manager_think_time'], max_sales=options['sales_per_till'],
+            seed=options['seed'], on_error=errors.append,
+        )
+        results.update({
+            'started_at': started_at.isoformat(),
+            'base_url': options['base_url'],
+            'tills': len(cashiers),
+            'managers': len(managers),
+            'sample_errors': errors[:20],
+        })
+
+        self.report(results, previous)
+        path = options['output'] or os.path.join(settings.BASE_DIR, 'logs', 'loadtest',
+                                                 f"{started_at.strftime('%Y%m%dT%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        save_results(path, results)
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {path}'))
+
+    def users(self, role, seed, count, branches):
+        """`count` generated users with `role`, spread round-robin over the branches, as `(username, branch_id)`."""
+        per_branch = [
+            list(User.objects.filter(username__startswith=f'gen{seed}-{branch.id}-', role=role, is_active=True)
+                 .order_by('username').values_list('username', 'branch_id'))
+            for branch in branches
+        ]
+        users = []
+        for rank in range(max(map(len, per_branch))):
+            users += [branch_users[rank] for branch_users in per_branch if rank < len(branch_users)]
+        if len(users) < count:
+            raise CommandError(f'Only {len(users)} generated {role}s with seed {seed}; '
+                               f'use fewer or generate more (--cashiers-per-branch)')
+        return users[:count]
+
+    def report(self, results, previous):
+        self.stdout.write(f"\n{results['requests']} requests ({results['errors']} errors) in {results['duration_s']}s: "
+                          f"{results['rps']} req/s, {results['sales']} sales ({results['sales_per_s']}/s, "
+                          f"{results['failed_sales']} failed)\n")
+        self.stdout.write(f"{'Endpoint':<42} {'Reqs':>6} {'Err':>4} {'Req/s':>7} {'p50':>7} {'p95':>7} "
+                          f"{'p99':>7} {'Max':>7} {'Qry':>5}")
+        for endpoint, stats in results['endpoints'].items():
+            queries = '' if stats['db_queries'] is None else stats['db_queries']
+            self.stdout.write(f"{endpoint:<42} {stats['requests']:>6} {stats['errors']:>4} {stats['rps']:>7} "
+                              f"{stats['p50_ms']:>7} {stats['p95_ms']:>7} {stats['p99_ms']:>7} {stats['max_ms']:>7} "
+                              f"{queries:>5}")
+        for error in results['sample_errors'][:5]:
+            self.stdout.write(self.style.WARNING(error))
+
+        if previous:
+            self.stdout.write(f"\np95 against {previous.get('started_at', 'previous run')}:")
+            for endpoint, before, after, change in compare(previous, results):
+                style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+                self.stdout.write(style(f'{endpoint:<42} {before:>8} -> {after:>8} ms ({change:+.1f}%)'))
@@ -0,0 +1,62 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.partitioning import (PARTITIONED_TABLES, partitioning_supported, is_partitioned, list_partitions,
+                               ensure_partitions, archivable_months, archive_partition, restore_partition)
+
+
+class Command(BaseCommand):
+    help = 'Create, list, archive and restore monthly table partitions (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['ensure', 'list', 'archive', 'restore'])
+        parser.add_argument('--table', choices=list(PARTITIONED_TABLES), help='Partitioned table (default all)')
+        parser.add_argument('--months-ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+                            help='ensure: months of future partitions to keep ready')
+        parser.add_argument('--retention-months', type=int, default=settings.PARTITION_RETENTION_MONTHS,
+                            help='archive: months kept attached before a partition is archived')
+        parser.add_argument('--output-dir', default=settings.PARTITION_ARCHIVE_DIR, help='archive: directory for the dumps')
+        parser.add_argument('--file', help='restore: archive file written by the archive action')
+        parser.add_argument('--dry-run', action='store_true', help='archive: only list what would be archived')
+        parser.add_argument('--loop', action='store_true', help='ensure: keep creating partitions until interrupted')
+        parser.add_argument('--interval', type=int, default=86400, help='Seconds between runs in loop mode')
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            self.stdout.write('Partitioning is only available on PostgreSQL; nothing to do.')
+            return
+
+        tables = [options['table']] if options['table'] else list(PARTITIONED_TABLES)
+        for table in tables:
+            if not is_partitioned(table):
+                raise CommandError(f'{table} is not partitioned; run migrate first')
+
+        action = options['action']
+        if action == 'restore':
+            if not options['file'] or len(tables) != 1:
+                raise CommandError('restore needs --file and --table')
+            self.stdout.write(f"Restored {restore_partition(tables[0], options['file'])}")
+            return
+
+        while True:
+            for table in tables:
+                getattr(self, f'handle_{action}')(table, options)
+            if action != 'ensure' or not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def handle_ensure(self, table, options):
+        created = ensure_partitions(table, options['months_ahead'])
+        self.stdout.write(f"{table}: created {len(created)} partition(s) {' '.join(created)}".rstrip())
+
+    def handle_list(self, table, options):
+        for month, name in sorted(list_partitions(table).items()):
+            self.stdout.write(f"{table}\t{month:%Y-%m}\t{name}")
+
+    def handle_archive(self, table, options):
+        for month in archivable_months(table, options['retention_months']):
+            if options['dry_run']:
+                self.stdout.write(f"{table}: would archive {month:%Y-%m}")
+                continue
+            path = archive_partition(table, month, options['output_dir'])
+            self.stdout.write(f"{table}: archived {month:%Y-%m} to {path}")
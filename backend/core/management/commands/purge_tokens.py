@@ -0,0 +1,35 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from core.tokens import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Tokens deleted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired tokens')
+        parser.add_argument('--loop', action='store_true', help='Keep purging until interrupted')
+        parser.add_argument('--interval', type=int, default=settings.TOKEN_PURGE_INTERVAL,
+                            help='Seconds between purges in loop mode')
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+
+        if options['dry_run']:
+            expired = OutstandingToken.objects.filter(expires_at__lte=aware_utcnow()).count()
+            self.stdout.write(f"Would delete {expired} expired tokens")
+            return
+
+        while True:
+            started = time.monotonic()
+            deleted = purge_expired_tokens(batch_size=options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} expired tokens in {time.monotonic() - started:.2f}s")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
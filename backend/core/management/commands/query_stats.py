@@ -0,0 +1,51 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.querylog import load_stats, top_offenders
+
+ORDERS = {
+    'time': 'total_ms',
+    'count': 'count',
+    'max': 'max_ms',
+    'n-plus-one': 'n_plus_one',
+}
+
+
+class Command(BaseCommand):
+    help = 'Show the most expensive query fingerprints per endpoint, as recorded by the query log middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Number of fingerprints to show')
+        parser.add_argument('--order-by', choices=list(ORDERS), default='time',
+                            help='Rank by total time, run count, slowest run or requests flagged as N+1')
+        parser.add_argument('--endpoint', help='Only show queries of this view name (e.g. sale-list)')
+        parser.add_argument('--n-plus-one', action='store_true', help='Only show fingerprints flagged as N+1')
+        parser.add_argument('--reset', action='store_true', help='Delete the recorded statistics instead')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            return self.reset()
+
+        stats = load_stats()
+        if options['n_plus_one']:
+            stats = {key: entry for key, entry in stats.items() if entry['n_plus_one']}
+        rows = top_offenders(stats, limit=options['top'], order_by=ORDERS[options['order_by']],
+                             endpoint=options['endpoint'])
+        if not rows:
+            self.stdout.write('No query statistics recorded yet.')
+            return
+
+        self.stdout.write(f"{'endpoint':<32} {'runs':>8} {'total ms':>10} {'max ms':>8} {'N+1':>5}  query")
+        for endpoint, sql, entry in rows:
+            self.stdout.write(f"{endpoint[:32]:<32} {entry['count']:>8} {entry['total_ms']:>10.1f} "
+                              f"{entry['max_ms']:>8.1f} {entry['n_plus_one']:>5}  {sql[:200]}")
+
+    def reset(self):
+        directory = settings.QUERY_STATS_DIR
+        removed = 0
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                if filename.startswith('querystats-') and filename.endswith('.json'):
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+        self.stdout.write(f"Removed {removed} statistics file(s)")
@@ -0,0 +1,75 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Run the checkout, receipt, serializer and report micro-benchmarks on a test database, '
+            'save the results and optionally fail on regressions against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', '--select', help='Only run benchmarks whose name contains this text')
+        parser.add_argument('--min-time', type=float, default=0.5, help='Seconds to time each benchmark for')
+        parser.add_argument('--save', help='Results file (default: logs/benchmarks/<timestamp>.json)')
+        parser.add_argument('--compare', help='Baseline results file to check for regressions')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Fail when a median is this many percent slower than the baseline')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database and its generated datasets between runs')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for group, name, _, sized in benchmarks.BENCHMARKS:
+                self.stdout.write(f'{group}.{name}' + (f" [{', '.join(benchmarks.SIZES)}]" if sized else ''))
+            return
+        if options['min_time'] <= 0:
+            raise CommandError('--min-time must be positive')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(f"{'Benchmark':<48} {'Rounds':>7} {'Min ms':>9} {'Median ms':>10} "
+                              f"{'Mean ms':>9} {'IQR ms':>8} {'Ops/s':>9}")
+            results = benchmarks.run(select=options['select'], min_time=options['min_time'], progress=self.row)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        if not results['benchmarks']:
+            raise CommandError('No benchmark matches --select')
+
+        path = options['save'] or os.path.join(settings.BASE_DIR, 'logs', 'benchmarks',
+                                               f"{timezone.now().strftime('%Y%m%dT%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {path}'))
+
+        if baseline:
+            self.check_regressions(baseline, results, options['threshold'])
+
+    def row(self, result):
+        stats = result['stats']
+        self.stdout.write(f"{result['name']:<48} {stats['rounds']:>7} {stats['min'] * 1000:>9.3f} "
+                          f"{stats['median'] * 1000:>10.3f} {stats['mean'] * 1000:>9.3f} "
+                          f"{stats['iqr'] * 1000:>8.3f} {stats['ops']:>9.1f}")
+
+    def check_regressions(self, baseline, results, threshold):
+        self.stdout.write(f"\nMedian against {baseline.get('datetime', 'baseline')} (threshold {threshold:.0f}%):")
+        regressions = []
+        for name, before, after, change, regressed in benchmarks.compare(baseline, results, threshold):
+            style = self.style.ERROR if regressed else self.style.SUCCESS if change < -threshold else str
+            self.stdout.write(style(f'{name:<48} {before * 1000:>9.3f} -> {after * 1000:>9.3f} ms ({change:+.1f}%)'))
+            if regressed:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0f}%: "
+                               f"{', '.join(regressions)}")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.loadtest import percentile
+from core.tracing import load_traces
+
+
+class Command(BaseCommand):
+    help = 'Summarise exported checkout spans: count and p50/p95/max duration per span name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Trace file to read (default TRACING_FILE)')
+        parser.add_argument('--prefix', help='Only spans whose name starts with this, e.g. checkout.')
+
+    def handle(self, *args, **options):
+        try:
+            spans = load_traces(options['file'])
+        except FileNotFoundError as e:
+            raise CommandError(f'No trace file: {e.filename}')
+
+        durations = {}
+        for span in spans:
+            if not options['prefix'] or span['name'].startswith(options['prefix']):
+                durations.setdefault(span['name'], []).append(span['duration_ms'])
+        if not durations:
+            self.stdout.write('No spans recorded.')
+            return
+
+        self.stdout.write(f"{'span':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'total ms':>11}")
+        for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            self.stdout.write(f"{name:<28} {len(values):>7} {percentile(values, 0.5):>9.2f} "
+                              f"{percentile(values, 0.95):>9.2f} {values[-1]:>9.2f} {sum(values):>11.1f}")
@@ -0,0 +1,250 @@
+"""Per-view request metrics in Prometheus text format.
+
+`MetricsMiddleware` times every request and counts the database queries it
+runs (through a connection execute wrapper, so DEBUG is not needed), the
+bytes it returns and the cache lookups recorded with `record_cache`. The
+totals are kept per process and served at ``/api/metrics/``. Each response
+also gets a ``Server-Timing`` header with that request's numbers.
+
+Under gunicorn every worker has its own totals. With METRICS_MULTIPROCESS_DIR
+set, each worker writes a snapshot to ``metrics-<pid>.json`` there at most
+every METRICS_FLUSH_SECONDS, and the endpoint adds up every snapshot, so
+whichever worker answers the scrape reports the whole server. Empty the
+directory when the server starts so old workers' files are not counted.
+
+Gauges are registered by the apps that own them with `register_gauge`.
+A gauge either has a function that reads its value when scraped, or is
+set with `set_gauge` by a process such as a management command. That
+process then writes its snapshot under a fixed name with
+``flush(force=True, name=...)``, so that each run replaces the previous
+one's values rather than adding to them.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('core.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'pos_http_request_duration_seconds': ('Request latency by view', LATENCY_BUCKETS),
+    'pos_http_response_size_bytes': ('Response body size by view', SIZE_BUCKETS),
+    'pos_db_queries_per_request': ('Database queries run by one request, by view', QUERY_BUCKETS),
+}
+COUNTERS = {
+    'pos_db_query_seconds_total': 'Time spent in database queries by view',
+    'pos_cache_lookups_total': 'Cache lookups by cache and result',
+}
+
+GAUGES = {}  # name -> (help text, function returning the value at scrape time or None)
+
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_gauges = {}      # (name, labels) -> value
+_lock = threading.Lock()
+_flushed_at = [0.0]
+_local = threading.local()
+
+
+def _labels(**labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_gauge(name, help_text, collect=None):
+    GAUGES[name] = (help_text, collect)
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, _labels(**labels))] = value
+
+
+def observe(name, value, **labels):
+    buckets = HISTOGRAMS[name][1]
+    key = (name, _labels(**labels))
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(buckets) + 2)
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def record_cache(name, hit):
+    """Count a lookup in cache `name`, globally and for the current request's Server-Timing."""
+    inc('pos_cache_lookups_total', cache=name, result='hit' if hit else 'miss')
+    timing = getattr(_local, 'timing', None)
+    if timing is not None:
+        timing['cache_hits' if hit else 'cache_misses'] += 1
+
+
+def reset_metrics():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(series)] for (name, labels), series in _histograms.items()],
+            'gauges': [[name, list(labels), value] for (name, labels), value in _gauges.items()],
+        }
+
+
+def _snapshot_path(name):
+    return os.path.join(settings.METRICS_MULTIPROCESS_DIR, f'metrics-{name}.json')
+
+
+def flush(force=False, name=None):
+    """Write this process's snapshot when multiprocess mode is on and the last one is old enough.
+
+    The file is named after the process id, or after `name` when given.
+    """
+    if not settings.METRICS_MULTIPROCESS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _flushed_at[0] < settings.METRICS_FLUSH_SECONDS:
+        return
+    _flushed_at[0] = now
+    os.makedirs(settings.METRICS_MULTIPROCESS_DIR, exist_ok=True)
+    path = _snapshot_path(name or os.getpid())
+    with open(f'{path}.tmp', 'w') as snapshot:
+        json.dump(_snapshot(), snapshot)
+    os.replace(f'{path}.tmp', path)
+
+
+def _collect():
+    """Snapshots of every process to report: this one live, the others from their files."""
+    snapshots = [_snapshot()]
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if directory and os.path.isdir(directory):
+        own = os.path.basename(_snapshot_path(os.getpid()))
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith('metrics-') and filename.endswith('.json') and filename != own:
+                try:
+                    with open(os.path.join(directory, filename)) as snapshot:
+                        snapshots.append(json.load(snapshot))
+                except (OSError, ValueError):
+                    continue
+    return snapshots
+
+
+def _format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """All metrics, summed over processes, in the Prometheus text exposition format."""
+    counters = {}
+    histograms = {}
+    gauges = {}
+    for snapshot in _collect():
+        # A gauge has one writer, so its latest value stands rather than a sum
+        for name, labels, value in snapshot.get('gauges', []):
+            gauges[(name, tuple(tuple(pair) for pair in labels))] = value
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, series in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(series))
+            for index, value in enumerate(series):
+                total[index] += value
+
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            for bound, count in zip(buckets, series):
+                lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {series[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {series[-1]}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (series_name, labels), value in sorted(counters.items()):
+            if series_name == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    for name, (help_text, collect) in GAUGES.items():
+        if collect:
+            try:
+                gauges[(name, ())] = collect()
+            except Exception:
+                logger.exception('Could not read gauge %s', name)
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for (series_name, labels), value in sorted(gauges.items()):
+            if series_name == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        timing = _local.timing = {'queries': 0, 'db_seconds': 0.0, 'cache_hits': 0, 'cache_misses': 0}
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timing['queries'] += 1
+                timing['db_seconds'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                response = self.get_response(request)
+        finally:
+            _local.timing = None
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unmatched'
+        labels = {'view': view, 'method': request.method, 'status': response.status_code}
+        observe('pos_http_request_duration_seconds', elapsed, **labels)
+        observe('pos_db_queries_per_request', timing['queries'], view=view)
+        inc('pos_db_query_seconds_total', timing['db_seconds'], view=view)
+        if not response.streaming:
+            observe('pos_http_response_size_bytes', len(response.content), view=view)
+
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={timing["db_seconds"] * 1000:.1f};desc="{timing["queries"]} queries"',
+            f'cache;desc="{timing["cache_hits"]} hits, {timing["cache_misses"]} misses"',
+        ])
+        if elapsed >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            logger.warning('Slow request %s %s (%s): %.0f ms, %s queries in %.0f ms', request.method,
+                           request.path, view, elapsed * 1000, timing['queries'], timing['db_seconds'] * 1000)
+        flush()
+        return response
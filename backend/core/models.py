@@ -29,6 +29,11 @@ class Branch(AuditMixin):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .authentication import mark_branch_changed
+        mark_branch_changed(self.pk)
+
 
 class User(AbstractUser, AuditMixin):
     ROLE_CHOICES = [
@@ -47,6 +52,11 @@ class User(AbstractUser, AuditMixin):
     
     def __str__(self):
         return f"{self.get_full_name() or self.username} ({self.get_role_display()})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .authentication import mark_user_changed
+        mark_user_changed(self.pk)
     
     @property
     def is_cashier(self):
@@ -0,0 +1,289 @@
+"""Monthly range partitioning for append-only tables on PostgreSQL.
+
+A partitioned table keeps one child table per local calendar month
+(``<table>_pYYYY_MM``) plus a ``<table>_default`` catch-all. Queries that
+filter on the partition column only scan the months they touch, and old
+months can be detached, archived to a gzipped CSV and dropped without
+rewriting the hot data. Everything here is a no-op on other databases.
+"""
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from django.db import connection, transaction
+from django.utils import timezone
+from .dates import local_today, month_start, next_month, previous_month, start_of_day
+
+logger = logging.getLogger('core.partitioning')
+
+# Partitioned tables and the timestamp column they are ranged on
+PARTITIONED_TABLES = {
+    'inventory_stockmovement': 'created_at',
+}
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def partitioning_supported():
+    return connection.vendor == 'postgresql'
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year:04d}_{month.month:02d}'
+
+
+def partition_month(name):
+    """The month a partition name stands for, or None for the default partition."""
+    match = PARTITION_SUFFIX.search(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def months_between(first, last):
+    """Month starts from `first` to `last` inclusive."""
+    months = []
+    month = month_start(first)
+    while month <= month_start(last):
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table):
+    """Attached monthly partitions of `table` as `{month: name}`."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {partition_month(name): name for name in names if partition_month(name)}
+
+
+def _bounds(month):
+    return start_of_day(month).isoformat(), start_of_day(next_month(month)).isoformat()
+
+
+def default_partition(table):
+    """Name of the catch-all partition of `table`, or None if it has none."""
+    name = f'{table}_default'
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [f'"{name}"'])
+        return name if cursor.fetchone()[0] else None
+
+
+def create_partition(table, month):
+    """Create the partition for `month`, moving in any rows the default partition holds for it.
+
+    PostgreSQL refuses a new partition while the default one has rows in
+    its range, so the default is detached, the rows moved and the default
+    re-attached, all in one transaction.
+    """
+    name = partition_name(table, month)
+    start, end = _bounds(month)
+    column = PARTITIONED_TABLES[table]
+    default = default_partition(table)
+    in_range = f"{column} >= '{start}' AND {column} < '{end}'"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        stray = False
+        if default:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE {in_range})')
+            stray = cursor.fetchone()[0]
+        if stray:
+            # ALTER TABLE refuses to run while deferred foreign key checks are pending
+            connection.check_constraints()
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        if stray:
+            cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE {in_range}')
+            logger.info('Moved %s rows from %s to %s', cursor.rowcount, default, name)
+            cursor.execute(f'DELETE FROM "{default}" WHERE {in_range}')
+            cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+    return name
+
+
+def ensure_partitions(table, months_ahead=3, first_month=None):
+    """Create any missing monthly partitions up to `months_ahead` months from now.
+
+    Starts from `first_month` when given, otherwise from the current month.
+    Returns the names of the partitions created.
+    """
+    if not partitioning_supported() or not is_partitioned(table):
+        return []
+
+    today = local_today()
+    last = month_start(today)
+    for _ in range(months_ahead):
+        last = next_month(last)
+
+    existing = list_partitions(table)
+    created = []
+    for month in months_between(first_month or today, last):
+        if month not in existing:
+            created.append(create_partition(table, month))
+            logger.info('Created partition %s', created[-1])
+    return created
+
+
+def detach_partition(table, month):
+    name = partition_name(table, month)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    return name
+
+
+def attach_partition(table, month):
+    name = partition_name(table, month)
+    start, end = _bounds(month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+    return name
+
+
+def archive_path(directory, table, month):
+    return os.path.join(directory, f'{partition_name(table, month)}.csv.gz')
+
+
+def archive_partition(table, month, directory):
+    """Detach the partition for `month`, dump it to a gzipped CSV and drop it.
+
+    The file is written and flushed before the table is dropped, all inside
+    one transaction, so a failed dump leaves the partition attached.
+    Returns the path of the archive file.
+    """
+    name = partition_name(table, month)
+    path = archive_path(directory, table, month)
+    os.makedirs(directory, exist_ok=True)
+
+    with transaction.atomic():
+        # ALTER TABLE refuses to run while deferred foreign key checks are pending
+        connection.check_constraints()
+        detach_partition(table, month)
+        with gzip.open(path, 'wb') as archive, connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE "{name}"')
+    logger.info('Archived partition %s to %s', name, path)
+    return path
+
+
+def restore_partition(table, path):
+    """Recreate and re-attach a partition from an archive written by `archive_partition`."""
+    month = partition_month(os.path.basename(path).split('.')[0])
+    if not month:
+        raise ValueError(f'Not a partition archive: {path}')
+
+    name = partition_name(table, month)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        with gzip.open(path, 'rb') as archive, connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY "{name}" FROM STDIN WITH (FORMAT csv, HEADER)', archive)
+        connection.check_constraints()
+        attach_partition(table, month)
+    logger.info('Restored partition %s from %s', name, path)
+    return name
+
+
+def archivable_months(table, retention_months):
+    """Attached monthly partitions that are entirely older than `retention_months`."""
+    cutoff = month_start(local_today())
+    for _ in range(retention_months):
+        cutoff = previous_month(cutoff)
+    return sorted(month for month in list_partitions(table) if month < cutoff)
+
+
+def _table_ddl(cursor, table):
+    """Index and foreign key definitions of `table`, excluding its primary key."""
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ("
+        " SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [table, table]
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = [
+        f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}'
+        for name, definition in cursor.fetchall()
+    ]
+    return indexes, foreign_keys
+
+
+def convert_to_partitioned(table, column, months_ahead=3):
+    """Rebuild a plain table as a table partitioned by month on `column`, keeping its rows.
+
+    The primary key becomes `(id, column)` because PostgreSQL requires the
+    partition key in every unique constraint; `id` keeps counting from a sequence.
+    """
+    legacy = f'{table}_legacy'
+    with connection.cursor() as cursor:
+        indexes, foreign_keys = _table_ddl(cursor, table)
+        cursor.execute(f'SELECT min({column}), max(id) FROM "{table}"')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ({column})'
+        )
+        cursor.execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+        cursor.execute(f"""ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval('"{table}_id_seq"')""")
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+    first_month = month_start(timezone.localtime(oldest).date()) if oldest else None
+    ensure_partitions(table, months_ahead, first_month=first_month)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+        # Dropped before the new keys and indexes are added so their names are free again
+        cursor.execute(f'DROP TABLE "{legacy}"')
+        if max_id:
+            cursor.execute(f"""SELECT setval('"{table}_id_seq"', %s)""", [max_id])
+        cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, {column})')
+        for statement in indexes + foreign_keys:
+            cursor.execute(statement)
+
+
+def convert_to_plain(table):
+    """Undo `convert_to_partitioned`, folding every partition back into one table."""
+    partitioned = f'{table}_partitioned'
+    with connection.cursor() as cursor:
+        indexes, foreign_keys = _table_ddl(cursor, table)
+        cursor.execute(f'SELECT max(id) FROM "{table}"')
+        max_id = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{partitioned}"')
+        cursor.execute(f'CREATE TABLE "{table}" (LIKE "{partitioned}" INCLUDING CONSTRAINTS)')
+        cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"')
+        cursor.execute(f'DROP TABLE "{partitioned}" CASCADE')
+        cursor.execute(
+            f'ALTER TABLE "{table}" ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY '
+            f'(START WITH {(max_id or 0) + 1})'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id)')
+        for statement in indexes + foreign_keys:
+            cursor.execute(statement)
@@ -0,0 +1,156 @@
+"""Profile individual production requests without a redeploy.
+
+`ProfilingMiddleware` runs a request under cProfile, and optionally
+tracemalloc, when either:
+
+- it carries ``X-Profile: <PROFILING_TOKEN>`` (add ``X-Profile-Memory: 1``
+  to also trace allocations), or
+- its path starts with a prefix in PROFILING_SAMPLE_RATES and it wins the
+  draw, e.g. ``{'/api/reports/': 0.01}`` profiles one report call in 100.
+
+Only one request per process is profiled at a time; others run normally.
+Each profile is a pstats dump (``<id>.prof``) plus a JSON summary
+(``<id>.json``) in PROFILING_DIR. The store keeps the newest
+PROFILING_MAX_PROFILES. Admins list and download profiles at
+``/api/profiles/``; ``python -m pstats <id>.prof`` or snakeviz open the dumps.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+_busy = threading.Lock()
+
+
+def should_profile(request):
+    """'header', 'sampled' or None."""
+    token = request.headers.get('X-Profile')
+    if token and settings.PROFILING_TOKEN and constant_time_compare(token, settings.PROFILING_TOKEN):
+        return 'header'
+    for prefix, rate in settings.PROFILING_SAMPLE_RATES.items():
+        if request.path.startswith(prefix) and random.random() < rate:
+            return 'sampled'
+    return None
+
+
+def profile_path(profile_id, extension):
+    if not PROFILE_ID.match(profile_id or ''):
+        raise ValueError(f'Invalid profile id {profile_id!r}')
+    return os.path.join(settings.PROFILING_DIR, f'{profile_id}.{extension}')
+
+
+def list_profiles():
+    """Summaries of stored profiles, newest first."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(settings.PROFILING_DIR), reverse=True):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(settings.PROFILING_DIR, filename)) as summary:
+                    profiles.append(json.load(summary))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+
+def load_profile(profile_id):
+    """Summary of one profile, or None if it does not exist."""
+    try:
+        with open(profile_path(profile_id, 'json')) as summary:
+            return json.load(summary)
+    except (ValueError, OSError):
+        return None
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILING_MAX_PROFILES."""
+    ids = sorted({name.rsplit('.', 1)[0] for name in os.listdir(settings.PROFILING_DIR)
+                  if PROFILE_ID.match(name.rsplit('.', 1)[0])}, reverse=True)
+    for profile_id in ids[settings.PROFILING_MAX_PROFILES:]:
+        for extension in ('prof', 'json'):
+            try:
+                os.remove(profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def _top_functions(profiler, limit=25):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+def save_profile(request, response, reason, profiler, seconds, memory=None):
+    now = timezone.now()
+    profile_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    match = getattr(request, 'resolver_match', None)
+    summary = {
+        'id': profile_id,
+        'created_at': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'reason': reason,
+        'duration_ms': round(seconds * 1000, 1),
+        'top_functions': _top_functions(profiler),
+        'memory': memory,
+    }
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id, 'prof'))
+    with open(profile_path(profile_id, 'json'), 'w') as summary_file:
+        json.dump(summary, summary_file)
+    prune_profiles()
+    return profile_id
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = should_profile(request)
+        if not reason or not _busy.acquire(blocking=False):
+            return self.get_response(request)
+
+        trace_memory = reason == 'header' and request.headers.get('X-Profile-Memory') == '1'
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start(10)
+
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            seconds = time.perf_counter() - started
+
+            memory = None
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:15]
+                memory = {'current_bytes': current, 'peak_bytes': peak,
+                          'top_allocations': [str(stat) for stat in top]}
+
+            response['X-Profile-Id'] = save_profile(request, response, reason, profiler, seconds, memory)
+            return response
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            _busy.release()
@@ -0,0 +1,226 @@
+"""Query budgets for every GET endpoint under /api/ (see QueryBudgetTest).
+
+QueryBudgetTest walks the URLconf, so the app routers and the reports
+views are all covered without listing them by hand. It calls every GET
+route as an admin against generated datasets at two sizes. A route fails
+when it runs more queries than its budget below, or when its count grows
+with the size of the dataset. Growth is the sign of an N+1: a serializer
+reading a related object that the view's queryset does not
+select_related or prefetch_related.
+
+Requests are force-authenticated, so budgets count only the view's own
+queries. A new GET route needs a budget here, or an entry in UNMEASURED
+with the reason it cannot be called generically.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from approvals.models import ApprovalRequest
+from customers.models import Customer, LoyaltyTier, LoyaltyTransaction
+from inventory.models import Product
+from payments.models import Expense, MpesaTransaction
+from sales.models import Discount, Return, Sale
+from shifts.models import Shift, Terminal
+from suppliers.models import Supplier, SupplierProduct
+from .dataset import generate
+from .models import Branch, SyncLog, SystemConfig, User
+
+# Most queries each GET route may run, by URL name
+QUERY_BUDGETS = {
+    # Accounts, branches and settings
+    'user_profile': 0,
+    'profile-list': 0,
+    'user-list': 2,
+    'user-me': 0,
+    'user-roles': 0,
+    'user-stats': 6,
+    'user-detail': 1,
+    'branch-list': 2,
+    'branch-detail': 1,
+    'category-list': 3,
+    'category-detail': 2,
+    'system-config-list': 2,
+    'system-config-detail': 1,
+    'api-root': 0,
+
+    # Inventory
+    'product-list': 3,
+    'product-lookup': 3,
+    'product-low-stock': 2,
+    'product-detail': 3,
+    'stock-movement-list': 2,
+    'stock-movement-detail': 1,
+
+    # Sales
+    'sale-list': 4,
+    'sale-statistics': 1,
+    'sale-detail': 3,
+    'discount-list': 2,
+    'discount-detail': 1,
+    'return-list': 2,
+    'return-detail': 1,
+
+    # Customers
+    'customer-list': 2,
+    'customer-detail': 2,
+    'loyalty-tier-list': 2,
+    'loyalty-tier-detail': 1,
+    'loyalty-transaction-list': 2,
+    'loyalty-transaction-detail': 1,
+
+    # Suppliers
+    'supplier-list': 2,
+    'supplier-active': 1,
+    'supplier-detail': 1,
+    'supplierproduct-list': 2,
+    'supplierproduct-detail': 1,
+
+    # Payments
+    'payment-list': 2,
+    'payment-detail': 1,
+    'expense-list': 2,
+    'expense-detail': 1,
+
+    # Shifts
+    'shift-list': 2,
+    'shift-current': 5,
+    'shift-detail': 3,
+    'shift-report': 3,
+    'shift-transaction-list': 2,
+    'shift-transaction-detail': 1,
+    'terminal-list': 2,
+    'terminal-detail': 1,
+
+    # Approvals
+    'approval-request-list': 2,
+    'approval-request-my-requests': 1,
+    'approval-request-pending': 1,
+    'approval-request-detail': 1,
+
+    # Reports
+    'daily_sales_report': 7,
+    'cash_flow_report': 2,
+    'cashier_performance': 3,
+    'stock_alerts': 1,
+    'tax_report': 1,
+    'sales_summary': 3,
+    'dashboard': 7,
+    'dashboard_stats': 4,
+    'recent_activity': 1,
+    'revenue_chart_data': 1,
+    'sales_channels_data': 1,
+}
+
+# Query parameters by URL name; '@name' takes the value from the dataset
+QUERY_PARAMS = {
+    'product-lookup': {'barcode': '@barcode'},
+    'sales_summary': {'period': 'week'},
+    'dashboard': {'refresh': '1'},
+}
+
+# GET routes the test cannot call generically, with the reason
+UNMEASURED = {
+    'profile-detail': 'Takes the id of a saved profile file, not a database row',
+    'profile-download': 'Takes the id of a saved profile file, not a database row',
+    'sale-archived': 'Reads a sale back from the archive files, not the database',
+}
+
+
+def api_routes():
+    """`(url name, URL pattern)` for every GET route under /api/."""
+    def walk(patterns, prefix=''):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+            else:
+                yield prefix + str(pattern.pattern), pattern
+
+    routes = {}
+    for path, pattern in walk(get_resolver().url_patterns):
+        callback = pattern.callback
+        actions = getattr(callback, 'actions', None)
+        # Routers add a copy of every route with a format suffix
+        if not path.startswith('api/') or 'format' in pattern.pattern.regex.groupindex:
+            continue
+        if 'get' in (actions if actions is not None else dir(getattr(callback, 'cls', None))):
+            routes[pattern.name] = pattern
+    return routes
+
+
+def build_dataset(seed, rows, admin):
+    """Generate one branch with about `rows` of everything and make it the admin's branch.
+
+    Besides what `generate` creates, this adds the rows it leaves out:
+    suppliers, expenses, terminals, approvals, returns, discounts, loyalty
+    and shift ledger entries, and an open shift for the admin.
+    """
+    generate(1, rows, rows, rows, days=5, seed=seed, cashiers_per_branch=2)
+    branch = Branch.objects.get(tax_id=f'GEN{seed}-0000')
+    admin.branch = branch
+    admin.save(update_fields=['branch'])
+    manager = User.objects.get(branch=branch, role='manager')
+    sales = list(Sale.objects.filter(branch=branch).order_by('id')[:rows])
+    customers = list(Customer.objects.filter(phone__startswith=f'2547{seed}').order_by('id')[:rows])
+    now = timezone.now()
+
+    supplier = None
+    for n in range(rows):
+        supplier = Supplier.objects.create(name=f'Supplier {seed}-{n}', created_by=manager)
+        SupplierProduct.objects.create(supplier=supplier, product_name=f'Item {n}', wholesale_price=Decimal('10.00'))
+        Expense.objects.create(branch=branch, description=f'Expense {n}', amount=Decimal('100.00'),
+                               created_by=manager)
+        ApprovalRequest.objects.create(request_type='discount', requester=admin, manager=manager, branch=branch,
+                                       details={'n': n}, reason='Budget test')
+        Discount.objects.create(code=f'Q{seed}-{n}', name=f'Discount {n}', discount_type='percentage',
+                                value=Decimal('5.00'), start_date=now - timedelta(days=1),
+                                end_date=now + timedelta(days=1), created_by=manager)
+        SystemConfig.objects.create(key=f'budget.{seed}.{n}', value=str(n), updated_by=admin)
+        SyncLog.objects.create(entity_type='sale', entity_id=n, action='create', data={}, branch=branch, user=admin)
+    # Every product low on stock, so the low stock views list them all
+    Product.objects.filter(branch=branch).update(supplier=supplier, stock_quantity=F('reorder_level'))
+
+    shift = Shift.objects.create(cashier=admin, branch=branch, opening_cash=Decimal('0.00'))
+    for n, sale in enumerate(sales):
+        Terminal.objects.create(code=f'Q{seed}-{n}', branch=branch, current_shift=shift, created_by=manager)
+        shift.record_transaction('sale', sale.total_amount, sale=sale, user=admin)
+        payment = sale.payments.first()
+        if payment and not hasattr(payment, 'mpesa_transaction'):
+            MpesaTransaction.objects.create(payment=payment, phone_number='254700000000', amount=payment.amount)
+        Return.objects.create(original_sale=sale, return_number=f'RQ{seed}-{n}', items_returned=[],
+                              refund_amount=Decimal('1.00'), reason='Budget test', manager_approval=manager,
+                              approved_at=now, branch=branch, customer=customers[n % len(customers)])
+    LoyaltyTier.objects.get_or_create(name='bronze', defaults={'min_purchase_amount': Decimal('0.00')})
+    for customer in customers:
+        LoyaltyTransaction.objects.create(customer=customer, points=10, transaction_type='earn',
+                                          description='Budget test', previous_points=0, new_points=10,
+                                          sale=sales[0], created_by=admin)
+    return {'barcode': Product.objects.filter(branch=branch).order_by('-id').first().barcode}
+
+
+def measure(client, data):
+    """`{url name: (queries, status code)}` for every measured route; detail routes use the newest row."""
+    counts = {}
+    for name, pattern in api_routes().items():
+        if name in UNMEASURED:
+            continue
+        kwargs = {}
+        if 'pk' in pattern.pattern.regex.groupindex:
+            row = pattern.callback.cls.queryset.model.objects.order_by('-pk').first()
+            if row is None:
+                counts[name] = (None, None)
+                continue
+            kwargs['pk'] = row.pk
+        params = {key: data[value[1:]] if value.startswith('@') else value
+                  for key, value in QUERY_PARAMS.get(name, {}).items()}
+        # Cached report sections would hide their queries, and dashboard worker threads
+        # run theirs on other connections
+        cache.clear()
+        with override_settings(DASHBOARD_WORKERS=1), CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse(name, kwargs=kwargs), params)
+        counts[name] = (len(queries), response.status_code)
+    return counts
@@ -0,0 +1,169 @@
+"""Per-endpoint query statistics, slow-query log and N+1 detection.
+
+`QueryLogMiddleware` wraps the database connection while a request runs
+and groups its queries by fingerprint: the SQL with literals and
+placeholder lists collapsed, so ``WHERE id IN (%s, %s)`` and
+``WHERE id IN (%s)`` count as one statement. Per endpoint and fingerprint
+the process keeps the number of runs, total and worst time, and how many
+requests repeated the fingerprint at least N_PLUS_ONE_THRESHOLD times,
+which is what a query issued once per row of an outer loop looks like.
+
+Queries slower than SLOW_QUERY_MS and N+1 patterns go to the
+``core.querylog`` logger (a rotating file). Every QUERY_STATS_FLUSH_SECONDS
+a process also logs its top offenders and writes its totals to
+``querystats-<pid>.json`` in QUERY_STATS_DIR, where `query_stats` reads them.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('core.querylog')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_VALUES_ROWS = re.compile(r'(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+_stats = {}  # (endpoint, fingerprint) -> {'count', 'total_ms', 'max_ms', 'n_plus_one'}
+_lock = threading.Lock()
+_flushed_at = [time.monotonic()]
+
+
+def fingerprint(sql):
+    """`sql` with literals replaced by ``?`` and repeated placeholders collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = _VALUES_ROWS.sub(r'\1', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestQueries:
+    """Queries of one request, grouped by fingerprint."""
+
+    def __init__(self):
+        self.fingerprints = {}  # fingerprint -> [count, total_ms, max_ms]
+        self.slow = []          # (ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            entry = self.fingerprints.setdefault(fingerprint(sql), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+            if ms >= settings.SLOW_QUERY_MS:
+                self.slow.append((ms, sql))
+
+    def repeated(self):
+        """Fingerprints run at least N_PLUS_ONE_THRESHOLD times, most repeated first."""
+        threshold = settings.N_PLUS_ONE_THRESHOLD
+        return sorted(((count, sql) for sql, (count, _, _) in self.fingerprints.items() if count >= threshold),
+                      reverse=True)
+
+
+def record(endpoint, queries):
+    """Fold one request's queries into the process totals and log what stands out."""
+    repeated = {sql for _, sql in queries.repeated()}
+    with _lock:
+        for sql, (count, total_ms, max_ms) in queries.fingerprints.items():
+            entry = _stats.setdefault((endpoint, sql), {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'n_plus_one': 0})
+            entry['count'] += count
+            entry['total_ms'] += total_ms
+            entry['max_ms'] = max(entry['max_ms'], max_ms)
+            entry['n_plus_one'] += sql in repeated
+
+    for ms, sql in queries.slow:
+        logger.warning('Slow query on %s (%.0f ms): %s', endpoint, ms, sql)
+    for count, sql in queries.repeated():
+        logger.warning('Possible N+1 on %s: %s queries like: %s', endpoint, count, sql)
+
+
+def top_offenders(stats, limit=10, order_by='total_ms', endpoint=None):
+    """`[(endpoint, fingerprint, entry), ...]` with the highest `order_by` first."""
+    rows = [(key[0], key[1], entry) for key, entry in stats.items() if endpoint in (None, key[0])]
+    return sorted(rows, key=lambda row: row[2][order_by], reverse=True)[:limit]
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def _stats_path(pid):
+    return os.path.join(settings.QUERY_STATS_DIR, f'querystats-{pid}.json')
+
+
+def flush(force=False):
+    """Log this process's top offenders and write its totals for `query_stats`.
+
+    Runs at most every QUERY_STATS_FLUSH_SECONDS unless `force` is set.
+    """
+    now = time.monotonic()
+    if not force and now - _flushed_at[0] < settings.QUERY_STATS_FLUSH_SECONDS:
+        return
+    _flushed_at[0] = now
+    with _lock:
+        snapshot = [[endpoint, sql, dict(entry)] for (endpoint, sql), entry in _stats.items()]
+    if not snapshot:
+        return
+
+    for endpoint, sql, entry in top_offenders({(e, s): v for e, s, v in snapshot}, limit=5):
+        logger.info('Top query on %s: %s runs, %.0f ms total, %.0f ms max, %s N+1 requests: %s', endpoint,
+                    entry['count'], entry['total_ms'], entry['max_ms'], entry['n_plus_one'], sql)
+
+    os.makedirs(settings.QUERY_STATS_DIR, exist_ok=True)
+    path = _stats_path(os.getpid())
+    with open(f'{path}.tmp', 'w') as stats_file:
+        json.dump(snapshot, stats_file)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_stats():
+    """Totals of every process that has written them, summed per endpoint and fingerprint."""
+    stats = {}
+    directory = settings.QUERY_STATS_DIR
+    if not os.path.isdir(directory):
+        return stats
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('querystats-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as stats_file:
+                snapshot = json.load(stats_file)
+        except (OSError, ValueError):
+            continue
+        for endpoint, sql, entry in snapshot:
+            total = stats.setdefault((endpoint, sql), {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'n_plus_one': 0})
+            total['count'] += entry['count']
+            total['total_ms'] += entry['total_ms']
+            total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+            total['n_plus_one'] += entry['n_plus_one']
+    return stats
+
+
+class QueryLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_LOG_ENABLED:
+            return self.get_response(request)
+
+        queries = RequestQueries()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        record(match.view_name if match and match.view_name else 'unmatched', queries)
+        flush()
+        return response
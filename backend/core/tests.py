@@ -1,8 +1,36 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from unittest import mock
+from django.test import LiveServerTestCase, TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
-from .models import User
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from sales import numbering
+from sales.models import Sale
+from shifts.models import Shift
+from .authentication import CachedJWTAuthentication, ClaimsJWTAuthentication
+from .checks import check_trusted_claims_cache
+from .models import User, Branch
+from .serializers import ClaimsTokenObtainPairSerializer
+from . import benchmarks, query_budgets
+from .dataset import generate
+from .loadtest import compare, percentile, run
+from .querylog import fingerprint, reset_stats, flush as flush_query_stats
+from .profiling import list_profiles
+from .metrics import record_cache, reset_metrics, flush, render
+from .tokens import RevocableRefreshToken, purge_expired_tokens, reset_revocations
 
 # Create your tests here.
 
@@ -42,3 +70,391 @@ class UserUpdateTest(APITestCase):
         }
         response = self.client.patch(url, data)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class JWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(name='Till Branch', tax_id='P041')
+        self.cashier = User.objects.create_user(username='till', password='password123',
+                                                role='cashier', branch=self.branch)
+
+    def authenticate(self, backend, token):
+        with CaptureQueriesContext(connection) as queries:
+            user = backend.get_user(backend.get_validated_token(str(token)))
+        return user, len(queries)
+
+    def test_cached_user_comes_with_branch_and_skips_the_database(self):
+        backend = CachedJWTAuthentication()
+        token = AccessToken.for_user(self.cashier)
+
+        user, count = self.authenticate(backend, token)
+        self.assertEqual(count, 1)
+        self.assertEqual(user.branch.name, 'Till Branch')
+
+        with CaptureQueriesContext(connection) as queries:
+            user, count = self.authenticate(backend, token)
+            self.assertEqual(user.branch.name, 'Till Branch')
+            self.assertEqual(user.role, 'cashier')
+        self.assertEqual(len(queries), 0)
+        # The password hash never goes into the cache
+        self.assertNotIn('password', cache.get(f"auth:token:{token['jti']}")['user'])
+
+    def test_user_and_branch_changes_invalidate_the_cache(self):
+        backend = CachedJWTAuthentication()
+        token = AccessToken.for_user(self.cashier)
+        self.authenticate(backend, token)
+
+        self.cashier.role = 'manager'
+        self.cashier.save()
+        user, count = self.authenticate(backend, token)
+        self.assertEqual((user.role, count), ('manager', 1))
+
+        self.branch.name = 'Renamed Branch'
+        self.branch.save()
+        user, count = self.authenticate(backend, token)
+        self.assertEqual((user.branch.name, count), ('Renamed Branch', 1))
+
+        self.cashier.is_active = False
+        self.cashier.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(backend, token)
+
+    @override_settings(JWT_TRUST_TOKEN_CLAIMS=True)
+    def test_claims_mode_needs_no_queries(self):
+        backend = ClaimsJWTAuthentication()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.cashier).access_token
+        self.authenticate(backend, token)
+
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = self.authenticate(backend, token)
+            self.assertEqual((user.id, user.role, user.branch_id), (self.cashier.id, 'cashier', self.branch.id))
+            self.assertEqual(user.branch.name, 'Till Branch')
+        self.assertEqual(len(queries), 0)
+
+        # Once the user changes, the stale claims are no longer trusted
+        self.cashier.role = 'manager'
+        self.cashier.save()
+        user, count = self.authenticate(backend, token)
+        self.assertEqual((user.role, count), ('manager', 1))
+
+    def test_claims_mode_is_refused_with_a_per_process_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(JWT_TRUST_TOKEN_CLAIMS=True, CACHES=locmem):
+            self.assertEqual([error.id for error in check_trusted_claims_cache(None)], ['core.E001'])
+        with override_settings(JWT_TRUST_TOKEN_CLAIMS=True, CACHES=shared):
+            self.assertEqual(check_trusted_claims_cache(None), [])
+        with override_settings(JWT_TRUST_TOKEN_CLAIMS=False, CACHES=locmem):
+            self.assertEqual(check_trusted_claims_cache(None), [])
+
+    def test_claims_are_ignored_unless_enabled(self):
+        backend = ClaimsJWTAuthentication()
+        token = ClaimsTokenObtainPairSerializer.get_token(self.cashier).access_token
+        _, count = self.authenticate(backend, token)
+        self.assertEqual(count, 1)
+
+    def test_login_returns_tokens_and_profile(self):
+        response = self.client.post(reverse('token_obtain_pair'),
+                                    {'username': 'till', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertEqual(response.data['user']['branch_details']['name'], 'Till Branch')
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'cashier')
+
+        response = self.client.post(reverse('token_obtain_pair'),
+                                    {'username': 'till', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenRevocationTest(APITestCase):
+    def setUp(self):
+        reset_revocations()
+        self.user = User.objects.create_user(username='rotator', password='password123')
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)})
+
+    def test_rotated_token_is_rejected_without_querying_the_blacklist(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rotated = response.data['refresh']
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token['jti']).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.refresh(token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse([q for q in queries if 'token_blacklist_blacklistedtoken' in q['sql']])
+
+        self.assertEqual(self.refresh(rotated).status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_REVOCATION_SYNC_SECONDS=0)
+    def test_tokens_revoked_by_another_process_are_picked_up(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(RevocableRefreshToken.for_user(self.user)).status_code, status.HTTP_200_OK)
+
+        # Blacklisted elsewhere: only the database knows about it
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        self.assertEqual(self.refresh(token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_REVOCATION_SYNC_SECONDS=0)
+    def test_rows_committed_out_of_id_order_are_picked_up(self):
+        late = RevocableRefreshToken.for_user(self.user)
+        early = RevocableRefreshToken.for_user(self.user)
+        # The row with the higher id commits and is synced first
+        BlacklistedToken.objects.create(id=1000, token=OutstandingToken.objects.get(jti=early['jti']))
+        self.assertEqual(self.refresh(early).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        BlacklistedToken.objects.create(id=999, token=OutstandingToken.objects.get(jti=late['jti']))
+        self.assertEqual(self.refresh(late).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_purge_deletes_expired_tokens_in_batches(self):
+        expired = [RevocableRefreshToken.for_user(self.user) for _ in range(5)]
+        live = RevocableRefreshToken.for_user(self.user)
+        for token in expired[:2]:
+            token.blacklist()
+        OutstandingToken.objects.filter(jti__in=[token['jti'] for token in expired]).update(
+            expires_at=aware_utcnow() - timedelta(days=1))
+
+        self.assertEqual(purge_expired_tokens(batch_size=2), 5)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+        call_command('purge_tokens', stdout=io.StringIO())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        reset_metrics()
+        self.admin = User.objects.create_user(username='metrics-admin', password='password123', role='admin')
+        self.client.force_authenticate(user=self.admin)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_requests_are_timed_and_exposed(self):
+        response = self.client.get(reverse('branch-list'))
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertIn('queries"', response['Server-Timing'])
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('pos_http_request_duration_seconds_count{method="GET",status="200",view="branch-list"} 1', body)
+        self.assertIn('pos_db_queries_per_request_bucket{view="branch-list",le="+Inf"} 1', body)
+        self.assertIn('pos_http_response_size_bytes_sum{view="branch-list"}', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_the_scrape_token(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_are_refused_without_a_configured_token(self):
+        # Behind a same-host proxy every request arrives from 127.0.0.1
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_multiprocess_snapshots_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            record_cache('dashboard', True)
+            flush(force=True)
+            # Pretend another worker wrote the same snapshot
+            os.rename(os.path.join(directory, f'metrics-{os.getpid()}.json'),
+                      os.path.join(directory, 'metrics-1.json'))
+            self.assertIn('pos_cache_lookups_total{cache="dashboard",result="hit"} 2', render())
+
+
+class QueryLogTest(APITestCase):
+    def setUp(self):
+        reset_stats()
+        self.branch = Branch.objects.create(name='Query Branch', tax_id='P044')
+        self.manager = User.objects.create_user(username='query-manager', password='password123',
+                                                role='manager', branch=self.branch)
+        for number in range(3):
+            User.objects.create_user(username=f'query-cashier-{number}', password='password123',
+                                     role='cashier', branch=self.branch)
+        self.client.force_authenticate(user=self.manager)
+
+    def test_fingerprints_ignore_literals_and_list_lengths(self):
+        self.assertEqual(fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "n" = 5'),
+                         fingerprint("SELECT * FROM \"t\" WHERE \"id\" IN (%s)  AND \"n\" = 'x'"))
+        self.assertEqual(fingerprint('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+                         'INSERT INTO "t" ("a", "b") VALUES (...)')
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_queries_are_flagged_and_reported(self):
+        # One count per role: the same statement three times in a request
+        with self.assertLogs('core.querylog', level='WARNING') as logs:
+            response = self.client.get(reverse('user-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(any('Possible N+1 on user-stats' in line for line in logs.output))
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(QUERY_STATS_DIR=directory):
+            flush_query_stats(force=True)
+            out = io.StringIO()
+            call_command('query_stats', '--n-plus-one', '--endpoint', 'user-stats', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertGreater(len(lines), 1)
+        self.assertTrue(all(line.startswith('user-stats') for line in lines[1:]))
+
+
+class ProfilingTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.admin = User.objects.create_user(username='profiler', password='password123', role='admin')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_privileged_header_profiles_the_request(self):
+        with override_settings(PROFILING_TOKEN='let-me-profile', PROFILING_DIR=self.directory.name):
+            response = self.client.get(reverse('branch-list'))
+            self.assertNotIn('X-Profile-Id', response)
+            response = self.client.get(reverse('branch-list'), HTTP_X_PROFILE='wrong')
+            self.assertNotIn('X-Profile-Id', response)
+
+            response = self.client.get(reverse('branch-list'), HTTP_X_PROFILE='let-me-profile',
+                                       HTTP_X_PROFILE_MEMORY='1')
+            profile_id = response['X-Profile-Id']
+
+            listing = self.client.get(reverse('profile-list'))
+            self.assertEqual([p['id'] for p in listing.data], [profile_id])
+            detail = self.client.get(reverse('profile-detail', args=[profile_id]))
+            self.assertEqual((detail.data['view'], detail.data['reason']), ('branch-list', 'header'))
+            self.assertIn('function calls', detail.data['top_functions'])
+            self.assertGreater(detail.data['memory']['peak_bytes'], 0)
+            download = self.client.get(reverse('profile-download', args=[profile_id]))
+            self.assertEqual(download.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get(reverse('profile-detail', args=['..etc'])).status_code,
+                             status.HTTP_404_NOT_FOUND)
+
+    def test_sampled_profiles_are_bounded(self):
+        with override_settings(PROFILING_SAMPLE_RATES={'/api/branches/': 1.0}, PROFILING_MAX_PROFILES=2,
+                               PROFILING_DIR=self.directory.name):
+            for _ in range(4):
+                self.client.get(reverse('branch-list'))
+            self.assertEqual(len(list_profiles()), 2)
+            self.assertEqual(len(os.listdir(self.directory.name)), 4)
+
+            cashier = User.objects.create_user(username='not-admin', password='password123', role='cashier')
+            self.client.force_authenticate(user=cashier)
+            self.assertEqual(self.client.get(reverse('profile-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GenerateDatasetTest(TestCase):
+    def generate(self, seed):
+        """Generate a small dataset, check its shift ledger, summarise it and roll it back."""
+        with transaction.atomic():
+            totals = generate(2, 20, 30, 60, days=14, seed=seed, chunk_size=25, password='password123')
+            call_command('verify_shift_ledger', stdout=io.StringIO())
+            sales = Sale.objects.filter(branch__tax_id__startswith=f'GEN{seed}-')
+            summary = {
+                'totals': totals,
+                'sales': list(sales.order_by('sale_number').values_list('sale_number', 'total_amount', 'created_at')),
+                'shift_sales': sum(s.total_sales for s in Shift.objects.filter(branch__tax_id__startswith=f'GEN{seed}-')),
+                'cashier_can_log_in': User.objects.filter(branch__tax_id=f'GEN{seed}-0000').first()
+                .check_password('password123'),
+            }
+            transaction.set_rollback(True)
+        return summary
+
+    def test_counts_and_consistency(self):
+        summary = self.generate(seed=7)
+        totals = summary['totals']
+        self.assertEqual((totals['branches'], totals['products'], totals['customers'], totals['sales']),
+                         (2, 20, 30, 60))
+        self.assertEqual(totals['payments'], 60)
+        self.assertGreaterEqual(totals['shift_transactions'], 60)
+        self.assertGreaterEqual(totals['items'], 60)
+        self.assertGreaterEqual(totals['movements'], 20 + totals['items'])
+        self.assertEqual(summary['shift_sales'], sum(total for _, total, _ in summary['sales']))
+        self.assertTrue(summary['cashier_can_log_in'])
+        # Historical timestamps survive the bulk inserts
+        self.assertLess(min(created for _, _, created in summary['sales']), timezone.now() - timedelta(days=7))
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(self.generate(seed=3), self.generate(seed=3))
+        Branch.objects.create(name='Taken', location='Nairobi', phone='0700', tax_id='GEN3-0000')
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', branches=1, products=1, customers=0, sales=0, seed=3, stdout=io.StringIO())
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    def test_till_and_manager_flows(self):
+        generate(1, 10, 5, 20, days=3, seed=4, cashiers_per_branch=1, password='password123')
+        barcodes = list(Branch.objects.get(tax_id='GEN4-0000').products.values_list('barcode', flat=True))
+        cashier = User.objects.get(username__startswith='gen4-', role='cashier').username
+        manager = User.objects.get(username__startswith='gen4-', role='manager').username
+        generated = Sale.objects.count()
+        errors = []
+
+        results = run(self.live_server_url, [cashier], [manager], {cashier: barcodes}, 'password123',
+                      duration=60, max_sales=3, manager_think_time=0.05, on_error=errors.append)
+        self.assertEqual(errors, [])
+        self.assertEqual((results['sales'], results['failed_sales'], results['errors']), (3, 0, 0))
+        endpoints = results['endpoints']
+        self.assertEqual(endpoints['POST /api/sales/{id}/print_receipt/']['requests'], 3)
+        self.assertEqual(endpoints['POST /api/shifts/{id}/close_shift/']['requests'], 1)
+        self.assertTrue(any(name.startswith('GET /api/reports/') for name in endpoints))
+        self.assertGreater(endpoints['POST /api/sales/']['db_queries'], 0)
+        self.assertEqual(Sale.objects.filter(status='completed').count(), generated + 3)
+
+    def test_percentiles_and_comparison(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)), (50, 95, 99))
+        self.assertEqual(percentile([7], 0.99), 7)
+        previous = {'endpoints': {'GET /a': {'p95_ms': 100.0}}}
+        current = {'endpoints': {'GET /a': {'p95_ms': 150.0}, 'GET /b': {'p95_ms': 5.0}}}
+        self.assertEqual(compare(previous, current), [('GET /a', 100.0, 150.0, 50.0)])
+
+
+class BenchmarkHarnessTest(TestCase):
+    def test_benchmarks_run_and_regressions_are_flagged(self):
+        results = benchmarks.run(select='checkout', min_time=0.001)
+        names = [entry['name'] for entry in results['benchmarks']]
+        self.assertIn('checkout.sale_finalize', names)
+        for entry in results['benchmarks']:
+            self.assertGreaterEqual(entry['stats']['rounds'], 5)
+            self.assertLessEqual(entry['stats']['min'], entry['stats']['median'])
+
+        slower = {'benchmarks': [dict(entry, stats=dict(entry['stats'], median=entry['stats']['median'] * 2))
+                                 for entry in results['benchmarks']]}
+        rows = benchmarks.compare(results, slower, threshold=50)
+        self.assertEqual(len(rows), len(names))
+        self.assertTrue(all(regressed and round(change) == 100 for _, _, _, change, regressed in rows))
+        self.assertFalse(any(row[4] for row in benchmarks.compare(slower, results, threshold=50)))
+
+    def test_checkout_rounds_do_not_reserve_receipt_blocks(self):
+        # Builds the dataset, whose generation reserves blocks of its own
+        benchmarks.build_dataset('small')
+        with mock.patch.object(numbering, 'allocate_block', wraps=numbering.allocate_block) as allocate:
+            results = benchmarks.run(select='checkout.sale_create', min_time=0.001)
+        self.assertEqual([entry['name'] for entry in results['benchmarks']],
+                         ['checkout.sale_create', 'checkout.sale_create_with_discount_code'])
+        self.assertTrue(all(entry['stats']['rounds'] >= 5 for entry in results['benchmarks']))
+        # One block held before timing per benchmark, not one per round
+        self.assertEqual(allocate.call_count, 2)
+
+
+class QueryBudgetTest(APITestCase):
+    def test_every_get_route_has_a_budget(self):
+        routes = set(query_budgets.api_routes())
+        self.assertEqual(routes - set(query_budgets.QUERY_BUDGETS) - set(query_budgets.UNMEASURED), set())
+        self.assertEqual(set(query_budgets.QUERY_BUDGETS) - routes, set())
+
+    def test_query_counts_stay_within_budget_and_do_not_grow(self):
+        admin = User.objects.create_user(username='budget-admin', password='password123', role='admin')
+        self.client.force_authenticate(user=admin)
+        small = query_budgets.measure(self.client, query_budgets.build_dataset(8101, 5, admin))
+        large = query_budgets.measure(self.client, query_budgets.build_dataset(8102, 40, admin))
+
+        for name, budget in query_budgets.QUERY_BUDGETS.items():
+            with self.subTest(route=name):
+                (small_queries, _), (large_queries, status_code) = small[name], large[name]
+                self.assertIsNotNone(status_code, 'No row to request')
+                self.assertLess(status_code, 400)
+                self.assertLessEqual(large_queries, small_queries, 'Query count grows with the data (N+1)')
+                self.assertLessEqual(large_queries, budget)
@@ -0,0 +1,105 @@
+"""Refresh-token revocation without a blacklist query per refresh, and its cleanup.
+
+Rotation blacklists the old refresh token on every refresh, so the
+blacklist grows by one row per refresh. Each process keeps the jtis of
+revoked, not yet expired tokens in memory and reads only rows added since
+its last read, at most every TOKEN_REVOCATION_SYNC_SECONDS. A refresh
+therefore checks a set, however big the table gets. A token revoked by
+another process is seen by this one within that interval (0 reads new
+rows on every check). Tokens revoked in this process are seen at once.
+
+Concurrent inserts can commit out of id order, so a row with a lower id
+may become visible after a higher one was read. Each sync therefore
+re-reads the last TOKEN_REVOCATION_RESCAN_ROWS ids below the highest seen,
+and every TOKEN_REVOCATION_FULL_SYNC_SECONDS the whole set is reloaded.
+
+`purge_expired_tokens` deletes outstanding tokens, and their blacklist
+rows, once they have expired and can no longer be presented.
+"""
+import threading
+import time
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+_revoked = {}  # jti -> expiry (epoch seconds)
+_state = {'last_id': None, 'synced_at': None, 'loaded_at': None}
+_lock = threading.Lock()
+
+
+def _sync():
+    """Read blacklist rows added since the last sync; a full load reads all unexpired ones."""
+    rows = BlacklistedToken.objects.order_by('id')
+    last_id = _state['last_id']
+    loaded_at = _state['loaded_at']
+    if last_id is None or time.monotonic() - loaded_at >= settings.TOKEN_REVOCATION_FULL_SYNC_SECONDS:
+        last_id = rows.reverse().values_list('id', flat=True).first() or 0
+        rows = rows.filter(id__lte=last_id, token__expires_at__gt=aware_utcnow())
+        _state['loaded_at'] = time.monotonic()
+    else:
+        # Also re-read recent ids: a lower id can commit after a higher one was read
+        rows = rows.filter(id__gt=last_id - settings.TOKEN_REVOCATION_RESCAN_ROWS)
+
+    now = time.time()
+    for row_id, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at').iterator():
+        _revoked[jti] = expires_at.timestamp()
+        last_id = max(last_id, row_id)
+    _state['last_id'] = last_id
+    for jti in [jti for jti, expires in _revoked.items() if expires <= now]:
+        del _revoked[jti]
+    _state['synced_at'] = time.monotonic()
+
+
+def is_revoked(jti):
+    with _lock:
+        synced_at = _state['synced_at']
+        if synced_at is None or time.monotonic() - synced_at >= settings.TOKEN_REVOCATION_SYNC_SECONDS:
+            _sync()
+        return jti in _revoked
+
+
+def remember_revoked(jti, expires):
+    with _lock:
+        _revoked[jti] = expires
+
+
+def reset_revocations():
+    """Forget this process's revocation set; the next check reloads it."""
+    with _lock:
+        _revoked.clear()
+        _state.update(last_id=None, synced_at=None, loaded_at=None)
+
+
+class RevocableRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        remember_revoked(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
+
+
+def purge_expired_tokens(batch_size=None, before=None):
+    """Delete outstanding tokens that expired before `before` (default now), in batches.
+
+    Each batch is the lowest ids among the expired tokens. Returns the
+    number of tokens deleted; their blacklist rows go with them.
+    """
+    batch_size = batch_size or settings.TOKEN_PURGE_BATCH_SIZE
+    before = before or aware_utcnow()
+    deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=before)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    return deleted
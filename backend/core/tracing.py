@@ -0,0 +1,167 @@
+"""Lightweight tracing spans for the checkout path.
+
+    with span('checkout.stock', items=3):
+        ...
+
+A span opened while no other span is active starts a new trace; spans
+opened inside it become its children. When the outermost span ends, the
+whole trace is appended to TRACING_FILE as one line of OTLP/JSON (the
+format of OpenTelemetry's file exporter), so the file can be replayed into
+an OpenTelemetry collector with its ``otlpjsonfile`` receiver or read
+directly with `load_traces`.
+
+Tracing is off unless TRACING_ENABLED is set; a disabled span costs one
+settings lookup. TRACING_SAMPLE_RATE keeps only that fraction of traces.
+A trace that cannot be written is logged and dropped: by then the traced
+request has done its work, often committed a sale or payment, and must
+not fail because of it.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+SERVICE_NAME = 'pos-backend'
+SCOPE_NAME = 'pos.checkout'
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+logger = logging.getLogger('core.tracing')
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+_write_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, trace, parent=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.trace_id = trace['trace_id']
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else ''
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.message = ''
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': self.status, 'message': self.message} if self.message else {'code': self.status},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def current_span():
+    """The innermost open span, or None when not tracing."""
+    return _current.get()
+
+
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """Time the enclosed block as span `name` with the given attributes."""
+    parent = _current.get()
+    if parent is None:
+        if not settings.TRACING_ENABLED or random.random() >= settings.TRACING_SAMPLE_RATE:
+            yield None
+            return
+        trace = {'trace_id': os.urandom(16).hex(), 'spans': []}
+    else:
+        trace = parent.trace
+
+    current = Span(name, trace, parent, kind, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.status = STATUS_ERROR
+        current.message = str(e)[:200]
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+        trace['spans'].append(current)
+        if parent is None:
+            try:
+                export(trace['spans'])
+            except OSError:
+                logger.exception('Could not write trace %s to %s', trace['trace_id'], settings.TRACING_FILE)
+
+
+def traced(name, kind=SPAN_KIND_INTERNAL):
+    """Decorator form of `span`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind) as current:
+                result = func(*args, **kwargs)
+                if current is not None and hasattr(result, 'status_code'):
+                    current.set_attribute('http.status_code', result.status_code)
+                return result
+        return wrapper
+    return decorator
+
+
+def export(spans):
+    """Append one finished trace to TRACING_FILE as an OTLP/JSON line."""
+    line = json.dumps({'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', SERVICE_NAME),
+                                    _attribute('process.pid', os.getpid())]},
+        'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': [s.to_otlp() for s in spans]}],
+    }]})
+    directory = os.path.dirname(settings.TRACING_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _write_lock, open(settings.TRACING_FILE, 'a') as trace_file:
+        trace_file.write(line + '\n')
+
+
+def load_traces(path=None):
+    """Spans in an exported file as dicts with `name`, `trace_id`, `parent_id`, `duration_ms` and `attributes`."""
+    spans = []
+    with open(path or settings.TRACING_FILE) as trace_file:
+        for line in trace_file:
+            for resource in json.loads(line)['resourceSpans']:
+                for scope in resource['scopeSpans']:
+                    for item in scope['spans']:
+                        spans.append({
+                            'name': item['name'],
+                            'trace_id': item['traceId'],
+                            'span_id': item['spanId'],
+                            'parent_id': item.get('parentSpanId', ''),
+                            'duration_ms': (int(item['endTimeUnixNano']) - int(item['startTimeUnixNano'])) / 1e6,
+                            'attributes': {a['key']: next(iter(a['value'].values())) for a in item['attributes']},
+                        })
+    return spans
@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (CustomTokenObtainPairView, logout_view, user_profile, change_password,
-                    UserViewSet, BranchViewSet, CategoryViewSet, SystemConfigViewSet)
+                    UserViewSet, BranchViewSet, CategoryViewSet, SystemConfigViewSet, metrics_view,
+                    profile_list, profile_detail, profile_download)
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
@@ -16,5 +17,9 @@ urlpatterns = [
     path('auth/logout/', logout_view, name='logout'),
     path('auth/profile/', user_profile, name='user_profile'),
     path('auth/change-password/', change_password, name='change_password'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('profiles/', profile_list, name='profile-list'),
+    path('profiles/<str:profile_id>/', profile_detail, name='profile-detail'),
+    path('profiles/<str:profile_id>/download/', profile_download, name='profile-download'),
     path('', include(router.urls)),
 ]
@@ -2,24 +2,77 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import authenticate
+from django.conf import settings
+from django.http import HttpResponse, FileResponse
+from django.utils.crypto import constant_time_compare
 from django.db.models import Q
 from .models import User, Branch, Category, SystemConfig
 from .serializers import (UserSerializer, UserProfileSerializer, BranchSerializer,
                           CategorySerializer, SystemConfigSerializer, ChangePasswordSerializer,
-                          ResetPasswordSerializer, UserCreateSerializer)
+                          ResetPasswordSerializer, UserCreateSerializer, ClaimsTokenObtainPairSerializer)
 from .permissions import IsAdmin, IsManager
+from .tokens import RevocableRefreshToken
+from .metrics import render as render_metrics
+from .profiling import list_profiles, load_profile, profile_path
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            user = User.objects.get(username=request.data.get('username'))
-            response.data['user'] = UserProfileSerializer(user).data
-        return response
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        # The serializer already authenticated the user; no need to look them up again
+        data = dict(serializer.validated_data)
+        data['user'] = UserProfileSerializer(serializer.user).data
+        return Response(data, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint.
+
+    Needs `Authorization: Bearer <METRICS_TOKEN>`. Without a token configured
+    every request is refused: behind a same-host proxy all requests come from
+    127.0.0.1, so the client address cannot tell the server itself apart.
+    """
+    if not settings.METRICS_TOKEN or not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def profile_list(request):
+    """Stored request profiles, newest first, without their function listings."""
+    profiles = [{key: value for key, value in profile.items() if key not in ('top_functions', 'memory')}
+                for profile in list_profiles()]
+    return Response(profiles)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def profile_detail(request, profile_id):
+    profile = load_profile(profile_id)
+    if not profile:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(profile)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def profile_download(request, profile_id):
+    """The raw pstats dump, for `python -m pstats` or snakeviz."""
+    if not load_profile(profile_id):
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(open(profile_path(profile_id, 'prof'), 'rb'), as_attachment=True,
+                        filename=f'{profile_id}.prof')
 
 
 @api_view(['POST'])
@@ -28,7 +81,7 @@ def logout_view(request):
     try:
         refresh_token = request.data.get('refresh_token')
         if refresh_token:
-            token = RefreshToken(refresh_token)
+            token = RevocableRefreshToken(refresh_token)
             token.blacklist()
         return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -124,7 +177,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 Q(employee_id__icontains=search)
             )
         
-        return queryset.order_by('-date_joined')
+        return queryset.select_related('branch').order_by('-date_joined')
     
     def perform_create(self, serializer):
         """Create user with role restrictions"""
@@ -262,7 +315,7 @@ class BranchViewSet(viewsets.ModelViewSet):
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related('subcategories')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
     
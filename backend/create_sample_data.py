@@ -9,7 +9,7 @@ import sys
 import django
 
 # Add the project directory to Python path
-sys.path.append('/Users/josephgabriel/Development/SupermarketPOS/backend')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pos_config.settings')
@@ -32,7 +32,7 @@ class CustomerDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'total_points', 'lifetime_purchases', 'tier']
     
     def get_recent_transactions(self, obj):
-        transactions = obj.loyalty_transactions.all()[:10]
+        transactions = obj.loyalty_transactions.select_related('created_by')[:10]
         return LoyaltyTransactionSerializer(transactions, many=True).data
 
 
@@ -154,4 +154,4 @@ class LoyaltyTransactionViewSet(viewsets.ReadOnlyModelViewSet):
         if transaction_type:
             queryset = queryset.filter(transaction_type=transaction_type)
         
-        return queryset.order_by('-created_at')
+        return queryset.select_related('customer', 'created_by').order_by('-created_at')
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_stock_movements(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from core.partitioning import convert_to_partitioned
+    convert_to_partitioned('inventory_stockmovement', 'created_at', settings.PARTITION_MONTHS_AHEAD)
+
+
+def unpartition_stock_movements(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from core.partitioning import convert_to_plain
+    convert_to_plain('inventory_stockmovement')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_alter_product_tax_rate'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_stock_movements, unpartition_stock_movements),
+    ]
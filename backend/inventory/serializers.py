@@ -41,7 +41,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
     
     def get_recent_movements(self, obj):
-        movements = obj.stock_movements.all()[:5]
+        movements = obj.stock_movements.select_related('branch', 'created_by')[:5]
         return StockMovementSerializer(movements, many=True).data
 
 
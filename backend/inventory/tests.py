@@ -1,3 +1,107 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core.dates import day_range, month_start
+from core.models import User, Branch
+from core.partitioning import (partition_name, partition_month, months_between, is_partitioned, list_partitions,
+                               ensure_partitions, archive_partition, restore_partition)
+from .models import Category, Product, StockMovement
 
-# Create your tests here.
+TABLE = 'inventory_stockmovement'
+
+
+class StockMovementTestMixin:
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.manager = User.objects.create_user(username='manager', password='password',
+                                                role='manager', branch=self.branch)
+        category = Category.objects.create(name="Groceries")
+        self.product = Product.objects.create(name="Bread", barcode="111", category=category, branch=self.branch,
+                                              price=Decimal('50.00'), cost_price=Decimal('30.00'))
+
+    def create_movement(self, created_at, quantity=5):
+        movement = StockMovement.objects.create(product=self.product, movement_type='purchase', quantity=quantity,
+                                                previous_quantity=0, new_quantity=quantity, branch=self.branch)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=created_at)
+        return movement
+
+
+class StockMovementWindowTest(StockMovementTestMixin, TestCase):
+    def test_partition_names(self):
+        self.assertEqual(partition_name(TABLE, date(2024, 3, 1)), 'inventory_stockmovement_p2024_03')
+        self.assertEqual(partition_month('inventory_stockmovement_p2024_03'), date(2024, 3, 1))
+        self.assertIsNone(partition_month('inventory_stockmovement_default'))
+        self.assertEqual(months_between(date(2023, 11, 15), date(2024, 2, 3)),
+                         [date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)])
+
+    def test_movements_filter_by_local_date(self):
+        self.create_movement(day_range(date(2024, 1, 2))[0])
+        self.create_movement(day_range(date(2024, 1, 3))[0])
+        client = APIClient()
+        client.force_authenticate(user=self.manager)
+
+        response = client.get('/api/stock-movements/', {'date_from': '2024-01-02', 'date_to': '2024-01-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(client.get('/api/stock-movements/', {'date_from': '2/1/2024'}).status_code, 400)
+
+    def test_command_is_noop_without_postgres(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL partitions the table')
+        out = StringIO()
+        call_command('partitions', 'ensure', stdout=out)
+        self.assertIn('only available on PostgreSQL', out.getvalue())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Declarative partitioning is PostgreSQL specific')
+class StockMovementPartitionTest(StockMovementTestMixin, TestCase):
+    def test_migrated_table_is_partitioned_ahead(self):
+        self.assertTrue(is_partitioned(TABLE))
+        ensure_partitions(TABLE, months_ahead=2)
+        months = list_partitions(TABLE)
+        self.assertIn(month_start(timezone.localdate()), months)
+        self.assertGreaterEqual(max(months), month_start(timezone.localdate() + timedelta(days=40)))
+
+    def test_recent_window_prunes_old_partitions(self):
+        last_year = month_start(timezone.localdate() - timedelta(days=365))
+        ensure_partitions(TABLE, months_ahead=1, first_month=last_year)
+        plan = StockMovement.objects.filter(created_at__gte=day_range(timezone.localdate())[0]).explain()
+        self.assertIn(partition_name(TABLE, month_start(timezone.localdate())), plan)
+        self.assertNotIn(partition_name(TABLE, last_year), plan)
+
+    def test_rows_in_the_default_partition_move_to_a_new_month(self):
+        month = date(2019, 2, 1)
+        movement = self.create_movement(timezone.make_aware(datetime(2019, 2, 14, 12, 0)))
+        self.assertNotIn(month, list_partitions(TABLE))
+
+        ensure_partitions(TABLE, months_ahead=0, first_month=month)
+        self.assertIn(month, list_partitions(TABLE))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM "{partition_name(TABLE, month)}"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute(f'SELECT count(*) FROM "{TABLE}_default" WHERE id = %s', [movement.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(StockMovement.objects.get(pk=movement.pk).quantity, 5)
+
+    def test_archive_and_restore_round_trip(self):
+        month = date(2020, 5, 1)
+        ensure_partitions(TABLE, months_ahead=0, first_month=month)
+        movement = self.create_movement(timezone.make_aware(datetime(2020, 5, 10, 12, 0)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = archive_partition(TABLE, month, directory)
+            self.assertTrue(os.path.exists(path))
+            self.assertFalse(StockMovement.objects.filter(pk=movement.pk).exists())
+            self.assertNotIn(month, list_partitions(TABLE))
+
+            restore_partition(TABLE, path)
+        self.assertIn(month, list_partitions(TABLE))
+        self.assertEqual(StockMovement.objects.get(pk=movement.pk).quantity, 5)
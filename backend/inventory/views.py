@@ -2,18 +2,23 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError as InvalidQueryParam
 from django.db.models import Q, F
 from decimal import Decimal
 from .models import Product, StockMovement
 from .serializers import (ProductSerializer, ProductDetailSerializer, StockMovementSerializer, 
                           StockAdjustmentSerializer)
 from core.permissions import IsManager, IsCashier
+from core.authentication import ClaimsJWTAuthentication
+from core.dates import parse_date, date_filter
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    # Till endpoint: may trust role and branch claims in the token (JWT_TRUST_TOKEN_CLAIMS)
+    authentication_classes = [ClaimsJWTAuthentication]
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -51,7 +56,8 @@ class ProductViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category_id=category)
         if low_stock == 'true':
             queryset = queryset.filter(stock_quantity__lte=F('reorder_level'))
-        return queryset.order_by('name')
+        return (queryset.select_related('category', 'branch', 'supplier')
+                .prefetch_related('category__subcategories').order_by('name'))
     
     def perform_create(self, serializer):
         user = self.request.user
@@ -89,7 +95,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         if not barcode or not branch_id:
             return Response({'error': 'Barcode and branch are required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            product = Product.objects.get(
+            product = Product.objects.select_related('category', 'branch', 'supplier').get(
                 barcode=barcode,
                 branch=branch_id,
                 is_active=True
@@ -104,7 +110,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         queryset = Product.objects.filter(
             branch=request.user.branch,
             is_active=True
-        )
+        ).select_related('category', 'branch', 'supplier').prefetch_related('category__subcategories')
         low_stock_products = [p for p in queryset if p.is_low_stock]
         serializer = ProductSerializer(low_stock_products, many=True)
         return Response(serializer.data)
@@ -163,4 +169,13 @@ class StockMovementViewSet(viewsets.ReadOnlyModelViewSet):
         if movement_type:
             queryset = queryset.filter(movement_type=movement_type)
         
-        return queryset.order_by('-created_at')
+        # On PostgreSQL a date window only scans the matching monthly partitions
+        try:
+            date_from = parse_date(self.request.query_params.get('date_from'))
+            date_to = parse_date(self.request.query_params.get('date_to'))
+        except ValueError:
+            raise InvalidQueryParam({'error': 'Invalid date format. Use YYYY-MM-DD'})
+        if date_from or date_to:
+            queryset = queryset.filter(**date_filter('created_at', date_from, date_to))
+        
+        return queryset.select_related('product', 'branch', 'created_by').order_by('-created_at')
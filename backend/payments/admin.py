@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment, MpesaTransaction
+from .models import Payment, MpesaTransaction, MpesaCallback, Expense
 
 
 @admin.register(Payment)
@@ -18,3 +18,21 @@ class MpesaTransactionAdmin(admin.ModelAdmin):
     search_fields = ['phone_number', 'mpesa_receipt_number', 'checkout_request_id', 'merchant_request_id']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
+
+
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ['checkout_request_id', 'result_code', 'mpesa_receipt_number', 'outcome', 'received_at']
+    list_filter = ['outcome', 'result_code', 'received_at']
+    search_fields = ['checkout_request_id', 'merchant_request_id', 'mpesa_receipt_number']
+    readonly_fields = ['received_at']
+    date_hierarchy = 'received_at'
+
+
+@admin.register(Expense)
+class ExpenseAdmin(admin.ModelAdmin):
+    list_display = ['description', 'branch', 'category', 'payment_method', 'amount', 'paid_at']
+    list_filter = ['category', 'payment_method', 'branch', 'paid_at']
+    search_fields = ['description', 'reference_number']
+    readonly_fields = ['created_at', 'updated_at', 'created_by', 'updated_by']
+    date_hierarchy = 'paid_at'
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from payments.reconciliation import publish_sweep_metrics, sweep_pending_mpesa
+
+
+class Command(BaseCommand):
+    help = 'Reconcile pending M-Pesa payments whose callback never arrived'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Pending payments processed per batch')
+        parser.add_argument('--workers', type=int, help='Concurrent Daraja status queries')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between sweeps in loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = sweep_pending_mpesa(
+                batch_size=options['batch_size'],
+                max_workers=options['workers']
+            )
+            publish_sweep_metrics(stats)
+            self.stdout.write(
+                f"backlog={stats['backlog']} scanned={stats['scanned']} "
+                f"completed={stats['completed']} failed={stats['failed']} "
+                f"expired={stats['expired']} finalized={stats['finalized']} "
+                f"duration={stats['duration_seconds']}s"
+            )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'processed_at'], name='payments_pa_status_1a23af_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payment_status_processed_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=100)),
+                ('merchant_request_id', models.CharField(blank=True, max_length=100)),
+                ('result_code', models.CharField(max_length=10)),
+                ('result_desc', models.TextField(blank=True)),
+                ('mpesa_receipt_number', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('outcome', models.CharField(choices=[('applied', 'Applied'), ('ignored', 'Ignored'), ('duplicate', 'Duplicate'), ('not_found', 'Transaction Not Found')], max_length=20)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['checkout_request_id', 'result_code'], name='payments_mp_checkou_1b5088_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mpesacallback',
+            constraint=models.UniqueConstraint(condition=models.Q(('outcome__in', ['applied', 'ignored'])), fields=('checkout_request_id', 'result_code'), name='unique_handled_mpesa_callback'),
+        ),
+    ]
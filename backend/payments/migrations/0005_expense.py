@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:51
+
+from decimal import Decimal
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payments', '0004_mpesacallback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Expense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.CharField(choices=[('supplies', 'Supplies'), ('utilities', 'Utilities'), ('rent', 'Rent'), ('salaries', 'Salaries & Wages'), ('transport', 'Transport'), ('maintenance', 'Repairs & Maintenance'), ('other', 'Other')], default='other', max_length=20)),
+                ('description', models.CharField(max_length=500)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('mpesa', 'M-Pesa'), ('airtel_money', 'Airtel Money'), ('card', 'Credit/Debit Card'), ('bank_transfer', 'Bank Transfer')], default='cash', max_length=20)),
+                ('reference_number', models.CharField(blank=True, help_text='Receipt or invoice number', max_length=200)),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='expenses', to='core.branch')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL)),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-paid_at'],
+                'indexes': [models.Index(fields=['branch', '-paid_at'], name='payments_ex_branch__c729cf_idx'), models.Index(fields=['-paid_at'], name='payments_ex_paid_at_073509_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_payment_branch(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    Sale = apps.get_model('sales', 'Sale')
+    Payment.objects.filter(branch__isnull=True).update(
+        branch=Subquery(Sale.objects.filter(pk=OuterRef('sale_id')).values('branch_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('payments', '0005_expense'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='core.branch'),
+        ),
+        migrations.RunPython(backfill_payment_branch, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'payment_method', 'processed_at'], name='payments_pa_status_dd81d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['branch', 'status', 'processed_at'], name='payments_pa_branch__0c01a9_idx'),
+        ),
+    ]
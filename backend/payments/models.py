@@ -1,7 +1,8 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
-from core.models import Branch, User
+from core.models import AuditMixin, Branch, User
 from sales.models import Sale
 
 
@@ -22,6 +23,8 @@ class Payment(models.Model):
     ]
     
     sale = models.ForeignKey(Sale, on_delete=models.PROTECT, related_name='payments')
+    # Denormalized from the sale so branch-scoped reports avoid joining sales
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='payments', null=True, blank=True)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES)
     amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     
@@ -41,10 +44,18 @@ class Payment(models.Model):
             models.Index(fields=['sale', '-processed_at']),
             models.Index(fields=['reference_number']),
             models.Index(fields=['status']),
+            models.Index(fields=['status', 'processed_at']),
+            models.Index(fields=['status', 'payment_method', 'processed_at']),
+            models.Index(fields=['branch', 'status', 'processed_at']),
         ]
     
     def __str__(self):
         return f"{self.get_payment_method_display()} - KES {self.amount} ({self.status})"
+    
+    def save(self, *args, **kwargs):
+        if not self.branch_id and self.sale_id:
+            self.branch_id = self.sale.branch_id
+        super().save(*args, **kwargs)
 
 
 class MpesaTransaction(models.Model):
@@ -74,3 +85,76 @@ class MpesaTransaction(models.Model):
     
     def __str__(self):
         return f"M-Pesa {self.phone_number} - {self.mpesa_receipt_number or 'Pending'}"
+
+
+class MpesaCallback(models.Model):
+    """Append-only journal of every M-Pesa callback delivery.
+
+    Deliveries are journaled while the M-Pesa transaction row is locked, so
+    a retried delivery of an already handled checkout request and result is
+    recorded as a duplicate and never applied twice.
+    """
+    OUTCOME_CHOICES = [
+        ('applied', 'Applied'),
+        ('ignored', 'Ignored'),
+        ('duplicate', 'Duplicate'),
+        ('not_found', 'Transaction Not Found'),
+    ]
+
+    checkout_request_id = models.CharField(max_length=100)
+    merchant_request_id = models.CharField(max_length=100, blank=True)
+    result_code = models.CharField(max_length=10)
+    result_desc = models.TextField(blank=True)
+    mpesa_receipt_number = models.CharField(max_length=100, blank=True)
+
+    payload = models.JSONField()
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['checkout_request_id', 'result_code']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['checkout_request_id', 'result_code'],
+                condition=models.Q(outcome__in=['applied', 'ignored']),
+                name='unique_handled_mpesa_callback'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Callback {self.checkout_request_id} ({self.result_code}) - {self.outcome}"
+
+
+class Expense(AuditMixin):
+    """Money paid out of the business; the cash-out side of the cash flow report."""
+    CATEGORY_CHOICES = [
+        ('supplies', 'Supplies'),
+        ('utilities', 'Utilities'),
+        ('rent', 'Rent'),
+        ('salaries', 'Salaries & Wages'),
+        ('transport', 'Transport'),
+        ('maintenance', 'Repairs & Maintenance'),
+        ('other', 'Other'),
+    ]
+
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='expenses')
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
+    description = models.CharField(max_length=500)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES, default='cash')
+    reference_number = models.CharField(max_length=200, blank=True, help_text="Receipt or invoice number")
+    paid_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-paid_at']
+        indexes = [
+            models.Index(fields=['branch', '-paid_at']),
+            models.Index(fields=['-paid_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_category_display()} - KES {self.amount} ({self.description})"
@@ -0,0 +1,73 @@
+import base64
+import requests
+from datetime import datetime
+from django.conf import settings
+
+
+SANDBOX_URL = 'https://sandbox.safaricom.co.ke'
+PRODUCTION_URL = 'https://api.safaricom.co.ke'
+
+# STK query responses for requests Safaricom has not finished processing
+PROCESSING_ERROR_CODES = {'500.001.1001'}
+
+
+class MpesaError(Exception):
+    pass
+
+
+def is_configured():
+    return bool(settings.MPESA_CONSUMER_KEY and settings.MPESA_CONSUMER_SECRET
+                and settings.MPESA_SHORTCODE and settings.MPESA_PASSKEY)
+
+
+def base_url():
+    return PRODUCTION_URL if settings.MPESA_ENVIRONMENT == 'production' else SANDBOX_URL
+
+
+def get_access_token(session=None):
+    session = session or requests
+    response = session.get(
+        f"{base_url()}/oauth/v1/generate?grant_type=client_credentials",
+        auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET),
+        timeout=settings.MPESA_TIMEOUT
+    )
+    if response.status_code != 200:
+        raise MpesaError(f'Failed to obtain access token ({response.status_code})')
+    return response.json()['access_token']
+
+
+def stk_password(timestamp):
+    raw = f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}"
+    return base64.b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def query_stk_status(checkout_request_id, access_token, session=None):
+    """Ask Daraja for the outcome of an STK push.
+
+    Returns a dict with `result_code` and `result_desc`, or None while
+    Safaricom is still processing the request.
+    """
+    session = session or requests
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    response = session.post(
+        f"{base_url()}/mpesa/stkpushquery/v1/query",
+        json={
+            'BusinessShortCode': settings.MPESA_SHORTCODE,
+            'Password': stk_password(timestamp),
+            'Timestamp': timestamp,
+            'CheckoutRequestID': checkout_request_id,
+        },
+        headers={'Authorization': f'Bearer {access_token}'},
+        timeout=settings.MPESA_TIMEOUT
+    )
+    data = response.json()
+
+    if data.get('errorCode') in PROCESSING_ERROR_CODES:
+        return None
+    if 'ResultCode' not in data:
+        raise MpesaError(data.get('errorMessage', f'Unexpected response ({response.status_code})'))
+
+    return {
+        'result_code': str(data['ResultCode']),
+        'result_desc': data.get('ResultDesc', ''),
+    }
@@ -0,0 +1,200 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.metrics import flush as flush_metrics, register_gauge, set_gauge
+from .models import Payment, MpesaTransaction
+from . import mpesa
+
+logger = logging.getLogger('payments.reconciliation')
+
+
+def pending_mpesa_payments(cutoff):
+    # Served by the (status, processed_at) index
+    return Payment.objects.filter(status='pending', processed_at__lt=cutoff, payment_method='mpesa')
+
+
+def backlog_size(now=None):
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.MPESA_RECONCILE_AFTER_SECONDS)
+    return pending_mpesa_payments(cutoff).count()
+
+
+def register_metrics():
+    # Counted when scraped, so it is current even when the sweeper is not running
+    register_gauge('pos_mpesa_reconcile_backlog', 'Pending M-Pesa payments old enough to reconcile', backlog_size)
+    register_gauge('pos_mpesa_reconcile_sweep_backlog', 'Backlog when the last reconciliation sweep started')
+    register_gauge('pos_mpesa_reconcile_sweep_duration_seconds', 'Duration of the last reconciliation sweep')
+    register_gauge('pos_mpesa_reconcile_sweep_timestamp_seconds', 'Unix time the last reconciliation sweep finished')
+    register_gauge('pos_mpesa_reconcile_sweep_payments', 'Payments handled by the last reconciliation sweep, by outcome')
+
+
+def publish_sweep_metrics(stats):
+    """Set the sweep gauges from `stats` and write them to METRICS_MULTIPROCESS_DIR for the metrics endpoint."""
+    set_gauge('pos_mpesa_reconcile_sweep_backlog', stats['backlog'])
+    set_gauge('pos_mpesa_reconcile_sweep_duration_seconds', stats['duration_seconds'])
+    set_gauge('pos_mpesa_reconcile_sweep_timestamp_seconds', round(time.time(), 3))
+    for outcome in ('scanned', 'completed', 'failed', 'expired', 'finalized'):
+        set_gauge('pos_mpesa_reconcile_sweep_payments', stats[outcome], outcome=outcome)
+    flush_metrics(force=True, name='reconcile_mpesa')
+
+
+def _get_transaction(payment):
+    try:
+        return payment.mpesa_transaction
+    except MpesaTransaction.DoesNotExist:
+        return None
+
+
+def _query_status(checkout_request_id, access_token):
+    try:
+        return mpesa.query_stk_status(checkout_request_id, access_token)
+    except Exception as e:
+        logger.warning('STK query failed for %s: %s', checkout_request_id, e)
+        return None
+
+
+def _query_batch(pool, batch, access_token):
+    """Query Daraja for every payment in the batch that has a checkout request id."""
+    if not access_token:
+        return {}
+
+    futures = {}
+    for payment in batch:
+        mpesa_transaction = _get_transaction(payment)
+        if mpesa_transaction and mpesa_transaction.checkout_request_id:
+            futures[payment.id] = pool.submit(_query_status, mpesa_transaction.checkout_request_id, access_token)
+
+    return {payment_id: future.result() for payment_id, future in futures.items()}
+
+
+def _apply_results(batch, results, now, expire_cutoff, stats):
+    completed = {}
+    failed = {}
+    for payment in batch:
+        result = results.get(payment.id)
+        if result is None:
+            if payment.processed_at < expire_cutoff:
+                failed[payment.id] = {
+                    'result_code': '',
+                    'result_desc': 'Expired: no M-Pesa confirmation received',
+                    'expired': True,
+                }
+        elif result['result_code'] == '0':
+            completed[payment.id] = result
+        else:
+            failed[payment.id] = result
+
+    if not completed and not failed:
+        return
+
+    with transaction.atomic():
+        # Re-check under lock so a callback that landed meanwhile wins
+        payments = list(
+            Payment.objects.select_for_update()
+            .select_related('sale')
+            .filter(id__in=[*completed, *failed], status='pending')
+        )
+        transactions = {
+            t.payment_id: t for t in MpesaTransaction.objects.filter(payment__in=payments)
+        }
+
+        updated_transactions = []
+        for payment in payments:
+            mpesa_transaction = transactions.get(payment.id)
+            if payment.id in completed:
+                result = completed[payment.id]
+                payment.status = 'completed'
+                if mpesa_transaction and not payment.reference_number:
+                    payment.reference_number = (mpesa_transaction.mpesa_receipt_number
+                                                or mpesa_transaction.checkout_request_id)
+                stats['completed'] += 1
+            else:
+                result = failed[payment.id]
+                payment.status = 'failed'
+                if result.get('expired'):
+                    payment.notes = f"{payment.notes}\n{result['result_desc']}".strip()
+                    stats['expired'] += 1
+                else:
+                    stats['failed'] += 1
+
+            if mpesa_transaction:
+                mpesa_transaction.result_code = result['result_code']
+                mpesa_transaction.result_desc = result['result_desc']
+                mpesa_transaction.transaction_date = now
+                updated_transactions.append(mpesa_transaction)
+
+        Payment.objects.bulk_update(payments, ['status', 'reference_number', 'notes'])
+        MpesaTransaction.objects.bulk_update(
+            updated_transactions, ['result_code', 'result_desc', 'transaction_date']
+        )
+
+        for payment in payments:
+            if payment.status != 'completed':
+                continue
+            try:
+                sale = payment.sale.register_payment(payment)
+            except ValueError as e:
+                logger.warning('Could not finalize sale %s: %s', payment.sale.sale_number, e)
+                continue
+            if sale.status == 'completed':
+                stats['finalized'] += 1
+
+
+def sweep_pending_mpesa(now=None, batch_size=None, max_workers=None):
+    """Resolve pending M-Pesa payments whose callback never arrived.
+
+    Pending payments older than MPESA_RECONCILE_AFTER_SECONDS are walked in
+    batches, queried against Daraja on a bounded thread pool, then completed
+    or failed in bulk. Payments with no answer past MPESA_EXPIRE_AFTER_SECONDS
+    are failed. Returns sweep statistics including backlog size and duration.
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    batch_size = batch_size or settings.MPESA_RECONCILE_BATCH_SIZE
+    max_workers = max_workers or settings.MPESA_RECONCILE_WORKERS
+
+    reconcile_cutoff = now - timedelta(seconds=settings.MPESA_RECONCILE_AFTER_SECONDS)
+    expire_cutoff = now - timedelta(seconds=settings.MPESA_EXPIRE_AFTER_SECONDS)
+    pending = pending_mpesa_payments(reconcile_cutoff)
+
+    stats = {
+        'backlog': pending.count(),
+        'scanned': 0,
+        'completed': 0,
+        'failed': 0,
+        'expired': 0,
+        'finalized': 0,
+    }
+
+    access_token = None
+    if stats['backlog'] and mpesa.is_configured():
+        try:
+            access_token = mpesa.get_access_token()
+        except Exception as e:
+            logger.warning('M-Pesa authentication failed, only expiring stale payments: %s', e)
+
+    cursor = None
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            batch_qs = pending.select_related('mpesa_transaction').order_by('processed_at', 'id')
+            if cursor:
+                batch_qs = batch_qs.filter(
+                    Q(processed_at__gt=cursor[0]) | Q(processed_at=cursor[0], id__gt=cursor[1])
+                )
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                break
+            cursor = (batch[-1].processed_at, batch[-1].id)
+            stats['scanned'] += len(batch)
+
+            results = _query_batch(pool, batch, access_token)
+            _apply_results(batch, results, now, expire_cutoff, stats)
+
+    stats['duration_seconds'] = round(time.monotonic() - started, 3)
+    logger.info('M-Pesa reconciliation sweep: %s', stats)
+    return stats
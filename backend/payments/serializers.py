@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Payment, MpesaTransaction
+from .models import Payment, MpesaTransaction, Expense
 
 
 class MpesaTransactionSerializer(serializers.ModelSerializer):
@@ -49,3 +49,21 @@ class MpesaCallbackSerializer(serializers.Serializer):
     result_code = serializers.CharField(max_length=10)
     result_desc = serializers.CharField()
     mpesa_receipt_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+
+class ExpenseSerializer(serializers.ModelSerializer):
+    category_display = serializers.CharField(source='get_category_display', read_only=True)
+    payment_method_display = serializers.CharField(source='get_payment_method_display', read_only=True)
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+    created_by_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Expense
+        fields = ['id', 'branch', 'branch_name', 'category', 'category_display', 'description', 'amount',
+                  'payment_method', 'payment_method_display', 'reference_number', 'paid_at',
+                  'created_by', 'created_by_name', 'created_at', 'updated_at']
+        read_only_fields = ['created_by', 'created_at', 'updated_at']
+        extra_kwargs = {'branch': {'required': False}}
+
+    def get_created_by_name(self, obj):
+        return obj.created_by.get_full_name() if obj.created_by else None
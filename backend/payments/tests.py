@@ -1,3 +1,173 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from rest_framework.test import APIClient
+from core.metrics import render, reset_metrics
+from core.models import Branch, User
+from inventory.models import Product
+from sales.models import Sale, SaleItem
+from .models import Payment, MpesaTransaction, MpesaCallback
+from .reconciliation import sweep_pending_mpesa
 
-# Create your tests here.
+
+@override_settings(MPESA_RECONCILE_AFTER_SECONDS=120, MPESA_EXPIRE_AFTER_SECONDS=3600)
+class MpesaReconciliationTest(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Test Branch', tax_id='P001')
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+
+    def create_pending_payment(self, age, checkout_request_id=''):
+        sale = Sale.objects.create(branch=self.branch, cashier=self.cashier, subtotal=Decimal('100.00'),
+                                   tax_amount=Decimal('0.00'), total_amount=Decimal('100.00'))
+        payment = Payment.objects.create(sale=sale, payment_method='mpesa', amount=Decimal('100.00'),
+                                         phone_number='254700000000', status='pending')
+        MpesaTransaction.objects.create(payment=payment, phone_number='254700000000',
+                                        amount=Decimal('100.00'), checkout_request_id=checkout_request_id)
+        Payment.objects.filter(id=payment.id).update(processed_at=timezone.now() - age)
+        return payment
+
+    @patch('payments.reconciliation.mpesa.get_access_token', return_value='token')
+    @patch('payments.reconciliation.mpesa.is_configured', return_value=True)
+    def test_sweep_completes_confirmed_and_fails_rejected(self, *mocks):
+        confirmed = self.create_pending_payment(timedelta(minutes=10), 'ws_CO_1')
+        rejected = self.create_pending_payment(timedelta(minutes=10), 'ws_CO_2')
+        recent = self.create_pending_payment(timedelta(seconds=10), 'ws_CO_3')
+
+        results = {
+            'ws_CO_1': {'result_code': '0', 'result_desc': 'Processed'},
+            'ws_CO_2': {'result_code': '1032', 'result_desc': 'Request cancelled by user'},
+        }
+        with patch('payments.reconciliation.mpesa.query_stk_status',
+                   side_effect=lambda checkout_id, token: results[checkout_id]):
+            stats = sweep_pending_mpesa(batch_size=1, max_workers=2)
+
+        self.assertEqual(stats['backlog'], 2)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['finalized'], 1)
+
+        confirmed.refresh_from_db()
+        rejected.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(confirmed.status, 'completed')
+        self.assertEqual(confirmed.sale.status, 'completed')
+        self.assertEqual(rejected.status, 'failed')
+        self.assertEqual(rejected.mpesa_transaction.result_code, '1032')
+        self.assertEqual(recent.status, 'pending')
+
+    def test_sweep_expires_unconfirmed_payments_without_credentials(self):
+        stale = self.create_pending_payment(timedelta(hours=2))
+        waiting = self.create_pending_payment(timedelta(minutes=10))
+
+        stats = sweep_pending_mpesa()
+
+        self.assertEqual(stats['expired'], 1)
+        stale.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(stale.sale.status, 'pending')
+        self.assertEqual(waiting.status, 'pending')
+
+    def test_sweep_metrics_reach_the_metrics_endpoint(self):
+        self.create_pending_payment(timedelta(hours=2))
+        self.create_pending_payment(timedelta(minutes=10))
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            call_command('reconcile_mpesa', stdout=io.StringIO())
+            # The scrape happens in a web process with none of the command's gauges
+            reset_metrics()
+            body = render()
+        self.assertIn('pos_mpesa_reconcile_backlog 1', body)
+        self.assertIn('pos_mpesa_reconcile_sweep_backlog 2', body)
+        self.assertIn('pos_mpesa_reconcile_sweep_payments{outcome="expired"} 1', body)
+        self.assertIn('# TYPE pos_mpesa_reconcile_sweep_duration_seconds gauge', body)
+
+
+class MpesaCallbackFixtureMixin:
+    def create_stk_payment(self, checkout_request_id='ws_CO_100'):
+        self.branch = Branch.objects.create(name='Test Branch', tax_id='P001')
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+        self.product = Product.objects.create(name='Milk', barcode='MILK001', price=Decimal('100.00'),
+                                              cost_price=Decimal('60.00'), stock_quantity=10,
+                                              branch=self.branch)
+        self.sale = Sale.objects.create(branch=self.branch, cashier=self.cashier, subtotal=Decimal('100.00'),
+                                        tax_amount=Decimal('0.00'), total_amount=Decimal('100.00'))
+        SaleItem.objects.create(sale=self.sale, product=self.product, quantity=1,
+                                unit_price=Decimal('100.00'), subtotal=Decimal('100.00'))
+        self.payment = Payment.objects.create(sale=self.sale, payment_method='mpesa', amount=Decimal('100.00'),
+                                              phone_number='254700000000', status='pending')
+        MpesaTransaction.objects.create(payment=self.payment, phone_number='254700000000',
+                                        amount=Decimal('100.00'), checkout_request_id=checkout_request_id)
+        return {
+            'merchant_request_id': 'mr_1',
+            'checkout_request_id': checkout_request_id,
+            'result_code': '0',
+            'result_desc': 'The service request is processed successfully.',
+            'mpesa_receipt_number': 'QAB1CD2EF3',
+        }
+
+    def assert_applied_once(self):
+        self.payment.refresh_from_db()
+        self.sale.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.sale.status, 'completed')
+        self.assertEqual(self.sale.amount_paid, Decimal('100.00'))
+        self.assertEqual(self.product.stock_quantity, 9)
+        self.assertEqual(MpesaCallback.objects.filter(outcome='applied').count(), 1)
+
+
+class MpesaCallbackTest(MpesaCallbackFixtureMixin, TestCase):
+    def test_duplicate_callbacks_are_applied_once(self):
+        payload = self.create_stk_payment()
+        client = APIClient()
+
+        for _ in range(3):
+            response = client.post('/api/mpesa/callback/', payload, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assert_applied_once()
+        self.assertEqual(MpesaCallback.objects.filter(outcome='duplicate').count(), 2)
+
+    def test_late_failure_does_not_downgrade_completed_payment(self):
+        payload = self.create_stk_payment()
+        client = APIClient()
+        client.post('/api/mpesa/callback/', payload, format='json')
+
+        response = client.post('/api/mpesa/callback/', dict(payload, result_code='1032'), format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(MpesaCallback.objects.get(result_code='1032').outcome, 'ignored')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Concurrent row locking needs PostgreSQL')
+class MpesaCallbackLoadTest(MpesaCallbackFixtureMixin, TransactionTestCase):
+    DELIVERIES = int(os.environ.get('MPESA_CALLBACK_LOAD_DELIVERIES', 2000))
+
+    def test_concurrent_duplicate_callbacks_are_applied_once(self):
+        payload = self.create_stk_payment()
+
+        def deliver(_):
+            try:
+                return APIClient().post('/api/mpesa/callback/', payload, format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(deliver, range(self.DELIVERIES)))
+
+        self.assertEqual(set(statuses), {200})
+        self.assert_applied_once()
+        self.assertEqual(MpesaCallback.objects.count(), self.DELIVERIES)
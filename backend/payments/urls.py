@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PaymentViewSet, mpesa_callback
+from .views import PaymentViewSet, ExpenseViewSet, mpesa_callback
 
 router = DefaultRouter()
 router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'expenses', ExpenseViewSet, basename='expense')
 
 urlpatterns = [
     path('mpesa/callback/', mpesa_callback, name='mpesa_callback'),
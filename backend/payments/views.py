@@ -3,24 +3,28 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db import transaction
-from django.db.models import Sum
 from django.utils import timezone
-from decimal import Decimal
 import requests
 import base64
 from datetime import datetime
-from .models import Payment, MpesaTransaction
+from rest_framework.exceptions import ValidationError
+from .models import Payment, MpesaTransaction, MpesaCallback, Expense
 from sales.models import Sale
 from .serializers import (PaymentSerializer, PaymentCreateSerializer, 
                           MpesaSTKPushSerializer, MpesaCallbackSerializer, 
-                          MpesaTransactionSerializer)
-from core.permissions import IsCashier
+                          MpesaTransactionSerializer, ExpenseSerializer)
+from core.permissions import IsCashier, IsManager
+from core.authentication import ClaimsJWTAuthentication
+from core.tracing import traced, SPAN_KIND_SERVER
+from core.dates import parse_date, date_filter
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated, IsCashier]
+    # Till endpoint: may trust role and branch claims in the token (JWT_TRUST_TOKEN_CLAIMS)
+    authentication_classes = [ClaimsJWTAuthentication]
     
     def get_queryset(self):
         queryset = Payment.objects.all()
@@ -36,8 +40,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         
-        return queryset.select_related('sale', 'processed_by').order_by('-processed_at')
+        return queryset.select_related('sale', 'processed_by', 'mpesa_transaction').order_by('-processed_at')
     
+    @traced('payment.create', SPAN_KIND_SERVER)
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = PaymentCreateSerializer(data=request.data)
@@ -47,26 +52,23 @@ class PaymentViewSet(viewsets.ModelViewSet):
         data = serializer.validated_data
         
         try:
-            sale = Sale.objects.get(id=data['sale_id'])
+            # Lock the sale so concurrent split-tender payments see each other
+            sale = Sale.objects.select_for_update().get(id=data['sale_id'])
         except Sale.DoesNotExist:
             return Response({'error': 'Sale not found'}, status=status.HTTP_404_NOT_FOUND)
         
         if sale.status != 'pending':
             return Response({'error': 'Sale is already completed or cancelled'}, 
                           status=status.HTTP_400_BAD_REQUEST)
-        
-        total_payments = Payment.objects.filter(
-            sale=sale,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
         # Allow overpayment for cash payments (change will be given)
-        if data['payment_method'] != 'cash' and total_payments + data['amount'] > sale.total_amount:
+        if data['payment_method'] != 'cash' and sale.amount_paid + data['amount'] > sale.total_amount:
             return Response({'error': 'Payment amount exceeds sale total'},
                           status=status.HTTP_400_BAD_REQUEST)
         
         payment = Payment.objects.create(
             sale=sale,
+            branch=sale.branch,
             payment_method=data['payment_method'],
             amount=data['amount'],
             reference_number=data.get('reference_number', ''),
@@ -76,12 +78,10 @@ class PaymentViewSet(viewsets.ModelViewSet):
             processed_by=request.user
         )
         
-        total_paid = total_payments + data['amount']
-        if total_paid >= sale.total_amount:
-            try:
-                sale.finalize(user=request.user)
-            except Exception as e:
-                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sale.register_payment(payment, user=request.user)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         response_serializer = PaymentSerializer(payment)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -101,6 +101,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         
         payment = Payment.objects.create(
             sale=sale,
+            branch=sale.branch,
             payment_method='mpesa',
             amount=data['amount'],
             phone_number=data['phone_number'],
@@ -121,9 +122,11 @@ class PaymentViewSet(viewsets.ModelViewSet):
             'note': 'M-Pesa integration requires credentials. Proceeding with manual confirmation mode.'
         }, status=status.HTTP_201_CREATED)
     
+    @transaction.atomic
     @action(detail=True, methods=['post'])
     def confirm_mpesa(self, request, pk=None):
-        payment = self.get_object()
+        # Lock the payment so a racing callback cannot complete it twice
+        payment = Payment.objects.select_for_update().get(pk=self.get_object().pk)
         
         if payment.payment_method != 'mpesa':
             return Response({'error': 'Payment is not an M-Pesa payment'}, 
@@ -150,64 +153,134 @@ class PaymentViewSet(viewsets.ModelViewSet):
             mpesa_transaction.result_desc = 'Manually confirmed'
             mpesa_transaction.save()
         
-        total_payments = Payment.objects.filter(
-            sale=payment.sale,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        if total_payments >= payment.sale.total_amount:
-            try:
-                payment.sale.finalize(user=request.user)
-            except Exception as e:
-                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            payment.sale.register_payment(payment, user=request.user)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = PaymentSerializer(payment)
         return Response(serializer.data)
 
 
+class ExpenseViewSet(viewsets.ModelViewSet):
+    queryset = Expense.objects.all()
+    serializer_class = ExpenseSerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    
+    def get_queryset(self):
+        queryset = Expense.objects.all()
+        
+        user = self.request.user
+        if user.role != 'admin':
+            queryset = queryset.filter(branch=user.branch)
+        
+        branch = self.request.query_params.get('branch', None)
+        category = self.request.query_params.get('category', None)
+        payment_method = self.request.query_params.get('payment_method', None)
+        try:
+            date_from = parse_date(self.request.query_params.get('date_from'))
+            date_to = parse_date(self.request.query_params.get('date_to'))
+        except ValueError:
+            raise ValidationError({'error': 'Invalid date format. Use YYYY-MM-DD'})
+        
+        if branch and user.role == 'admin':
+            queryset = queryset.filter(branch_id=branch)
+        if category:
+            queryset = queryset.filter(category=category)
+        if payment_method:
+            queryset = queryset.filter(payment_method=payment_method)
+        if date_from or date_to:
+            queryset = queryset.filter(**date_filter('paid_at', date_from, date_to))
+        
+        return queryset.select_related('branch', 'created_by').order_by('-paid_at')
+    
+    def get_branch(self, serializer):
+        # Managers record expenses against their own branch
+        if self.request.user.role != 'admin':
+            return self.request.user.branch
+        branch = serializer.validated_data.get('branch', getattr(serializer.instance, 'branch', None))
+        if not branch:
+            raise ValidationError({'branch': 'This field is required.'})
+        return branch
+    
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user, branch=self.get_branch(serializer))
+    
+    def perform_update(self, serializer):
+        serializer.save(updated_by=self.request.user, branch=self.get_branch(serializer))
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def mpesa_callback(request):
     serializer = MpesaCallbackSerializer(data=request.data)
-    if serializer.is_valid():
-        data = serializer.validated_data
-        
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    journal_fields = {
+        'checkout_request_id': data['checkout_request_id'],
+        'merchant_request_id': data['merchant_request_id'],
+        'result_code': data['result_code'],
+        'result_desc': data['result_desc'],
+        'mpesa_receipt_number': data.get('mpesa_receipt_number', ''),
+        'payload': request.data,
+    }
+
+    error = None
+    with transaction.atomic():
+        # Locking the transaction row serializes concurrent deliveries of the
+        # same checkout request; Safaricom retries callbacks freely.
         try:
-            mpesa_transaction = MpesaTransaction.objects.get(
+            mpesa_transaction = MpesaTransaction.objects.select_for_update().get(
                 checkout_request_id=data['checkout_request_id']
             )
-            
+        except MpesaTransaction.DoesNotExist:
+            MpesaCallback.objects.create(outcome='not_found', **journal_fields)
+            return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        already_handled = MpesaCallback.objects.filter(
+            checkout_request_id=data['checkout_request_id'],
+            result_code=data['result_code'],
+            outcome__in=['applied', 'ignored']
+        ).exists()
+        if already_handled:
+            MpesaCallback.objects.create(outcome='duplicate', **journal_fields)
+            return Response({'message': 'Duplicate callback ignored'})
+
+        payment = Payment.objects.select_for_update().select_related('sale').get(
+            pk=mpesa_transaction.payment_id
+        )
+
+        # A late success still completes a payment the sweeper expired, but a
+        # failure never downgrades a payment that already completed.
+        if data['result_code'] == '0':
+            applies = payment.status != 'completed'
+        else:
+            applies = payment.status == 'pending'
+
+        MpesaCallback.objects.create(outcome='applied' if applies else 'ignored', **journal_fields)
+
+        if applies:
             mpesa_transaction.result_code = data['result_code']
             mpesa_transaction.result_desc = data['result_desc']
             mpesa_transaction.mpesa_receipt_number = data.get('mpesa_receipt_number', '')
             mpesa_transaction.transaction_date = timezone.now()
             mpesa_transaction.save()
-            
-            payment = mpesa_transaction.payment
-            
+
             if data['result_code'] == '0':
                 payment.status = 'completed'
                 payment.reference_number = data.get('mpesa_receipt_number', '')
             else:
                 payment.status = 'failed'
-            
             payment.save()
-            
+
             if payment.status == 'completed':
-                total_payments = Payment.objects.filter(
-                    sale=payment.sale,
-                    status='completed'
-                ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                
-                if total_payments >= payment.sale.total_amount:
-                    try:
-                        payment.sale.finalize(user=None)
-                    except Exception as e:
-                        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            return Response({'message': 'Callback processed successfully'})
-        
-        except MpesaTransaction.DoesNotExist:
-            return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    payment.sale.register_payment(payment)
+                except ValueError as e:
+                    error = str(e)
+
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'message': 'Callback processed successfully'})
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from decouple import config, Csv
+from corsheaders.defaults import default_headers
 from datetime import timedelta
 import os
 
@@ -52,6 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.querylog.QueryLogMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -151,7 +155,7 @@ AUTH_USER_MODEL = 'core.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -168,8 +172,27 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Refresh-token revocation (see core/tokens.py): seconds between reads of
+# newly blacklisted tokens by each process, how many ids below the highest
+# seen each read re-checks and seconds between full reloads, and tokens
+# deleted per batch by `purge_tokens`
+TOKEN_REVOCATION_SYNC_SECONDS = config('TOKEN_REVOCATION_SYNC_SECONDS', default=5, cast=int)
+TOKEN_REVOCATION_RESCAN_ROWS = config('TOKEN_REVOCATION_RESCAN_ROWS', default=1000, cast=int)
+TOKEN_REVOCATION_FULL_SYNC_SECONDS = config('TOKEN_REVOCATION_FULL_SYNC_SECONDS', default=600, cast=int)
+TOKEN_PURGE_BATCH_SIZE = config('TOKEN_PURGE_BATCH_SIZE', default=5000, cast=int)
+TOKEN_PURGE_INTERVAL = config('TOKEN_PURGE_INTERVAL', default=3600, cast=int)
+
+# Seconds a token's user and branch are reused before being read again
+# (see core/authentication.py). Trusting token claims lets the till
+# endpoints skip the user lookup entirely, at the cost of role and branch
+# changes only applying once the change marker reaches that process.
+# Trusting claims needs CACHES to be a shared backend (system check core.E001).
+JWT_USER_CACHE_SECONDS = config('JWT_USER_CACHE_SECONDS', default=60, cast=int)
+JWT_TRUST_TOKEN_CLAIMS = config('JWT_TRUST_TOKEN_CLAIMS', default=False, cast=bool)
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = config(
     'CORS_ALLOWED_ORIGINS',
@@ -177,6 +200,88 @@ CORS_ALLOWED_ORIGINS = config(
     cast=Csv()
 )
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'x-terminal')
+
+# M-Pesa (Daraja) Configuration
+MPESA_ENVIRONMENT = config('MPESA_ENVIRONMENT', default='sandbox')
+MPESA_CONSUMER_KEY = config('MPESA_CONSUMER_KEY', default='')
+MPESA_CONSUMER_SECRET = config('MPESA_CONSUMER_SECRET', default='')
+MPESA_SHORTCODE = config('MPESA_SHORTCODE', default='')
+MPESA_PASSKEY = config('MPESA_PASSKEY', default='')
+MPESA_TIMEOUT = config('MPESA_TIMEOUT', default=10, cast=int)
+
+# Pending M-Pesa payments older than RECONCILE_AFTER are queried by the
+# reconciliation sweeper; those still unconfirmed after EXPIRE_AFTER are failed.
+MPESA_RECONCILE_AFTER_SECONDS = config('MPESA_RECONCILE_AFTER_SECONDS', default=120, cast=int)
+MPESA_EXPIRE_AFTER_SECONDS = config('MPESA_EXPIRE_AFTER_SECONDS', default=3600, cast=int)
+MPESA_RECONCILE_BATCH_SIZE = config('MPESA_RECONCILE_BATCH_SIZE', default=200, cast=int)
+MPESA_RECONCILE_WORKERS = config('MPESA_RECONCILE_WORKERS', default=8, cast=int)
+
+# Analytics materialized views (PostgreSQL only; other databases always read live)
+ANALYTICS_MATERIALIZED_VIEWS = config('ANALYTICS_MATERIALIZED_VIEWS', default=True, cast=bool)
+ANALYTICS_REFRESH_INTERVAL = config('ANALYTICS_REFRESH_INTERVAL', default=900, cast=int)
+
+# Monthly partitions (PostgreSQL only): created ahead of time, archived once
+# older than the retention window. See core/partitioning.py.
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', default=3, cast=int)
+PARTITION_RETENTION_MONTHS = config('PARTITION_RETENTION_MONTHS', default=24, cast=int)
+PARTITION_ARCHIVE_DIR = config('PARTITION_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+
+# Sales older than the retention window (KRA requires five years of records)
+# are moved to per-branch, per-month files by `archive_sales`
+SALES_RETENTION_MONTHS = config('SALES_RETENTION_MONTHS', default=60, cast=int)
+SALES_ARCHIVE_DIR = config('SALES_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive', 'sales'))
+SALES_ARCHIVE_BATCH_SIZE = config('SALES_ARCHIVE_BATCH_SIZE', default=500, cast=int)
+
+# Receipt numbers reserved per process at a time (see sales/numbering.py)
+RECEIPT_BLOCK_SIZE = config('RECEIPT_BLOCK_SIZE', default=50, cast=int)
+
+# Seconds a process reuses a terminal's branch, VAT rate and printer at checkout
+TERMINAL_CONTEXT_SECONDS = config('TERMINAL_CONTEXT_SECONDS', default=60, cast=int)
+
+# Composite dashboard: sections run on a small thread pool (1 = sequential)
+# and are cached per role/branch scope for the given number of seconds (0 = off).
+DASHBOARD_WORKERS = config('DASHBOARD_WORKERS', default=4, cast=int)
+DASHBOARD_CACHE_SECONDS = {
+    'stats': config('DASHBOARD_STATS_CACHE_SECONDS', default=60, cast=int),
+    'recent_activity': config('DASHBOARD_ACTIVITY_CACHE_SECONDS', default=15, cast=int),
+    'revenue_chart': config('DASHBOARD_REVENUE_CACHE_SECONDS', default=300, cast=int),
+    'sales_channels': config('DASHBOARD_CHANNELS_CACHE_SECONDS', default=300, cast=int),
+}
+
+# Request metrics served at /api/metrics/ (see core/metrics.py). Set
+# METRICS_MULTIPROCESS_DIR under gunicorn so every worker's numbers are
+# reported; requests slower than METRICS_SLOW_REQUEST_SECONDS are logged.
+# The endpoint refuses every request until METRICS_TOKEN is set.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_MULTIPROCESS_DIR = config('METRICS_MULTIPROCESS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=10, cast=int)
+METRICS_SLOW_REQUEST_SECONDS = config('METRICS_SLOW_REQUEST_SECONDS', default=1.0, cast=float)
+
+# Query fingerprints per endpoint (see core/querylog.py, `query_stats`).
+# Slow queries and N+1 patterns are logged to logs/queries.log.
+QUERY_LOG_ENABLED = config('QUERY_LOG_ENABLED', default=True, cast=bool)
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=200, cast=int)
+N_PLUS_ONE_THRESHOLD = config('N_PLUS_ONE_THRESHOLD', default=10, cast=int)
+QUERY_STATS_DIR = config('QUERY_STATS_DIR', default=os.path.join(BASE_DIR, 'logs', 'querystats'))
+QUERY_STATS_FLUSH_SECONDS = config('QUERY_STATS_FLUSH_SECONDS', default=60, cast=int)
+
+# Checkout tracing spans, exported as OTLP/JSON lines (see core/tracing.py)
+TRACING_ENABLED = config('TRACING_ENABLED', default=False, cast=bool)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=1.0, cast=float)
+TRACING_FILE = config('TRACING_FILE', default=os.path.join(BASE_DIR, 'logs', 'traces.jsonl'))
+
+# On-demand request profiling (see core/profiling.py): requests sent with
+# `X-Profile: <PROFILING_TOKEN>`, and a share of requests under the given
+# path prefixes (e.g. PROFILING_SAMPLE_RATES=/api/reports/=0.01), are profiled
+PROFILING_TOKEN = config('PROFILING_TOKEN', default='')
+PROFILING_SAMPLE_RATES = {
+    prefix: float(rate) for prefix, rate in
+    (item.split('=', 1) for item in config('PROFILING_SAMPLE_RATES', default='', cast=Csv()))
+}
+PROFILING_DIR = config('PROFILING_DIR', default=os.path.join(BASE_DIR, 'logs', 'profiles'))
+PROFILING_MAX_PROFILES = config('PROFILING_MAX_PROFILES', default=50, cast=int)
 
 # Security Settings for HTTPS
 if not DEBUG:
@@ -200,6 +305,13 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'pos_system.log'),
         },
+        'queries': {
+            'level': 'INFO',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'queries.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+        },
     },
     'loggers': {
         'django': {
@@ -207,5 +319,25 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'payments': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'reports': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'core': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'core.querylog': {
+            'handlers': ['queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import AnalyticsRefresh
 
-# Register your models here.
+
+@admin.register(AnalyticsRefresh)
+class AnalyticsRefreshAdmin(admin.ModelAdmin):
+    list_display = ['view_name', 'refreshed_at', 'duration_seconds']
+    readonly_fields = ['view_name', 'refreshed_at', 'duration_seconds']
@@ -0,0 +1,196 @@
+"""Analytics readers backed by PostgreSQL materialized views.
+
+On PostgreSQL the daily summaries come from the materialized views created
+in reports/migrations, refreshed by `manage.py refresh_analytics`. Days
+that the last refresh may not cover completely (the refresh date onwards)
+are always read live, so results stay current between refreshes. On any
+other database, or before the first refresh, everything is read live.
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from core.dates import date_filter
+from inventory.models import Product
+from payments.models import Payment
+from sales.models import Sale, SaleItem
+from .models import AnalyticsRefresh, SalesDailySummary, ProductSalesDailySummary, PaymentMethodDailySummary
+
+logger = logging.getLogger('reports.analytics')
+
+MATERIALIZED_VIEWS = {
+    'reports_sales_daily_mv': SalesDailySummary,
+    'reports_product_sales_daily_mv': ProductSalesDailySummary,
+    'reports_payments_daily_mv': PaymentMethodDailySummary,
+}
+
+SALES_TOTALS = ['sales_count', 'subtotal', 'tax_amount', 'discount_amount', 'total_amount']
+
+
+def materialized_views_enabled():
+    return connection.vendor == 'postgresql' and settings.ANALYTICS_MATERIALIZED_VIEWS
+
+
+def refresh_materialized_views(names=None, concurrently=True):
+    """Refresh the given (default all) materialized views and record when each was refreshed."""
+    if not materialized_views_enabled():
+        return {}
+
+    durations = {}
+    for name in names or MATERIALIZED_VIEWS:
+        started_at = timezone.now()
+        started = time.monotonic()
+        with connection.cursor() as cursor:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{name}")
+        durations[name] = round(time.monotonic() - started, 3)
+        AnalyticsRefresh.objects.update_or_create(
+            view_name=name,
+            defaults={'refreshed_at': started_at, 'duration_seconds': durations[name]}
+        )
+        logger.info('Refreshed %s in %ss', name, durations[name])
+    return durations
+
+
+def split_by_refresh(view_name, date_from, date_to):
+    """Split a local-date range into the part served by `view_name` and the part read live.
+
+    Returns `(view_range, live_range)`; either may be None.
+    """
+    refreshed_at = None
+    if materialized_views_enabled():
+        refreshed_at = AnalyticsRefresh.objects.filter(view_name=view_name).values_list(
+            'refreshed_at', flat=True
+        ).first()
+    if not refreshed_at:
+        return None, (date_from, date_to)
+
+    # The view is complete for every day before the day it was refreshed on
+    boundary = timezone.localtime(refreshed_at).date()
+    view_to = min(date_to, boundary - timedelta(days=1))
+    live_from = max(date_from, boundary)
+    return (
+        (date_from, view_to) if view_to >= date_from else None,
+        (live_from, date_to) if live_from <= date_to else None,
+    )
+
+
+def _branch_filter(field, branch_id):
+    # Views store a missing branch as 0
+    if branch_id is None:
+        return {}
+    if branch_id == 0:
+        return {f'{field}__isnull': True}
+    return {field: branch_id}
+
+
+def sales_by_day(date_from, date_to, branch_id=None, cashier_id=None):
+    """Completed sales totals keyed by local day: sales_count, subtotal, tax_amount, discount_amount, total_amount."""
+    view_range, live_range = split_by_refresh('reports_sales_daily_mv', date_from, date_to)
+    days = {}
+
+    if view_range:
+        rows = SalesDailySummary.objects.filter(day__gte=view_range[0], day__lte=view_range[1])
+        if branch_id is not None:
+            rows = rows.filter(branch_id=branch_id)
+        if cashier_id is not None:
+            rows = rows.filter(cashier_id=cashier_id)
+        for row in rows.values('day').annotate(**{field: Sum(field) for field in SALES_TOTALS}):
+            days[row.pop('day')] = row
+
+    if live_range:
+        sales = Sale.objects.filter(
+            status='completed',
+            **date_filter('created_at', *live_range),
+            **_branch_filter('branch_id', branch_id)
+        )
+        if cashier_id is not None:
+            sales = sales.filter(cashier_id=cashier_id)
+        rows = sales.annotate(
+            day=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+        ).values('day').annotate(
+            sales_count=Count('id'),
+            subtotal=Sum('subtotal'),
+            tax_amount=Sum('tax_amount'),
+            discount_amount=Sum('discount_amount'),
+            total_amount=Sum('total_amount')
+        )
+        for row in rows:
+            days[row.pop('day')] = row
+
+    return days
+
+
+def product_sales(date_from, date_to, branch_id=None, limit=None):
+    """Units sold and revenue per product, best sellers by revenue first."""
+    view_range, live_range = split_by_refresh('reports_product_sales_daily_mv', date_from, date_to)
+    totals = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0.00')})
+
+    if view_range:
+        rows = ProductSalesDailySummary.objects.filter(day__gte=view_range[0], day__lte=view_range[1])
+        if branch_id is not None:
+            rows = rows.filter(branch_id=branch_id)
+        for row in rows.values('product_id').annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue')):
+            totals[row['product_id']]['quantity'] += row['total_quantity']
+            totals[row['product_id']]['revenue'] += row['total_revenue']
+
+    if live_range:
+        rows = SaleItem.objects.filter(
+            sale__status='completed',
+            **date_filter('sale__created_at', *live_range),
+            **_branch_filter('sale__branch_id', branch_id)
+        ).order_by().values('product_id').annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('subtotal') + F('tax_amount'))
+        )
+        for row in rows:
+            totals[row['product_id']]['quantity'] += row['total_quantity']
+            totals[row['product_id']]['revenue'] += row['total_revenue']
+
+    ranked = sorted(totals.items(), key=lambda item: item[1]['revenue'], reverse=True)[:limit]
+    names = Product.objects.in_bulk([product_id for product_id, _ in ranked])
+    return [
+        {
+            'product_id': product_id,
+            'product_name': names[product_id].name if product_id in names else None,
+            'quantity': values['quantity'],
+            'revenue': values['revenue'],
+        }
+        for product_id, values in ranked
+    ]
+
+
+def payments_by_method(date_from, date_to, branch_id=None):
+    """Completed payment count and amount per payment method, most used first."""
+    view_range, live_range = split_by_refresh('reports_payments_daily_mv', date_from, date_to)
+    totals = defaultdict(lambda: {'count': 0, 'amount': Decimal('0.00')})
+
+    if view_range:
+        rows = PaymentMethodDailySummary.objects.filter(day__gte=view_range[0], day__lte=view_range[1])
+        if branch_id is not None:
+            rows = rows.filter(branch_id=branch_id)
+        for row in rows.values('payment_method').annotate(total_count=Sum('payment_count'), total_amount=Sum('amount')):
+            totals[row['payment_method']]['count'] += row['total_count']
+            totals[row['payment_method']]['amount'] += row['total_amount']
+
+    if live_range:
+        # Served by the (status, payment_method, processed_at) index, or by
+        # (branch, status, processed_at) when scoped to a branch
+        rows = Payment.objects.filter(
+            status='completed',
+            **date_filter('processed_at', *live_range),
+            **_branch_filter('branch_id', branch_id)
+        ).order_by().values('payment_method').annotate(total_count=Count('id'), total_amount=Sum('amount'))
+        for row in rows:
+            totals[row['payment_method']]['count'] += row['total_count']
+            totals[row['payment_method']]['amount'] += row['total_amount']
+
+    return sorted(
+        ({'payment_method': method, **values} for method, values in totals.items()),
+        key=lambda row: row['count'], reverse=True
+    )
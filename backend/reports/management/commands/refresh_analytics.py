@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from reports.analytics import MATERIALIZED_VIEWS, materialized_views_enabled, refresh_materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Refresh the PostgreSQL materialized views behind the analytics reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='+', choices=list(MATERIALIZED_VIEWS), help='Views to refresh (default all)')
+        parser.add_argument('--no-concurrent', action='store_true',
+                            help='Refresh without CONCURRENTLY (faster, but blocks readers)')
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing until interrupted')
+        parser.add_argument('--interval', type=int, default=settings.ANALYTICS_REFRESH_INTERVAL,
+                            help='Seconds between refreshes in loop mode')
+
+    def handle(self, *args, **options):
+        if not materialized_views_enabled():
+            self.stdout.write('Materialized views are disabled or unsupported on this database; reports read live data.')
+            return
+
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+
+        while True:
+            durations = refresh_materialized_views(options['views'], concurrently=not options['no_concurrent'])
+            for name, seconds in durations.items():
+                self.stdout.write(f"{name} refreshed in {seconds}s")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
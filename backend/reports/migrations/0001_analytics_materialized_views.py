@@ -0,0 +1,140 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Each view carries a synthetic text `id` (its grouping key) so Django can
+# read it through an unmanaged model and REFRESH ... CONCURRENTLY has the
+# unique index it requires.
+MATERIALIZED_VIEWS = {
+    'reports_sales_daily_mv': """
+        SELECT concat_ws(':', day, branch_id, cashier_id) AS id, *
+        FROM (
+            SELECT (s.created_at AT TIME ZONE %(tz)s)::date AS day,
+                   COALESCE(s.branch_id, 0) AS branch_id,
+                   s.cashier_id,
+                   COUNT(*) AS sales_count,
+                   SUM(s.subtotal) AS subtotal,
+                   SUM(s.tax_amount) AS tax_amount,
+                   SUM(s.discount_amount) AS discount_amount,
+                   SUM(s.total_amount) AS total_amount
+            FROM sales_sale s
+            WHERE s.status = 'completed'
+            GROUP BY 1, 2, 3
+        ) grouped
+    """,
+    'reports_product_sales_daily_mv': """
+        SELECT concat_ws(':', day, branch_id, product_id) AS id, *
+        FROM (
+            SELECT (s.created_at AT TIME ZONE %(tz)s)::date AS day,
+                   COALESCE(s.branch_id, 0) AS branch_id,
+                   i.product_id,
+                   SUM(i.quantity) AS quantity,
+                   SUM(i.subtotal + i.tax_amount) AS revenue
+            FROM sales_saleitem i
+            JOIN sales_sale s ON s.id = i.sale_id
+            WHERE s.status = 'completed'
+            GROUP BY 1, 2, 3
+        ) grouped
+    """,
+    'reports_payments_daily_mv': """
+        SELECT concat_ws(':', day, branch_id, payment_method) AS id, *
+        FROM (
+            SELECT (p.processed_at AT TIME ZONE %(tz)s)::date AS day,
+                   COALESCE(p.branch_id, 0) AS branch_id,
+                   p.payment_method,
+                   COUNT(*) AS payment_count,
+                   SUM(p.amount) AS amount
+            FROM payments_payment p
+            WHERE p.status = 'completed'
+            GROUP BY 1, 2, 3
+        ) grouped
+    """,
+}
+
+
+def create_materialized_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, query in MATERIALIZED_VIEWS.items():
+        schema_editor.execute(f'CREATE MATERIALIZED VIEW {name} AS {query}', {'tz': settings.TIME_ZONE})
+        schema_editor.execute(f'CREATE UNIQUE INDEX {name}_id ON {name} (id)')
+        schema_editor.execute(f'CREATE INDEX {name}_day_branch ON {name} (day, branch_id)')
+
+
+def drop_materialized_views(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in MATERIALIZED_VIEWS:
+        schema_editor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('sales', '0008_sale_change_given'),
+        ('payments', '0006_payment_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentMethodDailySummary',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('branch_id', models.IntegerField(help_text='0 for payments without a branch')),
+                ('payment_method', models.CharField(max_length=20)),
+                ('payment_count', models.IntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+            ],
+            options={
+                'db_table': 'reports_payments_daily_mv',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesDailySummary',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('branch_id', models.IntegerField(help_text='0 for sales without a branch')),
+                ('product_id', models.IntegerField()),
+                ('quantity', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=15)),
+            ],
+            options={
+                'db_table': 'reports_product_sales_daily_mv',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesDailySummary',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('branch_id', models.IntegerField(help_text='0 for sales without a branch')),
+                ('cashier_id', models.IntegerField()),
+                ('sales_count', models.IntegerField()),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('tax_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('discount_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+            ],
+            options={
+                'db_table': 'reports_sales_daily_mv',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=100, unique=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('duration_seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_materialized_views, drop_materialized_views),
+    ]
@@ -1,2 +1,60 @@
 from django.db import models
 
+
+class AnalyticsRefresh(models.Model):
+    """Last successful refresh of each analytics materialized view.
+
+    `refreshed_at` is when the refresh started, so the view is complete for
+    every local day before that date.
+    """
+    view_name = models.CharField(max_length=100, unique=True)
+    refreshed_at = models.DateTimeField()
+    duration_seconds = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.view_name} refreshed at {self.refreshed_at}"
+
+
+class SalesDailySummary(models.Model):
+    """Completed sales per local day, branch and cashier (PostgreSQL materialized view)."""
+    id = models.CharField(max_length=100, primary_key=True)
+    day = models.DateField()
+    branch_id = models.IntegerField(help_text="0 for sales without a branch")
+    cashier_id = models.IntegerField()
+    sales_count = models.IntegerField()
+    subtotal = models.DecimalField(max_digits=15, decimal_places=2)
+    tax_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    discount_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        managed = False
+        db_table = 'reports_sales_daily_mv'
+
+
+class ProductSalesDailySummary(models.Model):
+    """Units sold and revenue per local day, branch and product (PostgreSQL materialized view)."""
+    id = models.CharField(max_length=100, primary_key=True)
+    day = models.DateField()
+    branch_id = models.IntegerField(help_text="0 for sales without a branch")
+    product_id = models.IntegerField()
+    quantity = models.IntegerField()
+    revenue = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        managed = False
+        db_table = 'reports_product_sales_daily_mv'
+
+
+class PaymentMethodDailySummary(models.Model):
+    """Completed payments per local day, branch and method (PostgreSQL materialized view)."""
+    id = models.CharField(max_length=100, primary_key=True)
+    day = models.DateField()
+    branch_id = models.IntegerField(help_text="0 for payments without a branch")
+    payment_method = models.CharField(max_length=20)
+    payment_count = models.IntegerField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        managed = False
+        db_table = 'reports_payments_daily_mv'
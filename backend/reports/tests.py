@@ -1,9 +1,24 @@
-from django.test import TestCase
+import unittest
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient
+from core.dates import day_range, range_filter
 from core.models import User, Branch
+from payments.models import Payment, Expense
 from sales.models import Sale
-from datetime import datetime
+from shifts.models import Shift
+from reports.dashboard import DashboardScope, SECTIONS, build_dashboard
+from reports.analytics import (materialized_views_enabled, split_by_refresh,
+                               sales_by_day, product_sales, payments_by_method)
+from reports.models import AnalyticsRefresh
+from inventory.models import Product, Category
+from sales.models import SaleItem
+from django.core.management import call_command
+from io import StringIO
+from datetime import date, datetime, timedelta
 from unittest.mock import patch
 from decimal import Decimal
 
@@ -62,3 +77,303 @@ class DashboardStatsTimezoneTest(TestCase):
             
             self.assertEqual(float(data['totalRevenue']), 100.0)
             self.assertEqual(data['totalOrders'], 1)
+
+
+class LocalDateWindowTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.manager = User.objects.create_user(username='manager', password='password',
+                                                role='manager', branch=self.branch)
+        self.client.force_authenticate(user=self.manager)
+
+    def create_sale(self, sale_number, created_at):
+        sale = Sale.objects.create(sale_number=sale_number, branch=self.branch, cashier=self.manager,
+                                   total_amount=Decimal('100.00'), subtotal=Decimal('86.21'),
+                                   tax_amount=Decimal('13.79'), status='completed')
+        Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+
+    def test_windows_follow_nairobi_midnight(self):
+        self.assertEqual(
+            day_range(date(2024, 1, 2)),
+            (datetime(2024, 1, 1, 21, 0, tzinfo=timezone.utc), datetime(2024, 1, 2, 21, 0, tzinfo=timezone.utc))
+        )
+        # 23:59 and 00:00 Nairobi on either side of 2 January
+        self.create_sale('BEFORE', datetime(2024, 1, 1, 20, 59, tzinfo=timezone.utc))
+        self.create_sale('START', datetime(2024, 1, 1, 21, 0, tzinfo=timezone.utc))
+        self.create_sale('END', datetime(2024, 1, 2, 20, 59, tzinfo=timezone.utc))
+        self.create_sale('AFTER', datetime(2024, 1, 2, 21, 0, tzinfo=timezone.utc))
+
+        response = self.client.get('/api/reports/daily-sales/', {'date': '2024-01-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_transactions'], 2)
+
+        response = self.client.get('/api/reports/tax-report/', {'date_from': '2024-01-01', 'date_to': '2024-01-03'})
+        self.assertEqual([day['total_sales'] for day in response.data], ['100.00', '200.00', '100.00'])
+
+        response = self.client.get('/api/sales/', {'date_from': '2024-01-02', 'date_to': '2024-01-02'})
+        self.assertEqual(sorted(sale['sale_number'] for sale in response.data['results']), ['END', 'START'])
+
+        response = self.client.get('/api/sales/', {'date_from': '02/01/2024'})
+        self.assertEqual(response.status_code, 400)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN output is PostgreSQL specific')
+class LocalDateWindowIndexTest(TestCase):
+    """Date windows must compare the raw column so the composite indexes stay usable."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+
+    def assert_uses_index(self, queryset, index_column):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                plan = queryset.explain()
+            finally:
+                cursor.execute('SET enable_seqscan = on')
+        self.assertIn('Index', plan)
+        self.assertIn(index_column, plan)
+        self.assertNotIn('timezone(', plan)
+
+    def test_report_windows_use_indexes(self):
+        today = day_range(date(2024, 1, 2))
+        self.assert_uses_index(
+            Sale.objects.filter(branch=self.branch, **range_filter('created_at', today)), 'created_at'
+        )
+        self.assert_uses_index(
+            Sale.objects.filter(status='completed', **range_filter('created_at', today)), 'created_at'
+        )
+        self.assert_uses_index(
+            Payment.objects.filter(status='completed', **range_filter('processed_at', today)), 'processed_at'
+        )
+        self.assert_uses_index(
+            Shift.objects.filter(status='closed', **range_filter('opening_time', today)), 'opening_time'
+        )
+        self.assert_uses_index(
+            Payment.objects.filter(branch=self.branch, status='completed', **range_filter('processed_at', today)),
+            'processed_at'
+        )
+
+
+class CashFlowReportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.manager = User.objects.create_user(username='manager', password='password', role='manager',
+                                                branch=self.branch, first_name='Jane', last_name='Doe')
+        self.client.force_authenticate(user=self.manager)
+
+    def test_totals_breakdown_and_paginated_ledger(self):
+        for i, method in enumerate(['cash', 'cash', 'mpesa', 'card', 'bank_transfer']):
+            sale = Sale.objects.create(sale_number=f'CF-{i}', branch=self.branch, cashier=self.manager,
+                                       total_amount=Decimal('100.00'), subtotal=Decimal('100.00'),
+                                       tax_amount=Decimal('0.00'), status='completed')
+            Payment.objects.create(sale=sale, payment_method=method, amount=Decimal('100.00'),
+                                   status='completed', processed_by=self.manager)
+        Expense.objects.create(branch=self.branch, category='utilities', description='Electricity',
+                               amount=Decimal('120.00'), payment_method='mpesa', created_by=self.manager)
+        Expense.objects.create(branch=self.branch, description='Cleaning', amount=Decimal('30.00'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/reports/cash-flow/', {'limit': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.data['summary']['total_cash_in'], Decimal('500.00'))
+        self.assertEqual(response.data['summary']['total_cash_out'], Decimal('150.00'))
+        self.assertEqual(response.data['summary']['net_cash_flow'], Decimal('350.00'))
+        self.assertEqual(response.data['breakdown'], {
+            'cash': Decimal('200.00'), 'card': Decimal('100.00'), 'mpesa': Decimal('100.00'), 'other': Decimal('100.00')
+        })
+        self.assertEqual(response.data['cash_out_breakdown']['mpesa'], Decimal('120.00'))
+
+        transactions = response.data['transactions']
+        cursor = response.data['next_cursor']
+        while cursor:
+            page = self.client.get('/api/reports/cash-flow/', {'limit': 4, 'cursor': cursor}).data
+            transactions += page['transactions']
+            cursor = page['next_cursor']
+
+        self.assertEqual(len(transactions), 7)
+        self.assertEqual(len({(tx['type'], tx['id']) for tx in transactions}), 7)
+        self.assertEqual([tx['date'] for tx in transactions], sorted((tx['date'] for tx in transactions), reverse=True))
+        cleaning = next(tx for tx in transactions if tx['description'] == 'Cleaning')
+        self.assertEqual((cleaning['type'], cleaning['processed_by']), ('out', 'System'))
+        sale_entry = next(tx for tx in transactions if tx['description'] == 'Sale #CF-2')
+        self.assertEqual((sale_entry['method'], sale_entry['processed_by']), ('M-Pesa', 'Jane Doe'))
+
+
+class SalesChannelsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.other_branch = Branch.objects.create(name="Other Branch", tax_id="P002")
+        self.manager = User.objects.create_user(username='manager', password='password',
+                                                role='manager', branch=self.branch)
+        self.client.force_authenticate(user=self.manager)
+
+    def create_payment(self, branch, method, amount, processed_at=None):
+        sale = Sale.objects.create(branch=branch, cashier=self.manager, total_amount=amount,
+                                   subtotal=amount, tax_amount=Decimal('0.00'), status='completed')
+        payment = Payment.objects.create(sale=sale, payment_method=method, amount=amount, status='completed')
+        if processed_at:
+            Payment.objects.filter(pk=payment.pk).update(processed_at=processed_at)
+        return payment
+
+    def test_channels_are_windowed_and_branch_scoped(self):
+        self.assertEqual(self.create_payment(self.branch, 'cash', Decimal('10.00')).branch, self.branch)
+        self.create_payment(self.branch, 'cash', Decimal('15.00'))
+        self.create_payment(self.branch, 'mpesa', Decimal('40.00'))
+        self.create_payment(self.other_branch, 'mpesa', Decimal('99.00'))
+        self.create_payment(self.branch, 'card', Decimal('500.00'), timezone.now() - timedelta(days=90))
+
+        response = self.client.get('/api/reports/sales-channels/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['name'], row['count'], row['amount']) for row in response.data],
+            [('Cash', 2, Decimal('25.00')), ('Mpesa', 1, Decimal('40.00'))]
+        )
+
+        old_day = timezone.localdate() - timedelta(days=90)
+        response = self.client.get('/api/reports/sales-channels/', {'date_from': old_day.isoformat(),
+                                                                    'date_to': old_day.isoformat()})
+        self.assertEqual([(row['name'], row['value']) for row in response.data], [('Card', 1)])
+
+
+@override_settings(DASHBOARD_WORKERS=1)
+class CompositeDashboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.manager = User.objects.create_user(username='manager', password='password',
+                                                role='manager', branch=self.branch)
+        self.client.force_authenticate(user=self.manager)
+        sale = Sale.objects.create(branch=self.branch, cashier=self.manager, total_amount=Decimal('100.00'),
+                                   subtotal=Decimal('100.00'), tax_amount=Decimal('0.00'), status='completed')
+        Payment.objects.create(sale=sale, payment_method='cash', amount=Decimal('100.00'), status='completed')
+
+    def test_composite_matches_individual_endpoints(self):
+        response = self.client.get('/api/reports/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats'], self.client.get('/api/reports/dashboard-stats/').data)
+        self.assertEqual(response.data['recent_activity'], self.client.get('/api/reports/recent-activity/').data)
+        self.assertEqual(response.data['revenue_chart'], self.client.get('/api/reports/revenue-chart/').data)
+        self.assertEqual(response.data['sales_channels'], self.client.get('/api/reports/sales-channels/').data)
+        self.assertEqual(response.data['stats']['totalOrders'], 1)
+
+        response = self.client.get('/api/reports/dashboard/', {'sections': 'stats,bogus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sections_are_cached_per_scope(self):
+        self.assertEqual(self.client.get('/api/reports/dashboard/').data['stats']['totalOrders'], 1)
+        Sale.objects.create(branch=self.branch, cashier=self.manager, total_amount=Decimal('50.00'),
+                            subtotal=Decimal('50.00'), tax_amount=Decimal('0.00'), status='completed')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/reports/dashboard/', {'sections': 'stats,revenue_chart'})
+        self.assertEqual(response.data['stats']['totalOrders'], 1)
+        self.assertFalse([q for q in queries if 'sales_sale' in q['sql']])
+
+        response = self.client.get('/api/reports/dashboard/', {'sections': 'stats', 'refresh': '1'})
+        self.assertEqual(response.data['stats']['totalOrders'], 2)
+
+
+@override_settings(DASHBOARD_WORKERS=4, DASHBOARD_CACHE_SECONDS={})
+class ConcurrentDashboardTest(TransactionTestCase):
+    def test_sections_run_on_thread_pool(self):
+        branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        admin = User.objects.create_user(username='admin', password='password', role='admin', branch=branch)
+        Sale.objects.create(branch=branch, cashier=admin, total_amount=Decimal('100.00'),
+                            subtotal=Decimal('100.00'), tax_amount=Decimal('0.00'), status='completed')
+
+        scope = DashboardScope(admin)
+        sequential = build_dashboard(scope, list(SECTIONS), workers=1)
+        concurrent = build_dashboard(scope, list(SECTIONS), workers=4)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(concurrent['stats']['totalOrders'], 1)
+
+
+class AnalyticsTest(TestCase):
+    """Readers must agree with live data whether or not the materialized views are used."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test Branch", tax_id="P001")
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+        category = Category.objects.create(name="Groceries")
+        self.bread = Product.objects.create(name="Bread", barcode="111", category=category,
+                                            price=Decimal('50.00'), cost_price=Decimal('30.00'), branch=self.branch)
+        self.milk = Product.objects.create(name="Milk", barcode="222", category=category,
+                                           price=Decimal('60.00'), cost_price=Decimal('40.00'), branch=self.branch)
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.create_sale(self.yesterday, self.bread, 2, 'cash', branch=self.branch)
+        self.create_sale(self.today, self.milk, 1, 'mpesa', branch=self.branch)
+        self.create_sale(self.today, self.bread, 1, 'cash', branch=None)
+
+    def create_sale(self, day, product, quantity, method, branch):
+        amount = product.price * quantity
+        sale = Sale.objects.create(branch=branch, cashier=self.cashier, total_amount=amount,
+                                   subtotal=amount, tax_amount=Decimal('0.00'), status='completed')
+        SaleItem.objects.create(sale=sale, product=product, quantity=quantity, unit_price=product.price,
+                                subtotal=amount, tax_amount=Decimal('0.00'))
+        payment = Payment.objects.create(sale=sale, payment_method=method, amount=amount, status='completed')
+        created_at = day_range(day)[0] + timedelta(hours=12)
+        Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+        Payment.objects.filter(pk=payment.pk).update(processed_at=created_at)
+
+    def test_split_by_refresh(self):
+        self.assertEqual(split_by_refresh('reports_sales_daily_mv', self.yesterday, self.today),
+                         (None, (self.yesterday, self.today)))
+
+        AnalyticsRefresh.objects.create(view_name='reports_sales_daily_mv', refreshed_at=timezone.now())
+        with patch('reports.analytics.materialized_views_enabled', return_value=True):
+            self.assertEqual(split_by_refresh('reports_sales_daily_mv', self.yesterday, self.today),
+                             ((self.yesterday, self.yesterday), (self.today, self.today)))
+            self.assertEqual(split_by_refresh('reports_sales_daily_mv', self.today, self.today),
+                             (None, (self.today, self.today)))
+            self.assertEqual(split_by_refresh('reports_sales_daily_mv', self.yesterday, self.yesterday),
+                             ((self.yesterday, self.yesterday), None))
+
+    def test_readers_aggregate_live_data(self):
+        days = sales_by_day(self.yesterday, self.today)
+        self.assertEqual(days[self.yesterday]['total_amount'], Decimal('100.00'))
+        self.assertEqual((days[self.today]['sales_count'], days[self.today]['total_amount']), (2, Decimal('110.00')))
+        self.assertEqual(sales_by_day(self.today, self.today, branch_id=0)[self.today]['sales_count'], 1)
+
+        self.assertEqual(
+            [(row['product_name'], row['quantity'], row['revenue']) for row in product_sales(self.yesterday, self.today)],
+            [('Bread', 3, Decimal('150.00')), ('Milk', 1, Decimal('60.00'))]
+        )
+        self.assertEqual(
+            [(row['payment_method'], row['count']) for row in payments_by_method(self.today, self.today, self.branch.id)],
+            [('mpesa', 1)]
+        )
+
+    def test_sales_summary_uses_readers(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='admin', password='password', role='admin'))
+        response = client.get('/api/reports/sales-summary/', {'period': 'week'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_transactions'], 3)
+        self.assertEqual(response.data['top_selling_products'][0]['product_name'], 'Bread')
+        self.assertEqual(response.data['top_selling_products'][0]['quantity_sold'], 3)
+
+    def test_refresh_command(self):
+        live = (sales_by_day(self.yesterday, self.today), product_sales(self.yesterday, self.today),
+                payments_by_method(self.yesterday, self.today))
+        out = StringIO()
+        call_command('refresh_analytics', stdout=out)
+        if not materialized_views_enabled():
+            self.assertIn('read live data', out.getvalue())
+            self.assertFalse(AnalyticsRefresh.objects.exists())
+            return
+
+        # Yesterday now comes from the views, today is still read live
+        self.assertEqual(AnalyticsRefresh.objects.count(), 3)
+        self.assertEqual(
+            (sales_by_day(self.yesterday, self.today), product_sales(self.yesterday, self.today),
+             payments_by_method(self.yesterday, self.today)),
+            live
+        )
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (daily_sales_report, cashier_performance, stock_alerts, 
                     tax_report, sales_summary, dashboard_stats, recent_activity,
-                    revenue_chart_data, sales_channels_data, cash_flow_report)
+                    revenue_chart_data, sales_channels_data, cash_flow_report, dashboard)
 
 urlpatterns = [
     path('daily-sales/', daily_sales_report, name='daily_sales_report'),
@@ -10,6 +10,7 @@ urlpatterns = [
     path('stock-alerts/', stock_alerts, name='stock_alerts'),
     path('tax-report/', tax_report, name='tax_report'),
     path('sales-summary/', sales_summary, name='sales_summary'),
+    path('dashboard/', dashboard, name='dashboard'),
     path('dashboard-stats/', dashboard_stats, name='dashboard_stats'),
     path('recent-activity/', recent_activity, name='recent_activity'),
     path('revenue-chart/', revenue_chart_data, name='revenue_chart_data'),
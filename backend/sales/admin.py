@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Discount, Sale, SaleItem, Return
+from .models import Discount, Sale, SaleItem, Return, ArchivedSale
 
 
 class SaleItemInline(admin.TabularInline):
@@ -50,3 +50,11 @@ class ReturnAdmin(admin.ModelAdmin):
     search_fields = ['return_number', 'original_sale__sale_number', 'customer__name']
     readonly_fields = ['return_number', 'created_at', 'updated_at', 'created_by', 'updated_by']
     date_hierarchy = 'created_at'
+
+
+@admin.register(ArchivedSale)
+class ArchivedSaleAdmin(admin.ModelAdmin):
+    list_display = ['sale_number', 'branch_id', 'total_amount', 'created_at', 'archive_file', 'archived_at']
+    search_fields = ['sale_number']
+    readonly_fields = ['sale_number', 'sale_id', 'branch_id', 'total_amount', 'created_at', 'archive_file', 'line',
+                       'archived_at']
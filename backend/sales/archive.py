@@ -0,0 +1,254 @@
+"""Cold storage for sales older than the retention window.
+
+Each sale is written with its items, payments (and M-Pesa transactions)
+and returns as one JSON line in ``<branch>/<YYYY-MM>.jsonl.gz`` under
+SALES_ARCHIVE_DIR, next to a ``.sha256`` checksum of the whole file. An
+`ArchivedSale` row records where the line lives and the line's own
+checksum, so a sale can still be found by number without hashing the file
+and, if needed, restored into the live tables.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import zlib
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from payments.models import Payment, MpesaTransaction
+from .models import Sale, SaleItem, Return, ArchivedSale
+
+logger = logging.getLogger('sales.archive')
+
+# Every model in a sale graph, keyed by its name in the archived JSON
+GRAPH_MODELS = {
+    'sale': Sale,
+    'items': SaleItem,
+    'payments': Payment,
+    'mpesa_transactions': MpesaTransaction,
+    'returns': Return,
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_file_for(sale):
+    """Relative path of the archive holding `sale`: one file per branch and local month."""
+    month = timezone.localtime(sale.created_at).strftime('%Y-%m')
+    return os.path.join(str(sale.branch_id or 0), f'{month}.jsonl.gz')
+
+
+def _absolute(archive_file):
+    return os.path.join(settings.SALES_ARCHIVE_DIR, archive_file)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    if os.path.exists(path):
+        with open(path, 'rb') as archive:
+            for chunk in iter(lambda: archive.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest
+
+
+def file_checksum(path):
+    return _file_digest(path).hexdigest()
+
+
+def line_checksum(line):
+    """SHA-256 of one archived line, as bytes including its newline."""
+    return hashlib.sha256(line).hexdigest()
+
+
+def write_checksum(archive_file, checksum=None):
+    """Replace the file's ``.sha256``; `checksum` saves rehashing when the caller already has it."""
+    path = _absolute(archive_file)
+    checksum = checksum or file_checksum(path)
+    # Written aside and renamed, so a crash never leaves a truncated checksum
+    with open(f'{path}.sha256.tmp', 'w') as checksum_file:
+        checksum_file.write(f'{checksum}  {os.path.basename(path)}\n')
+    os.replace(f'{path}.sha256.tmp', f'{path}.sha256')
+
+
+def verify_checksum(archive_file):
+    path = _absolute(archive_file)
+    try:
+        with open(f'{path}.sha256') as checksum:
+            expected = checksum.read().split()[0]
+        return file_checksum(path) == expected
+    except (OSError, IndexError):
+        return False
+
+
+def _count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with gzip.open(path, 'rb') as archive:
+        return sum(1 for _ in archive)
+
+
+def sale_graphs(sales):
+    """JSON-ready graphs for a batch of sales, in five queries."""
+    sale_ids = [sale.id for sale in sales]
+    related = {name: {} for name in GRAPH_MODELS if name != 'sale'}
+
+    items = SaleItem.objects.filter(sale_id__in=sale_ids).values().annotate(product_name=F('product__name'))
+    for item in items:
+        related['items'].setdefault(item['sale_id'], []).append(item)
+    payments = list(Payment.objects.filter(sale_id__in=sale_ids).values())
+    for payment in payments:
+        related['payments'].setdefault(payment['sale_id'], []).append(payment)
+    payment_sales = {payment['id']: payment['sale_id'] for payment in payments}
+    for mpesa in MpesaTransaction.objects.filter(payment_id__in=payment_sales).values():
+        related['mpesa_transactions'].setdefault(payment_sales[mpesa['payment_id']], []).append(mpesa)
+    for sale_return in Return.objects.filter(original_sale_id__in=sale_ids).values():
+        related['returns'].setdefault(sale_return['original_sale_id'], []).append(sale_return)
+
+    values = {row['id']: row for row in Sale.objects.filter(id__in=sale_ids).values()}
+    return [
+        {'sale': values[sale_id], **{name: rows.get(sale_id, []) for name, rows in related.items()}}
+        for sale_id in sale_ids
+    ]
+
+
+def archive_sales(before, batch_size=None, branch_id=None, dry_run=False):
+    """Move sales created before the aware datetime `before` to cold storage.
+
+    Works in batches: the batch is appended to its archive files and their
+    checksums refreshed first, then indexed and deleted in one transaction,
+    so a failure never loses a sale and every indexed sale is covered by
+    its file's checksum. Returns `{'archived': n, 'files': [...]}`.
+    """
+    batch_size = batch_size or settings.SALES_ARCHIVE_BATCH_SIZE
+    sales = Sale.objects.filter(created_at__lt=before)
+    if branch_id is not None:
+        sales = sales.filter(branch_id=branch_id)
+    if dry_run:
+        return {'archived': sales.count(), 'files': []}
+
+    line_counts = {}
+    digests = {}
+    archived = 0
+    while True:
+        batch = list(sales.order_by('id').only('id', 'branch_id', 'created_at')[:batch_size])
+        if not batch:
+            break
+
+        by_file = {}
+        for sale, graph in zip(batch, sale_graphs(batch)):
+            by_file.setdefault(archive_file_for(sale), []).append(graph)
+
+        index = []
+        for archive_file, graphs in by_file.items():
+            path = _absolute(archive_file)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if archive_file not in line_counts:
+                line_counts[archive_file] = _count_lines(path)
+                digests[archive_file] = _file_digest(path)
+
+            lines = []
+            for graph in graphs:
+                line = (json.dumps(graph, cls=DjangoJSONEncoder) + '\n').encode('utf-8')
+                lines.append(line)
+                sale = graph['sale']
+                index.append(ArchivedSale(
+                    sale_number=sale['sale_number'], sale_id=sale['id'], branch_id=sale['branch_id'],
+                    cashier_id=sale['cashier_id'], total_amount=sale['total_amount'], created_at=sale['created_at'],
+                    archive_file=archive_file, line=line_counts[archive_file], checksum=line_checksum(line)
+                ))
+                line_counts[archive_file] += 1
+
+            # Each batch is appended as its own gzip member; readers see one continuous stream
+            member = gzip.compress(b''.join(lines))
+            with open(path, 'ab') as archive:
+                archive.write(member)
+                archive.flush()
+                os.fsync(archive.fileno())
+            digests[archive_file].update(member)
+            write_checksum(archive_file, digests[archive_file].hexdigest())
+
+        with transaction.atomic():
+            ArchivedSale.objects.bulk_create(index)
+            delete_sales([sale.id for sale in batch])
+        archived += len(batch)
+        logger.info('Archived %s sales (%s so far)', len(batch), archived)
+
+    return {'archived': archived, 'files': sorted(line_counts)}
+
+
+def delete_sales(sale_ids):
+    # Returns and payments protect the sale, so they go first; items and
+    # M-Pesa transactions cascade, ledger and loyalty references are nulled
+    Return.objects.filter(original_sale_id__in=sale_ids).delete()
+    Payment.objects.filter(sale_id__in=sale_ids).delete()
+    Sale.objects.filter(id__in=sale_ids).delete()
+
+
+def find_archived_sale(sale_number):
+    """The archived graph of `sale_number`, or None if it was never archived.
+
+    Only the sale's line is checked against its checksum; entries archived
+    before lines had one fall back to checking the whole file. Raises
+    ArchiveError if the archive file is missing or the line is corrupt.
+    """
+    entry = ArchivedSale.objects.filter(sale_number=sale_number).first()
+    if not entry:
+        return None
+
+    corrupt = ArchiveError(f'Archive {entry.archive_file} is missing or corrupt')
+    if not entry.checksum and not verify_checksum(entry.archive_file):
+        raise corrupt
+
+    try:
+        with gzip.open(_absolute(entry.archive_file), 'rb') as archive:
+            for number, line in enumerate(archive):
+                if number == entry.line:
+                    if entry.checksum and line_checksum(line) != entry.checksum:
+                        raise corrupt
+                    return json.loads(line)
+    except (OSError, EOFError, zlib.error):
+        raise corrupt
+    raise ArchiveError(f'Archive {entry.archive_file} has no line {entry.line}')
+
+
+def _restore_rows(model, rows):
+    objects = model.objects.bulk_create([
+        model(**{field.attname: row[field.attname] for field in model._meta.concrete_fields})
+        for row in rows
+    ])
+    # bulk_create stamps auto_now(_add) fields with the current time; put the originals back
+    stamped = [field.attname for field in model._meta.concrete_fields
+               if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    if stamped:
+        for row in rows:
+            model.objects.filter(pk=row['id']).update(**{name: row[name] for name in stamped})
+    return objects
+
+
+def restore_archived_sale(sale_number):
+    """Put an archived sale graph back into the live tables and drop its index entry.
+
+    Returns the restored Sale. Raises ArchiveError when the sale is not
+    archived or cannot be restored as it was.
+    """
+    graph = find_archived_sale(sale_number)
+    if graph is None:
+        raise ArchiveError(f'Sale {sale_number} is not archived')
+    if Sale.objects.filter(sale_number=sale_number).exists():
+        raise ArchiveError(f'Sale {sale_number} already exists')
+
+    try:
+        with transaction.atomic():
+            for name, model in GRAPH_MODELS.items():
+                rows = [graph['sale']] if name == 'sale' else graph[name]
+                _restore_rows(model, rows)
+            ArchivedSale.objects.filter(sale_number=sale_number).delete()
+    except IntegrityError as e:
+        # e.g. a product, customer or user the sale refers to has since been deleted
+        raise ArchiveError(f'Sale {sale_number} cannot be restored: {e}')
+    return Sale.objects.get(sale_number=sale_number)
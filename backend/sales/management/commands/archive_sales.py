@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.dates import local_today, month_start, previous_month, parse_date, start_of_day
+from sales.archive import archive_sales, verify_checksum
+from sales.models import ArchivedSale
+
+
+class Command(BaseCommand):
+    help = 'Move sales older than the retention window to compressed, checksummed archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive sales created before this local date (YYYY-MM-DD); '
+                                             'defaults to the start of the retention window')
+        parser.add_argument('--branch', type=int, help='Only archive sales of this branch')
+        parser.add_argument('--batch-size', type=int, help='Sales written and deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the sales that would be archived')
+        parser.add_argument('--verify', action='store_true', help='Check the checksum of every archive file instead')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+
+        try:
+            before = parse_date(options['before'])
+        except ValueError:
+            raise CommandError('--before must be YYYY-MM-DD')
+        if not before:
+            before = month_start(local_today())
+            for _ in range(settings.SALES_RETENTION_MONTHS):
+                before = previous_month(before)
+
+        result = archive_sales(start_of_day(before), batch_size=options['batch_size'],
+                               branch_id=options['branch'], dry_run=options['dry_run'])
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f"{verb} {result['archived']} sales created before {before}")
+        for archive_file in result['files']:
+            self.stdout.write(f"  {archive_file}")
+
+    def verify(self):
+        files = ArchivedSale.objects.values_list('archive_file', flat=True).distinct().order_by('archive_file')
+        corrupt = [archive_file for archive_file in files if not verify_checksum(archive_file)]
+        for archive_file in corrupt:
+            self.stderr.write(f"Checksum mismatch or missing file: {archive_file}")
+        if corrupt:
+            raise CommandError(f'{len(corrupt)} archive file(s) failed verification')
+        self.stdout.write(f"{len(files)} archive file(s) verified")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from sales.models import ReceiptBlock
+from sales.numbering import PREFIXES, audit_receipt_numbers, format_receipt_number
+
+
+class Command(BaseCommand):
+    help = 'Audit sequential receipt numbers for gaps against the reserved number blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(PREFIXES), help='Only audit this document kind')
+        parser.add_argument('--branch', type=int, help='Only audit this branch (0 for no branch)')
+        parser.add_argument('--limit', type=int, default=50, help='Maximum gaps to list per branch')
+
+    def handle(self, *args, **options):
+        scopes = ReceiptBlock.objects.values_list('kind', 'branch_id').distinct().order_by('kind', 'branch_id')
+        if options['kind']:
+            scopes = scopes.filter(kind=options['kind'])
+        if options['branch'] is not None:
+            scopes = scopes.filter(branch_id=options['branch'])
+
+        unallocated = 0
+        for kind, branch_id in scopes:
+            result = audit_receipt_numbers(kind, branch_id)
+            missing = sum(last - first + 1 for first, last in result['missing'])
+            self.stdout.write(
+                f"{kind} branch={branch_id}: issued={result['issued']} missing={missing} "
+                f"unused={result['unused']} unallocated={len(result['unallocated'])}"
+            )
+            for first, last in result['missing'][:options['limit']]:
+                first, last = (format_receipt_number(kind, branch_id, number) for number in (first, last))
+                self.stdout.write(f"  missing {first}" + (f" .. {last}" if last != first else ''))
+            for number in result['unallocated'][:options['limit']]:
+                self.stdout.write(f"  outside any block {format_receipt_number(kind, branch_id, number)}")
+            unallocated += len(result['unallocated'])
+
+        if unallocated:
+            raise CommandError(f'{unallocated} receipt number(s) were issued outside a reserved block')
@@ -0,0 +1,56 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from sales.numbering import format_receipt_number
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput into a unique receipt number index for uuid4 and sequential keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Rows inserted per key style (e.g. 10000000)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per insert batch and transaction')
+
+    def handle(self, *args, **options):
+        styles = {
+            'uuid4': lambda n: f"SALE-{uuid.uuid4().hex[:12].upper()}",
+            'sequential': lambda n: format_receipt_number('sale', 1, n),
+        }
+        for style, make_key in styles.items():
+            table = f'bench_receipt_{style}'
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                cursor.execute(f'CREATE TABLE {table} (sale_number VARCHAR(50) NOT NULL UNIQUE)')
+            try:
+                self.run(style, table, make_key, options['rows'], options['batch_size'])
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def run(self, style, table, make_key, rows, batch_size):
+        # Throughput of the last tenth shows how inserts cope once the index is large
+        tail_from = rows - rows // 10
+        started = time.perf_counter()
+        tail_started = started
+        inserted = 0
+        while inserted < rows:
+            count = min(batch_size, rows - inserted)
+            keys = [(make_key(inserted + i + 1),) for i in range(count)]
+            if inserted <= tail_from < inserted + count:
+                tail_started = time.perf_counter()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {table} (sale_number) VALUES (%s)', keys)
+            inserted += count
+        finished = time.perf_counter()
+
+        line = (f"{style:>10}: {rows} rows in {finished - started:.2f}s, "
+                f"{rows / (finished - started):,.0f} rows/s overall, "
+                f"{(rows - tail_from) / max(finished - tail_started, 1e-9):,.0f} rows/s for the last 10%")
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_relation_size(indexrelid) FROM pg_index WHERE indrelid = %s::regclass", [table]
+                )
+                line += f", index {cursor.fetchone()[0] / 1024 / 1024:.1f} MB"
+        self.stdout.write(line)
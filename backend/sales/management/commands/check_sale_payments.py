@@ -0,0 +1,60 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from payments.models import Payment
+from sales.models import Sale
+
+
+class Command(BaseCommand):
+    help = 'Verify Sale.amount_paid and Sale.change_given against completed payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched totals from payments')
+        parser.add_argument('--limit', type=int, default=50, help='Maximum mismatches to list')
+
+    def handle(self, *args, **options):
+        money = models.DecimalField(max_digits=15, decimal_places=2)
+        paid = (
+            Payment.objects.filter(sale=OuterRef('pk'), status='completed')
+            .values('sale')
+            .annotate(total=Sum('amount'))
+            .values('total')
+        )
+        sales = Sale.objects.annotate(
+            expected_paid=Coalesce(Subquery(paid, output_field=money), Value(Decimal('0.00')), output_field=money)
+        ).annotate(
+            expected_change=Greatest(F('expected_paid') - F('total_amount'), Value(Decimal('0.00')),
+                                     output_field=money)
+        )
+        mismatched = sales.filter(
+            ~Q(amount_paid=F('expected_paid')) | ~Q(change_given=F('expected_change'))
+        ).only('id', 'sale_number', 'amount_paid', 'change_given', 'total_amount').order_by('id')
+
+        count = 0
+        to_fix = []
+        for sale in mismatched.iterator(chunk_size=2000):
+            count += 1
+            if count <= options['limit']:
+                self.stdout.write(
+                    f"{sale.sale_number}: amount_paid={sale.amount_paid} expected={sale.expected_paid}, "
+                    f"change_given={sale.change_given} expected={sale.expected_change}"
+                )
+            if options['fix']:
+                sale.amount_paid = sale.expected_paid
+                sale.change_given = sale.expected_change
+                to_fix.append(sale)
+                if len(to_fix) >= 500:
+                    Sale.objects.bulk_update(to_fix, ['amount_paid', 'change_given'])
+                    to_fix = []
+
+        if to_fix:
+            Sale.objects.bulk_update(to_fix, ['amount_paid', 'change_given'])
+
+        if not count:
+            self.stdout.write(self.style.SUCCESS('All sale payment totals are consistent'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {count} sales'))
+        else:
+            raise CommandError(f'{count} sales have inconsistent payment totals (rerun with --fix to repair)')
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:41
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_paid(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    Payment = apps.get_model('payments', 'Payment')
+    paid = (
+        Payment.objects.filter(sale=OuterRef('pk'), status='completed')
+        .values('sale')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    Sale.objects.update(
+        amount_paid=Coalesce(Subquery(paid), Value(Decimal('0.00')), output_field=models.DecimalField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_alter_saleitem_tax_rate'),
+        ('payments', '0003_payment_status_processed_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Running total of completed payments', max_digits=15),
+        ),
+        migrations.RunPython(backfill_amount_paid, migrations.RunPython.noop),
+    ]
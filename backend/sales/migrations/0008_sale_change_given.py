@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:43
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_change_given(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    Sale.objects.filter(amount_paid__gt=F('total_amount')).update(
+        change_given=F('amount_paid') - F('total_amount')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_sale_amount_paid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='change_given',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Amount paid in excess of the total', max_digits=15),
+        ),
+        migrations.RunPython(backfill_change_given, migrations.RunPython.noop),
+    ]
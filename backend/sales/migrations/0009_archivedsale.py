@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_sale_change_given'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_number', models.CharField(max_length=50, unique=True)),
+                ('sale_id', models.IntegerField(help_text='Primary key the sale had before archiving')),
+                ('branch_id', models.IntegerField(blank=True, null=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField()),
+                ('archive_file', models.CharField(max_length=255)),
+                ('line', models.IntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['archive_file', 'line'], name='sales_archi_archive_da6e7e_idx')],
+            },
+        ),
+    ]
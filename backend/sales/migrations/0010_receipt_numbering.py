@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_archivedsale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('return', 'Return')], max_length=10)),
+                ('branch_id', models.IntegerField(default=0)),
+                ('first_number', models.BigIntegerField()),
+                ('last_number', models.BigIntegerField()),
+                ('holder', models.CharField(blank=True, help_text='Host and process that reserved the block', max_length=100)),
+                ('allocated_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['kind', 'branch_id', 'first_number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceiptCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('return', 'Return')], max_length=10)),
+                ('branch_id', models.IntegerField(default=0, help_text='0 for documents without a branch')),
+                ('next_number', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='receiptcounter',
+            constraint=models.UniqueConstraint(fields=('kind', 'branch_id'), name='unique_receipt_counter'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptblock',
+            index=models.Index(fields=['kind', 'branch_id', 'first_number'], name='sales_recei_kind_caa5ae_idx'),
+        ),
+    ]
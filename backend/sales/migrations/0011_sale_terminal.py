@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifts', '0004_terminal_shift_terminal'),
+        ('sales', '0010_receipt_numbering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='terminal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='shifts.terminal'),
+        ),
+    ]
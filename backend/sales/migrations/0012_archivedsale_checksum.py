@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_sale_terminal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsale',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_archivedsale_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsale',
+            name='cashier_id',
+            field=models.IntegerField(blank=True, help_text='Empty for sales archived before it was kept', null=True),
+        ),
+    ]
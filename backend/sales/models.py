@@ -4,11 +4,11 @@ from decimal import Decimal
 from core.models import AuditMixin, Branch, User
 from customers.models import Customer
 from inventory.models import Product
-import uuid
 from django.db import transaction
 from inventory.models import StockMovement
 from customers.models import LoyaltyTransaction
 from django.utils import timezone
+from core.tracing import span
 import hashlib
 import shutil
 import qrcode
@@ -76,9 +76,14 @@ class Sale(AuditMixin):
     tax_amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
     discount_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     total_amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
+    amount_paid = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'),
+                                      help_text="Running total of completed payments")
+    change_given = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'),
+                                       help_text="Amount paid in excess of the total")
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     shift = models.ForeignKey('shifts.Shift', on_delete=models.SET_NULL, null=True, related_name='sales')
+    terminal = models.ForeignKey('shifts.Terminal', on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     
     notes = models.TextField(blank=True)
     
@@ -96,7 +101,8 @@ class Sale(AuditMixin):
     
     def save(self, *args, **kwargs):
         if not self.sale_number:
-            self.sale_number = f"SALE-{uuid.uuid4().hex[:12].upper()}"
+            from .numbering import next_receipt_number
+            self.sale_number = next_receipt_number('sale', self.branch_id)
         super().save(*args, **kwargs)
 
     # eTIMS / KRA related fields
@@ -115,58 +121,103 @@ class Sale(AuditMixin):
         if self.status == 'completed':
             return
 
+        with span('sale.finalize', sale=self.sale_number):
+            self._finalize(user)
+
+    def _finalize(self, user):
+        # Re-check under a row lock so concurrent payments finalize only once
+        current_status = Sale.objects.select_for_update().values_list('status', flat=True).get(pk=self.pk)
+        if current_status == 'completed':
+            self.status = current_status
+            return
+
         # Decrement stock and create movements
-        for item in self.items.select_related('product').all():
-            if not item.is_ad_hoc and item.product:
-                product = Product.objects.select_for_update().get(id=item.product.id)
-                if product.stock_quantity < item.quantity:
-                    raise ValueError(f'Insufficient stock for {product.name}.')
-                previous_quantity = product.stock_quantity
-                product.stock_quantity -= item.quantity
-                product.save()
-
-                StockMovement.objects.create(
-                    product=product,
-                    movement_type='sale',
-                    quantity=-item.quantity,
-                    previous_quantity=previous_quantity,
-                    new_quantity=product.stock_quantity,
-                    reason=f'Sale {self.sale_number}',
-                    reference_id=self.sale_number,
-                    branch=self.branch or product.branch,
-                    created_by=user
-                )
+        with span('checkout.stock'):
+            for item in self.items.select_related('product').all():
+                if not item.is_ad_hoc and item.product:
+                    product = Product.objects.select_for_update().get(id=item.product.id)
+                    if product.stock_quantity < item.quantity:
+                        raise ValueError(f'Insufficient stock for {product.name}.')
+                    previous_quantity = product.stock_quantity
+                    product.stock_quantity -= item.quantity
+                    product.save()
+
+                    StockMovement.objects.create(
+                        product=product,
+                        movement_type='sale',
+                        quantity=-item.quantity,
+                        previous_quantity=previous_quantity,
+                        new_quantity=product.stock_quantity,
+                        reason=f'Sale {self.sale_number}',
+                        reference_id=self.sale_number,
+                        branch=self.branch or product.branch,
+                        created_by=user
+                    )
 
         # Award loyalty points
-        if self.customer:
-            points_earned = int(self.total_amount / 100)
-            if points_earned > 0:
-                previous_points = self.customer.total_points
-                self.customer.total_points += points_earned
-                self.customer.lifetime_purchases += self.total_amount
-                self.customer.save()
-
-                LoyaltyTransaction.objects.create(
-                    customer=self.customer,
-                    points=points_earned,
-                    transaction_type='earn',
-                    sale=self,
-                    description=f'Earned from sale {self.sale_number}',
-                    previous_points=previous_points,
-                    new_points=self.customer.total_points,
-                    created_by=user
-                )
+        with span('checkout.loyalty', customer=bool(self.customer_id)):
+            if self.customer:
+                points_earned = int(self.total_amount / 100)
+                if points_earned > 0:
+                    previous_points = self.customer.total_points
+                    self.customer.total_points += points_earned
+                    self.customer.lifetime_purchases += self.total_amount
+                    self.customer.save()
+
+                    LoyaltyTransaction.objects.create(
+                        customer=self.customer,
+                        points=points_earned,
+                        transaction_type='earn',
+                        sale=self,
+                        description=f'Earned from sale {self.sale_number}',
+                        previous_points=previous_points,
+                        new_points=self.customer.total_points,
+                        created_by=user
+                    )
 
-                self.customer.update_tier()
+                    self.customer.update_tier()
 
         # Mark sale completed and update shift totals
         self.status = 'completed'
-        self.save()
+        self.save(update_fields=['status', 'updated_at'])
+
+        with span('checkout.shift_update'):
+            if self.shift_id:
+                from shifts.models import Shift
+                Shift.objects.filter(pk=self.shift_id).update(
+                    total_sales=models.F('total_sales') + self.total_amount,
+                    total_transactions=models.F('total_transactions') + 1
+                )
 
-        if self.shift:
-            self.shift.total_sales += self.total_amount
-            self.shift.total_transactions += 1
-            self.shift.save()
+    def register_payment(self, payment, user=None):
+        """Add a completed payment to `amount_paid` and `change_given` under a row
+        lock, post it to the shift ledger and finalize the sale once it is fully
+        paid. Callers should run inside a transaction so the payment, the running
+        totals and the ledger entries commit together.
+        """
+        with transaction.atomic():
+            sale = Sale.objects.select_for_update().select_related('shift').get(pk=self.pk)
+            previous_change = sale.change_given
+            sale.amount_paid += payment.amount
+            sale.change_given = max(sale.amount_paid - sale.total_amount, Decimal('0.00'))
+            sale.save(update_fields=['amount_paid', 'change_given', 'updated_at'])
+
+            if sale.shift:
+                with span('checkout.shift_ledger'):
+                    sale.shift.record_transaction('sale', payment.amount, payment.payment_method,
+                                                  sale=sale, payment=payment, user=user)
+                    if sale.change_given > previous_change:
+                        sale.shift.record_transaction('change', sale.change_given - previous_change,
+                                                      sale=sale, payment=payment, user=user)
+        self.amount_paid = sale.amount_paid
+        self.change_given = sale.change_given
+
+        # Finalize outside the increment's savepoint so a stock error does not
+        # discard the payment that was already taken.
+        if sale.amount_paid >= sale.total_amount:
+            sale.finalize(user=user)
+            self.status = sale.status
+        return sale
 
     def simulate_etims(self):
         """Create a simulated eTIMS response (for testing / sandbox).
@@ -267,5 +318,76 @@ class Return(AuditMixin):
     
     def save(self, *args, **kwargs):
         if not self.return_number:
-            self.return_number = f"RTN-{uuid.uuid4().hex[:12].upper()}"
+            from .numbering import next_receipt_number
+            self.return_number = next_receipt_number('return', self.branch_id)
         super().save(*args, **kwargs)
+
+
+class ArchivedSale(models.Model):
+    """Index entry for a sale moved to cold storage by `archive_sales`.
+
+    `archive_file` is relative to SALES_ARCHIVE_DIR and `line` is the
+    zero-based line of the sale's JSON graph in that gzipped file, whose
+    SHA-256 is `checksum` (empty for sales archived before it was kept).
+    """
+    sale_number = models.CharField(max_length=50, unique=True)
+    sale_id = models.IntegerField(help_text="Primary key the sale had before archiving")
+    branch_id = models.IntegerField(null=True, blank=True)
+    cashier_id = models.IntegerField(null=True, blank=True, help_text="Empty for sales archived before it was kept")
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField()
+    archive_file = models.CharField(max_length=255)
+    line = models.IntegerField()
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['archive_file', 'line']),
+        ]
+
+    def __str__(self):
+        return f"Archived sale {self.sale_number} ({self.archive_file}:{self.line})"
+
+
+class ReceiptCounter(models.Model):
+    """Next unallocated receipt number per branch and document kind.
+
+    Numbers are handed out in blocks (see sales/numbering.py), so this row is
+    locked once per block rather than once per sale.
+    """
+    KIND_CHOICES = [
+        ('sale', 'Sale'),
+        ('return', 'Return'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    branch_id = models.IntegerField(default=0, help_text="0 for documents without a branch")
+    next_number = models.BigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'branch_id'], name='unique_receipt_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} counter for branch {self.branch_id}: next {self.next_number}"
+
+
+class ReceiptBlock(models.Model):
+    """A range of receipt numbers reserved by one server process, kept for gap audits."""
+    kind = models.CharField(max_length=10, choices=ReceiptCounter.KIND_CHOICES)
+    branch_id = models.IntegerField(default=0)
+    first_number = models.BigIntegerField()
+    last_number = models.BigIntegerField()
+    holder = models.CharField(max_length=100, blank=True, help_text="Host and process that reserved the block")
+    allocated_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['kind', 'branch_id', 'first_number']
+        indexes = [
+            models.Index(fields=['kind', 'branch_id', 'first_number']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.branch_id}: {self.first_number}-{self.last_number}"
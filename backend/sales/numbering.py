@@ -0,0 +1,168 @@
+"""Sequential, per-branch receipt numbers.
+
+Numbers look like ``SALE-003-000001234``: document prefix, branch and a
+counter that only grows within that branch, so new rows land at the end of
+the ``sale_number`` index instead of at random positions as uuid4 keys did.
+
+Each process reserves a block of RECEIPT_BLOCK_SIZE numbers from the
+branch's `ReceiptCounter` row and hands them out from memory, so the row is
+locked once per block rather than once per sale. A checkout that rolls back
+loses only its own number; the rest of the block stays in use unless the
+block itself was reserved by that checkout. Numbers left over when a
+process stops show up as gaps in `audit_receipt_numbers`, which can tell
+them apart from numbers that went missing inside a used range.
+"""
+import heapq
+import os
+import re
+import socket
+import threading
+from django.conf import settings
+from django.db import transaction
+from .models import Sale, Return, ArchivedSale, ReceiptCounter, ReceiptBlock
+
+PREFIXES = {
+    'sale': 'SALE',
+    'return': 'RTN',
+}
+
+NUMBER_PATTERN = re.compile(r'^(?P<prefix>[A-Z]+)-(?P<branch>\d{3,})-(?P<number>\d{9,})$')
+
+_blocks = {}
+_lock = threading.Lock()
+
+
+def format_receipt_number(kind, branch_id, number):
+    return f'{PREFIXES[kind]}-{branch_id or 0:03d}-{number:09d}'
+
+
+def parse_receipt_number(value):
+    """`(kind, branch_id, number)` for a sequential receipt number, or None for any other format."""
+    match = NUMBER_PATTERN.match(value or '')
+    if not match:
+        return None
+    kinds = {prefix: kind for kind, prefix in PREFIXES.items()}
+    if match.group('prefix') not in kinds:
+        return None
+    return kinds[match.group('prefix')], int(match.group('branch')), int(match.group('number'))
+
+
+def _holder():
+    return f'{socket.gethostname()}:{os.getpid()}'[:100]
+
+
+def allocate_block(kind, branch_id, size=None):
+    """Reserve the next `size` numbers for this process; returns `[first, last]`."""
+    size = size or settings.RECEIPT_BLOCK_SIZE
+    branch_id = branch_id or 0
+    with transaction.atomic():
+        counter, _ = ReceiptCounter.objects.get_or_create(kind=kind, branch_id=branch_id)
+        counter = ReceiptCounter.objects.select_for_update().get(pk=counter.pk)
+        first = counter.next_number
+        counter.next_number = first + size
+        counter.save(update_fields=['next_number'])
+        ReceiptBlock.objects.create(kind=kind, branch_id=branch_id, first_number=first,
+                                    last_number=first + size - 1, holder=_holder())
+    return [first, first + size - 1]
+
+
+def next_receipt_number(kind, branch_id):
+    """Next receipt number for `kind` in `branch_id`, taken from this process's block."""
+    key = (kind, branch_id or 0)
+    with _lock:
+        block = _blocks.pop(key, None)
+    reserved = block is None
+    if reserved:
+        block = allocate_block(kind, branch_id)
+
+    number = block[0]
+    if number < block[1]:
+        remaining = [number + 1, block[1]]
+
+        def keep_remaining():
+            with _lock:
+                _blocks.setdefault(key, remaining)
+
+        if reserved:
+            # The counter update commits or rolls back with the surrounding
+            # transaction, so only reuse the rest of the block once it is durable
+            transaction.on_commit(keep_remaining)
+        else:
+            # Reserved by an earlier, committed transaction: ours whatever happens here
+            keep_remaining()
+    return format_receipt_number(kind, branch_id, number)
+
+
+def hold_block(kind, branch_id, size=None):
+    """Reserve a block and hand numbers out from it, as if a committed checkout had reserved it.
+
+    For checkouts run inside a transaction that never commits, such as the
+    benchmarks, where the rest of a new block would never be kept.
+    """
+    block = allocate_block(kind, branch_id, size)
+    with _lock:
+        _blocks[(kind, branch_id or 0)] = block
+    return block
+
+
+def reset_blocks():
+    """Forget this process's reserved blocks (their unused numbers become audit gaps)."""
+    with _lock:
+        _blocks.clear()
+
+
+def _issued_numbers(kind, branch_id):
+    """Numbers issued for `kind` in `branch_id`, ascending, streamed from the index."""
+    prefix = f'{PREFIXES[kind]}-{branch_id:03d}-'
+    if kind == 'sale':
+        sources = [Sale.objects.values_list('sale_number', flat=True),
+                   ArchivedSale.objects.values_list('sale_number', flat=True)]
+        field = 'sale_number'
+    else:
+        sources = [Return.objects.values_list('return_number', flat=True)]
+        field = 'return_number'
+    # Zero padding keeps string order equal to numeric order
+    streams = [
+        (int(value[len(prefix):]) for value in
+         source.filter(**{f'{field}__startswith': prefix}).order_by(field).iterator(chunk_size=5000))
+        for source in sources
+    ]
+    return heapq.merge(*streams)
+
+
+def audit_receipt_numbers(kind, branch_id):
+    """Compare issued numbers with the reserved blocks of one branch.
+
+    Returns a dict with:
+    - `issued`: how many numbers are in use (live or archived)
+    - `missing`: `(first, last)` ranges never issued although later numbers of
+      the same block were, e.g. checkouts that rolled back
+    - `unused`: numbers at the end of blocks that were never handed out
+      because the process holding them stopped
+    - `unallocated`: issued numbers that lie outside every reserved block
+    """
+    blocks = ReceiptBlock.objects.filter(kind=kind, branch_id=branch_id).order_by('first_number')
+    result = {'issued': 0, 'missing': [], 'unused': 0, 'unallocated': []}
+    numbers = _issued_numbers(kind, branch_id)
+    pending = next(numbers, None)
+
+    for block in blocks.iterator():
+        while pending is not None and pending < block.first_number:
+            result['unallocated'].append(pending)
+            result['issued'] += 1
+            pending = next(numbers, None)
+
+        expected = block.first_number
+        while pending is not None and pending <= block.last_number:
+            if pending > expected:
+                result['missing'].append((expected, pending - 1))
+            expected = pending + 1
+            result['issued'] += 1
+            pending = next(numbers, None)
+        result['unused'] += block.last_number - expected + 1
+
+    while pending is not None:
+        result['unallocated'].append(pending)
+        result['issued'] += 1
+        pending = next(numbers, None)
+    return result
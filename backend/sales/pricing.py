@@ -0,0 +1,20 @@
+"""Line pricing for tax-inclusive shelf prices.
+
+Shelf prices already contain VAT, so a line's tax is extracted from its
+total rather than added on top: at 16% a line of KES 116.00 carries
+KES 16.00 of VAT.
+"""
+from decimal import Decimal
+
+HUNDRED = Decimal('100.00')
+
+
+def included_tax(amount, tax_rate):
+    """VAT contained in the tax-inclusive `amount` at `tax_rate` percent (unrounded)."""
+    return amount * (tax_rate / (HUNDRED + tax_rate))
+
+
+def price_line(unit_price, quantity, discount, tax_rate):
+    """`(subtotal, tax_amount)` of one sale line after its discount."""
+    subtotal = (unit_price * quantity) - discount
+    return subtotal, included_tax(subtotal, tax_rate)
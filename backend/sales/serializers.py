@@ -53,10 +53,10 @@ class SaleSerializer(serializers.ModelSerializer):
         model = Sale
         fields = ['id', 'sale_number', 'branch', 'branch_name', 'cashier', 'cashier_name', 
               'customer', 'customer_details', 'subtotal', 'tax_amount', 'discount_amount', 
-              'total_amount', 'status', 'status_display', 'shift', 'notes', 'items', 
+              'total_amount', 'amount_paid', 'change_given', 'status', 'status_display', 'shift', 'notes', 'items', 
                   'etims_response', 'rcpt_signature', 'etims_qr', 'etims_qr_image', 'etims_submitted', 'etims_submitted_at',
               'created_at', 'updated_at']
-        read_only_fields = ['sale_number', 'created_at', 'updated_at']
+        read_only_fields = ['sale_number', 'amount_paid', 'change_given', 'created_at', 'updated_at']
     
     def get_cashier_name(self, obj):
         return obj.cashier.get_full_name() or obj.cashier.username
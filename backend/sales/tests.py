@@ -1,10 +1,25 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from django.urls import reverse
 
 from core.models import Branch, User
 from inventory.models import Product, StockMovement
-from sales.models import Sale, SaleItem
+from sales import archive
+from sales.models import Sale, SaleItem, ArchivedSale, ReceiptBlock
+from sales.numbering import parse_receipt_number, next_receipt_number, reset_blocks, audit_receipt_numbers
+from sales.pricing import included_tax, price_line
+from payments.models import Payment
+from core.tracing import load_traces
 
 
 class SalesAPITest(TestCase):
@@ -92,3 +107,248 @@ class SalesAPITest(TestCase):
 		self.assertEqual(response.data['week']['count'], 1)
 		self.assertEqual(float(response.data['week']['total']), 200.00)
 
+	def test_sales_statistics_windows_in_one_query(self):
+		for created_at in [datetime(2024, 1, 1, 21, 0, tzinfo=dt_timezone.utc), datetime(2024, 1, 5, 9, 0, tzinfo=dt_timezone.utc)]:
+			sale = Sale.objects.create(branch=self.branch, cashier=self.user, total_amount=Decimal('50.00'),
+									   subtotal=Decimal('50.00'), tax_amount=Decimal('0.00'))
+			Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get('/api/sales/statistics/', {
+				'date': '2024-01-02',
+				'windows': '2024-01-02,2024-01-01..2024-01-07,month'
+			})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len([q for q in queries if 'sales_sale' in q['sql']]), 1)
+		self.assertEqual(response.data['custom']['count'], 1)
+		self.assertEqual(response.data['windows']['2024-01-02']['count'], 1)
+		self.assertEqual(response.data['windows']['2024-01-01..2024-01-07']['count'], 2)
+		self.assertEqual(response.data['windows']['2024-01-01..2024-01-07']['total'], Decimal('100.00'))
+		self.assertEqual(response.data['windows']['month']['count'], 0)
+
+		response = self.client.get('/api/sales/statistics/', {'windows': '2024-01-07..2024-01-01'})
+		self.assertEqual(response.status_code, 400)
+
+
+	def test_split_tender_maintains_paid_and_change(self):
+		sale = Sale.objects.create(
+			branch=self.branch,
+			cashier=self.user,
+			subtotal=Decimal('200.00'),
+			tax_amount=Decimal('0.00'),
+			total_amount=Decimal('200.00'),
+			created_by=self.user
+		)
+		SaleItem.objects.create(sale=sale, product=self.product, quantity=2,
+								unit_price=Decimal('100.00'), subtotal=Decimal('200.00'))
+
+		card_resp = self.client.post('/api/payments/', {'sale_id': sale.id, 'payment_method': 'card', 'amount': '150.00'}, format='json')
+		self.assertEqual(card_resp.status_code, 201)
+		over_resp = self.client.post('/api/payments/', {'sale_id': sale.id, 'payment_method': 'mpesa', 'amount': '100.00'}, format='json')
+		self.assertEqual(over_resp.status_code, 400)
+		cash_resp = self.client.post('/api/payments/', {'sale_id': sale.id, 'payment_method': 'cash', 'amount': '100.00'}, format='json')
+		self.assertEqual(cash_resp.status_code, 201)
+
+		sale.refresh_from_db()
+		self.assertEqual(sale.status, 'completed')
+		self.assertEqual(sale.amount_paid, Decimal('250.00'))
+		self.assertEqual(sale.change_given, Decimal('50.00'))
+
+		call_command('check_sale_payments', stdout=io.StringIO())
+		Sale.objects.filter(id=sale.id).update(amount_paid=Decimal('0.00'))
+		with self.assertRaises(CommandError):
+			call_command('check_sale_payments', stdout=io.StringIO())
+		call_command('check_sale_payments', '--fix', stdout=io.StringIO())
+		sale.refresh_from_db()
+		self.assertEqual(sale.amount_paid, Decimal('250.00'))
+
+	def test_archive_and_restore_old_sale(self):
+		sale = Sale.objects.create(branch=self.branch, cashier=self.user, subtotal=Decimal('100.00'),
+								   tax_amount=Decimal('0.00'), total_amount=Decimal('100.00'), status='completed')
+		SaleItem.objects.create(sale=sale, product=self.product, quantity=1,
+								unit_price=Decimal('100.00'), subtotal=Decimal('100.00'))
+		Payment.objects.create(sale=sale, payment_method='cash', amount=Decimal('100.00'), status='completed')
+		created_at = datetime(2015, 3, 10, 9, 0, tzinfo=dt_timezone.utc)
+		Sale.objects.filter(id=sale.id).update(created_at=created_at)
+		recent = Sale.objects.create(branch=self.branch, cashier=self.user, subtotal=Decimal('5.00'),
+									 tax_amount=Decimal('0.00'), total_amount=Decimal('5.00'))
+
+		with tempfile.TemporaryDirectory() as directory, override_settings(SALES_ARCHIVE_DIR=directory):
+			out = io.StringIO()
+			call_command('archive_sales', stdout=out)
+			self.assertIn('Archived 1 sales', out.getvalue())
+			archive_file = os.path.join(directory, str(self.branch.id), '2015-03.jsonl.gz')
+			self.assertTrue(os.path.exists(archive_file))
+			self.assertTrue(os.path.exists(archive_file + '.sha256'))
+			self.assertFalse(Sale.objects.filter(id=sale.id).exists())
+			self.assertFalse(Payment.objects.filter(sale_id=sale.id).exists())
+			self.assertTrue(Sale.objects.filter(id=recent.id).exists())
+			call_command('archive_sales', '--verify', stdout=io.StringIO())
+
+			response = self.client.get(f'/api/sales/archived/{sale.sale_number}/')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.data['sale']['total_amount'], '100.00')
+			self.assertEqual(response.data['items'][0]['product_name'], 'Test Product')
+			self.assertEqual(len(response.data['payments']), 1)
+			self.assertEqual(self.client.get('/api/sales/archived/SALE-MISSING/').status_code, 404)
+
+			manager = User.objects.create_user(username='manager', password='pass1234', role='manager', branch=self.branch)
+			self.assertEqual(self.client.post(f'/api/sales/archived/{sale.sale_number}/restore/').status_code, 403)
+			self.client.force_authenticate(user=manager)
+			response = self.client.post(f'/api/sales/archived/{sale.sale_number}/restore/')
+			self.assertEqual(response.status_code, 200)
+
+		restored = Sale.objects.get(id=sale.id)
+		self.assertEqual(restored.created_at, created_at)
+		self.assertEqual(restored.items.count(), 1)
+		self.assertEqual(restored.payments.get().amount, Decimal('100.00'))
+		self.assertFalse(ArchivedSale.objects.exists())
+
+	def test_archived_sales_follow_the_live_visibility_rules(self):
+		sale = Sale.objects.create(branch=self.branch, cashier=self.user, subtotal=Decimal('10.00'),
+								   tax_amount=Decimal('0.00'), total_amount=Decimal('10.00'), status='completed')
+		Sale.objects.filter(id=sale.id).update(created_at=datetime(2015, 3, 10, 9, 0, tzinfo=dt_timezone.utc))
+		other_cashier = User.objects.create_user(username='other-cashier', password='pass1234', role='cashier',
+												 branch=self.branch)
+		branchless_manager = User.objects.create_user(username='roaming', password='pass1234', role='manager')
+		branch_manager = User.objects.create_user(username='manager', password='pass1234', role='manager',
+												  branch=self.branch)
+		url = f'/api/sales/archived/{sale.sale_number}/'
+
+		with tempfile.TemporaryDirectory() as directory, override_settings(SALES_ARCHIVE_DIR=directory):
+			call_command('archive_sales', stdout=io.StringIO())
+			self.assertEqual(ArchivedSale.objects.get().cashier_id, self.user.id)
+			self.assertEqual(self.client.get(url).status_code, 200)
+
+			self.client.force_authenticate(user=other_cashier)
+			self.assertEqual(self.client.get(url).status_code, 404)
+			self.client.force_authenticate(user=branchless_manager)
+			self.assertEqual(self.client.get(url).status_code, 404)
+			self.assertEqual(self.client.post(f'{url}restore/').status_code, 404)
+			self.client.force_authenticate(user=branch_manager)
+			self.assertEqual(self.client.get(url).status_code, 200)
+
+	def test_archived_sales_stay_readable_when_a_run_stops_midway(self):
+		created_at = datetime(2015, 3, 10, 9, 0, tzinfo=dt_timezone.utc)
+		sales = []
+		for _ in range(2):
+			sale = Sale.objects.create(branch=self.branch, cashier=self.user, subtotal=Decimal('10.00'),
+									   tax_amount=Decimal('0.00'), total_amount=Decimal('10.00'), status='completed')
+			Sale.objects.filter(id=sale.id).update(created_at=created_at)
+			sales.append(sale)
+
+		delete_sales = archive.delete_sales
+
+		def fail_on_second_batch(sale_ids):
+			if sale_ids == [sales[1].id]:
+				raise RuntimeError('Killed')
+			delete_sales(sale_ids)
+
+		with tempfile.TemporaryDirectory() as directory, override_settings(SALES_ARCHIVE_DIR=directory):
+			with mock.patch('sales.archive.delete_sales', fail_on_second_batch), self.assertRaises(RuntimeError):
+				call_command('archive_sales', '--batch-size', '1', stdout=io.StringIO())
+			self.assertEqual(list(ArchivedSale.objects.values_list('sale_number', flat=True)), [sales[0].sale_number])
+			call_command('archive_sales', '--verify', stdout=io.StringIO())
+			response = self.client.get(f'/api/sales/archived/{sales[0].sale_number}/')
+			self.assertEqual(response.status_code, 200)
+
+			# The next run carries on after the unindexed line the failed batch left behind
+			call_command('archive_sales', '--batch-size', '1', stdout=io.StringIO())
+			entry = ArchivedSale.objects.get(sale_number=sales[1].sale_number)
+			self.assertEqual(entry.line, 2)
+			call_command('archive_sales', '--verify', stdout=io.StringIO())
+
+			# Lookups check the sale's own line, not the whole file
+			ArchivedSale.objects.filter(id=entry.id).update(checksum='0' * 64)
+			self.assertEqual(self.client.get(f'/api/sales/archived/{sales[1].sale_number}/').status_code, 500)
+			self.assertEqual(self.client.get(f'/api/sales/archived/{sales[0].sale_number}/').status_code, 200)
+
+	@override_settings(RECEIPT_BLOCK_SIZE=5)
+	def test_receipt_numbers_are_sequential_per_branch_and_audited(self):
+		reset_blocks()
+
+		def new_sale(branch):
+			with self.captureOnCommitCallbacks(execute=True):
+				return Sale.objects.create(branch=branch, cashier=self.user, subtotal=Decimal('1.00'),
+										   tax_amount=Decimal('0.00'), total_amount=Decimal('1.00'))
+
+		numbers = [new_sale(self.branch).sale_number for _ in range(7)]
+		self.assertEqual(numbers[0], f'SALE-{self.branch.id:03d}-000000001')
+		self.assertEqual([parse_receipt_number(n)[2] for n in numbers], list(range(1, 8)))
+		self.assertEqual(ReceiptBlock.objects.filter(branch_id=self.branch.id).count(), 2)
+		other = Branch.objects.create(name='Other Branch', tax_id='PIN456')
+		self.assertEqual(parse_receipt_number(new_sale(other).sale_number), ('sale', other.id, 1))
+
+		# A rolled-back checkout and a restart leave explained gaps only
+		Sale.objects.filter(sale_number=numbers[3]).delete()
+		reset_blocks()
+		self.assertEqual(parse_receipt_number(new_sale(self.branch).sale_number)[2], 11)
+		result = audit_receipt_numbers('sale', self.branch.id)
+		self.assertEqual(result['issued'], 7)
+		self.assertEqual(result['missing'], [(4, 4)])
+		# 8-10 were left in the block abandoned by the restart, 12-15 are still held
+		self.assertEqual(result['unused'], 7)
+		self.assertEqual(result['unallocated'], [])
+
+		Sale.objects.create(sale_number=f'SALE-{self.branch.id:03d}-000000099', branch=self.branch, cashier=self.user,
+							subtotal=Decimal('1.00'), tax_amount=Decimal('0.00'), total_amount=Decimal('1.00'))
+		with self.assertRaises(CommandError):
+			call_command('audit_receipt_numbers', '--branch', str(self.branch.id), stdout=io.StringIO())
+
+	@override_settings(RECEIPT_BLOCK_SIZE=5)
+	def test_rolled_back_checkout_keeps_the_rest_of_a_committed_block(self):
+		reset_blocks()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertEqual(parse_receipt_number(next_receipt_number('sale', self.branch.id))[2], 1)
+
+		with self.assertRaises(RuntimeError), transaction.atomic():
+			self.assertEqual(parse_receipt_number(next_receipt_number('sale', self.branch.id))[2], 2)
+			raise RuntimeError('Checkout failed')
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertEqual(parse_receipt_number(next_receipt_number('sale', self.branch.id))[2], 3)
+		self.assertEqual(ReceiptBlock.objects.filter(branch_id=self.branch.id).count(), 1)
+
+	def test_checkout_succeeds_when_the_trace_cannot_be_written(self):
+		with tempfile.TemporaryDirectory() as directory:
+			# A directory cannot be opened for appending
+			with override_settings(TRACING_ENABLED=True, TRACING_FILE=directory), \
+					self.assertLogs('core.tracing', level='ERROR'):
+				response = self.client.post('/api/sales/', {'items': [{'product_id': self.product.id, 'quantity': 1}]},
+											format='json')
+		self.assertEqual(response.status_code, 201)
+		self.assertTrue(Sale.objects.filter(id=response.data['id']).exists())
+
+	def test_checkout_phases_are_traced(self):
+		with tempfile.TemporaryDirectory() as directory:
+			trace_file = os.path.join(directory, 'traces.jsonl')
+			with override_settings(TRACING_ENABLED=True, TRACING_FILE=trace_file):
+				create_resp = self.client.post('/api/sales/', {'items': [{'product_id': self.product.id, 'quantity': 1}]}, format='json')
+				self.assertEqual(create_resp.status_code, 201)
+				sale_id = create_resp.data['id']
+				pay_resp = self.client.post('/api/payments/', {'sale_id': sale_id, 'payment_method': 'cash', 'amount': '100.00'}, format='json')
+				self.assertEqual(pay_resp.status_code, 201)
+				self.client.post(f'/api/sales/{sale_id}/print_receipt/')
+
+			spans = load_traces(trace_file)
+			out = io.StringIO()
+			call_command('trace_summary', '--file', trace_file, '--prefix', 'checkout.', stdout=out)
+
+		by_name = {span['name']: span for span in spans}
+		for name in ['sale.create', 'checkout.resolve_items', 'checkout.price_lines', 'checkout.apply_discount',
+					 'payment.create', 'sale.finalize', 'checkout.stock', 'checkout.loyalty', 'checkout.shift_update',
+					 'sale.print_receipt', 'checkout.etims', 'checkout.render_pdf']:
+			self.assertIn(name, by_name)
+		# Three requests, three traces; phases hang off the span that ran them
+		self.assertEqual(len({span['trace_id'] for span in spans}), 3)
+		self.assertEqual(by_name['checkout.stock']['parent_id'], by_name['sale.finalize']['span_id'])
+		self.assertEqual(by_name['sale.finalize']['trace_id'], by_name['payment.create']['trace_id'])
+		self.assertEqual(by_name['sale.create']['attributes']['http.status_code'], '201')
+		self.assertIn('checkout.render_pdf', out.getvalue())
+
+	def test_line_pricing_extracts_included_tax(self):
+		subtotal, tax = price_line(Decimal('116.00'), 3, Decimal('0.00'), Decimal('16.00'))
+		self.assertEqual((subtotal, tax), (Decimal('348.00'), Decimal('48.00')))
+		subtotal, tax = price_line(Decimal('50.00'), 2, Decimal('10.00'), Decimal('0.00'))
+		self.assertEqual((subtotal, tax), (Decimal('90.00'), Decimal('0.00')))
+		self.assertEqual(included_tax(Decimal('100.00'), Decimal('16.00')).quantize(Decimal('0.01')), Decimal('13.79'))
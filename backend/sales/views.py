@@ -3,17 +3,23 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from django.db.models import Sum, Count
-from django.utils import timezone
+from django.db.models import Sum, Count, Q
 from django.core.exceptions import ValidationError
+from rest_framework.exceptions import ValidationError as InvalidQueryParam
 from decimal import Decimal
-from .models import Sale, SaleItem, Discount, Return
+from .models import Sale, SaleItem, Discount, Return, ArchivedSale
+from .archive import ArchiveError, find_archived_sale, restore_archived_sale
+from .pricing import included_tax, price_line
 from inventory.models import Product, StockMovement
 from customers.models import Customer, LoyaltyTransaction
 from shifts.models import Shift
+from shifts.terminals import DEFAULT_TAX_RATE, get_terminal_context
 from .serializers import (SaleSerializer, SaleCreateSerializer, SaleCompleteSerializer,
                           DiscountSerializer, ReturnSerializer, ReturnCreateSerializer)
 from core.permissions import IsCashier, IsManager
+from core.authentication import ClaimsJWTAuthentication
+from core.tracing import span, traced, SPAN_KIND_SERVER
+from core.dates import parse_date, parse_window, date_filter
 import subprocess
 import shutil
 from django.utils.html import escape
@@ -34,6 +40,9 @@ class SaleViewSet(viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated, IsCashier]
+    # Till endpoint: may trust role and branch claims in the token (JWT_TRUST_TOKEN_CLAIMS)
+    authentication_classes = [ClaimsJWTAuthentication]
+    MAX_STATISTICS_WINDOWS = 12
     
     def get_queryset(self):
         queryset = Sale.objects.all()
@@ -49,19 +58,20 @@ class SaleViewSet(viewsets.ModelViewSet):
         
         status_filter = self.request.query_params.get('status', None)
         cashier = self.request.query_params.get('cashier', None)
-        date_from = self.request.query_params.get('date_from', None)
-        date_to = self.request.query_params.get('date_to', None)
+        try:
+            date_from = parse_date(self.request.query_params.get('date_from'))
+            date_to = parse_date(self.request.query_params.get('date_to'))
+        except ValueError:
+            raise InvalidQueryParam({'error': 'Invalid date format. Use YYYY-MM-DD'})
         
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         if cashier:
             queryset = queryset.filter(cashier_id=cashier)
-        if date_from:
-            queryset = queryset.filter(created_at__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(created_at__lte=date_to)
+        if date_from or date_to:
+            queryset = queryset.filter(**date_filter('created_at', date_from, date_to))
         
-        return queryset.select_related('cashier', 'branch', 'customer').prefetch_related('items').order_by('-created_at')
+        return queryset.select_related('cashier', 'branch', 'customer').prefetch_related('items__product').order_by('-created_at')
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
@@ -81,51 +91,58 @@ class SaleViewSet(viewsets.ModelViewSet):
         if user.role == 'admin' and branch_id:
             queryset = queryset.filter(branch_id=branch_id)
 
-        today = timezone.localtime(timezone.now()).date()
-        start_of_week = today - timezone.timedelta(days=today.weekday())
-        
-        # Today's stats
-        today_stats = queryset.filter(created_at__date=today).aggregate(
-            count=Count('id'),
-            total=Sum('total_amount')
-        )
-        
-        # Week's stats
-        week_stats = queryset.filter(created_at__date__gte=start_of_week).aggregate(
-            count=Count('id'),
-            total=Sum('total_amount')
-        )
-        
-        response_data = {
-            'today': {
-                'count': today_stats['count'],
-                'total': today_stats['total'] or 0
-            },
-            'week': {
-                'count': week_stats['count'],
-                'total': week_stats['total'] or 0
-            }
+        windows = {
+            'today': parse_window('today'),
+            'week': parse_window('week'),
         }
         
-        # Custom date stats
         custom_date_str = request.query_params.get('date')
         if custom_date_str:
             try:
-                custom_date = timezone.datetime.strptime(custom_date_str, '%Y-%m-%d').date()
-                custom_stats = queryset.filter(created_at__date=custom_date).aggregate(
-                    count=Count('id'),
-                    total=Sum('total_amount')
-                )
-                response_data['custom'] = {
-                    'date': custom_date_str,
-                    'count': custom_stats['count'],
-                    'total': custom_stats['total'] or 0
-                }
+                windows['custom'] = parse_window(custom_date_str)
             except ValueError:
-                pass
+                custom_date_str = None
+        
+        requested = [spec for spec in request.query_params.get('windows', '').split(',') if spec]
+        if len(requested) > self.MAX_STATISTICS_WINDOWS:
+            return Response({'error': f'At most {self.MAX_STATISTICS_WINDOWS} windows are allowed'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            extra_windows = {spec: parse_window(spec) for spec in requested}
+        except ValueError as e:
+            return Response({'error': f'{e}. Use today, week, month, YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # One scan bounded to the union of all windows, one filtered aggregate per window
+        all_windows = list(windows.values()) + list(extra_windows.values())
+        aggregates = {}
+        for i, (start, end) in enumerate(all_windows):
+            in_window = Q(created_at__gte=start, created_at__lt=end)
+            aggregates[f'count_{i}'] = Count('id', filter=in_window)
+            aggregates[f'total_{i}'] = Sum('total_amount', filter=in_window)
+        stats = queryset.filter(
+            created_at__gte=min(start for start, _ in all_windows),
+            created_at__lt=max(end for _, end in all_windows)
+        ).aggregate(**aggregates)
+        
+        def window_stats(i):
+            return {'count': stats[f'count_{i}'], 'total': stats[f'total_{i}'] or 0}
+        
+        response_data = {
+            'today': window_stats(0),
+            'week': window_stats(1)
+        }
+        if custom_date_str:
+            response_data['custom'] = dict(window_stats(2), date=custom_date_str)
+        if extra_windows:
+            offset = len(windows)
+            response_data['windows'] = {
+                spec: window_stats(offset + i) for i, spec in enumerate(extra_windows)
+            }
                 
         return Response(response_data)
     
+    @traced('sale.create', SPAN_KIND_SERVER)
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = SaleCreateSerializer(data=request.data)
@@ -134,11 +151,23 @@ class SaleViewSet(viewsets.ModelViewSet):
         
         data = serializer.validated_data
 
+        # Tills identify themselves with X-Terminal; their branch and VAT rate come
+        # from the per-process terminal cache instead of the database
+        terminal = None
+        terminal_code = request.headers.get('X-Terminal')
+        if terminal_code:
+            terminal = get_terminal_context(terminal_code)
+            if not terminal:
+                return Response({'error': f'Unknown or inactive terminal {terminal_code}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if request.user.role != 'admin' and terminal.branch.id != request.user.branch_id:
+                return Response({'error': 'Terminal belongs to another branch'}, status=status.HTTP_403_FORBIDDEN)
+
         # Temporarily disabled shift requirement due to frontend issues
-        current_shift = Shift.objects.filter(
+        current_shift_id = Shift.objects.filter(
             cashier=request.user,
             status='open'
-        ).first()
+        ).values_list('id', flat=True).first()
         
         # if not current_shift:
         #     return Response({'error': 'No open shift found. Please open a shift first.'},
@@ -146,99 +175,102 @@ class SaleViewSet(viewsets.ModelViewSet):
 
         # current_shift = None
         
-        customer = None
-        if data.get('customer_id'):
-            try:
-                customer = Customer.objects.get(id=data['customer_id'])
-            except Customer.DoesNotExist:
-                return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Validate all items before creating the sale
-        validated_items = []
-        for item_data in data['items']:
-            product = None
-            unit_price = item_data.get('unit_price')
-            if item_data.get('product_id'):
+        with span('checkout.resolve_items', items=len(data['items'])):
+            customer = None
+            if data.get('customer_id'):
                 try:
-                    product = Product.objects.get(id=item_data['product_id'])
-                    if not unit_price:
-                        unit_price = product.price
-                except Product.DoesNotExist:
-                    return Response({'error': f'Product {item_data["product_id"]} not found'}, 
-                                    status=status.HTTP_404_NOT_FOUND)
-            elif item_data.get('barcode'):
-                try:
-                    product = Product.objects.get(barcode=item_data['barcode'], branch=request.user.branch)
-                    if not unit_price:
-                        unit_price = product.price
-                except Product.DoesNotExist:
-                    return Response({'error': f'Product with barcode {item_data["barcode"]} not found'}, 
-                                    status=status.HTTP_404_NOT_FOUND)
-            if not product and not item_data.get('is_ad_hoc'):
-                return Response({'error': 'Product is required for non-ad-hoc items'}, 
-                                status=status.HTTP_400_BAD_REQUEST)
-            validated_items.append({
-                'product': product,
-                'unit_price': unit_price,
-                'quantity': item_data['quantity'],
-                'discount': item_data.get('discount', Decimal('0.00')),
-                'is_ad_hoc': item_data.get('is_ad_hoc', False),
-                'ad_hoc_name': item_data.get('ad_hoc_name', '')
-            })
+                    customer = Customer.objects.get(id=data['customer_id'])
+                except Customer.DoesNotExist:
+                    return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+            # Validate all items before creating the sale
+            validated_items = []
+            for item_data in data['items']:
+                product = None
+                unit_price = item_data.get('unit_price')
+                if item_data.get('product_id'):
+                    try:
+                        product = Product.objects.get(id=item_data['product_id'])
+                        if not unit_price:
+                            unit_price = product.price
+                    except Product.DoesNotExist:
+                        return Response({'error': f'Product {item_data["product_id"]} not found'}, 
+                                        status=status.HTTP_404_NOT_FOUND)
+                elif item_data.get('barcode'):
+                    try:
+                        product = Product.objects.get(barcode=item_data['barcode'], branch=request.user.branch)
+                        if not unit_price:
+                            unit_price = product.price
+                    except Product.DoesNotExist:
+                        return Response({'error': f'Product with barcode {item_data["barcode"]} not found'}, 
+                                        status=status.HTTP_404_NOT_FOUND)
+                if not product and not item_data.get('is_ad_hoc'):
+                    return Response({'error': 'Product is required for non-ad-hoc items'}, 
+                                    status=status.HTTP_400_BAD_REQUEST)
+                validated_items.append({
+                    'product': product,
+                    'unit_price': unit_price,
+                    'quantity': item_data['quantity'],
+                    'discount': item_data.get('discount', Decimal('0.00')),
+                    'is_ad_hoc': item_data.get('is_ad_hoc', False),
+                    'ad_hoc_name': item_data.get('ad_hoc_name', '')
+                })
 
-        subtotal = Decimal('0.00')
-        tax_amount = Decimal('0.00')
-        sale = Sale.objects.create(
-            branch=request.user.branch,
-            cashier=request.user,
-            customer=customer,
-            shift=current_shift,
-            subtotal=Decimal('0.00'),
-            tax_amount=Decimal('0.00'),
-            discount_amount=data.get('discount_amount', Decimal('0.00')),
-            total_amount=Decimal('0.00'),
-            notes=data.get('notes', ''),
-            created_by=request.user
-        )
-        for item in validated_items:
-            tax_rate = Decimal('16.00')  # Prices are tax-inclusive
-            item_subtotal = (item['unit_price'] * item['quantity']) - item['discount']
-            item_tax = item_subtotal * (tax_rate / (Decimal('100.00') + tax_rate))
-            SaleItem.objects.create(
-                sale=sale,
-                product=item['product'],
-                quantity=item['quantity'],
-                unit_price=item['unit_price'],
-                discount=item['discount'],
-                subtotal=item_subtotal,
-                tax_rate=tax_rate,
-                tax_amount=item_tax,
-                is_ad_hoc=item['is_ad_hoc'],
-                ad_hoc_name=item['ad_hoc_name']
+        with span('checkout.price_lines', items=len(validated_items)):
+            subtotal = Decimal('0.00')
+            tax_amount = Decimal('0.00')
+            sale = Sale.objects.create(
+                branch=terminal.branch if terminal else request.user.branch,
+                cashier=request.user,
+                customer=customer,
+                shift_id=current_shift_id,
+                terminal_id=terminal.terminal_id if terminal else None,
+                subtotal=Decimal('0.00'),
+                tax_amount=Decimal('0.00'),
+                discount_amount=data.get('discount_amount', Decimal('0.00')),
+                total_amount=Decimal('0.00'),
+                notes=data.get('notes', ''),
+                created_by=request.user
             )
-            subtotal += item_subtotal
-            tax_amount += item_tax
+            for item in validated_items:
+                tax_rate = terminal.tax_rate if terminal else DEFAULT_TAX_RATE  # Prices are tax-inclusive
+                item_subtotal, item_tax = price_line(item['unit_price'], item['quantity'], item['discount'], tax_rate)
+                SaleItem.objects.create(
+                    sale=sale,
+                    product=item['product'],
+                    quantity=item['quantity'],
+                    unit_price=item['unit_price'],
+                    discount=item['discount'],
+                    subtotal=item_subtotal,
+                    tax_rate=tax_rate,
+                    tax_amount=item_tax,
+                    is_ad_hoc=item['is_ad_hoc'],
+                    ad_hoc_name=item['ad_hoc_name']
+                )
+                subtotal += item_subtotal
+                tax_amount += item_tax
         
-        discount_code = data.get('discount_code')
-        if discount_code:
-            try:
-                discount = Discount.objects.get(code=discount_code, is_active=True)
-                if discount.is_valid:
-                    if discount.discount_type == 'percentage':
-                        sale.discount_amount = subtotal * (discount.value / 100)
-                    else:
-                        sale.discount_amount = discount.value
+        with span('checkout.apply_discount', code=bool(data.get('discount_code'))):
+            discount_code = data.get('discount_code')
+            if discount_code:
+                try:
+                    discount = Discount.objects.get(code=discount_code, is_active=True)
+                    if discount.is_valid:
+                        if discount.discount_type == 'percentage':
+                            sale.discount_amount = subtotal * (discount.value / 100)
+                        else:
+                            sale.discount_amount = discount.value
                     
-                    discount.times_used += 1
-                    discount.save()
-            except Discount.DoesNotExist:
-                pass
+                        discount.times_used += 1
+                        discount.save()
+                except Discount.DoesNotExist:
+                    pass
         
-        points_discount = data.get('points_discount', Decimal('0.00'))
-        sale.subtotal = subtotal
-        sale.tax_amount = tax_amount
-        sale.total_amount = subtotal - sale.discount_amount - points_discount  # Prices are tax-inclusive
-        sale.save()
+            points_discount = data.get('points_discount', Decimal('0.00'))
+            sale.subtotal = subtotal
+            sale.tax_amount = tax_amount
+            sale.total_amount = subtotal - sale.discount_amount - points_discount  # Prices are tax-inclusive
+            sale.save()
         
         response_serializer = SaleSerializer(sale)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -263,6 +295,43 @@ class SaleViewSet(viewsets.ModelViewSet):
         serializer = SaleSerializer(sale)
         return Response(serializer.data)
 
+    def get_archived_entry(self, sale_number):
+        """Index entry of an archived sale the user may see, by the same rules as live sales."""
+        entries = ArchivedSale.objects.filter(sale_number=sale_number)
+        user = self.request.user
+        if user.role == 'cashier':
+            entries = entries.filter(cashier_id=user.id)
+        elif user.role != 'admin':
+            # Archives span every branch, so a non-admin without one sees none of them
+            if not user.branch_id:
+                return None
+            entries = entries.filter(branch_id=user.branch_id)
+        return entries.first()
+
+    @action(detail=False, methods=['get'], url_path=r'archived/(?P<sale_number>[^/]+)')
+    def archived(self, request, sale_number=None):
+        """Look up a sale that has been moved to cold storage, for reprints and returns."""
+        if not self.get_archived_entry(sale_number):
+            return Response({'error': 'Archived sale not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            graph = find_archived_sale(sale_number)
+        except ArchiveError as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'archived': True, **graph})
+
+    @action(detail=False, methods=['post'], url_path=r'archived/(?P<sale_number>[^/]+)/restore',
+            permission_classes=[IsAuthenticated, IsManager])
+    def restore_archived(self, request, sale_number=None):
+        """Move an archived sale back into the live tables, e.g. to process a late return."""
+        if not self.get_archived_entry(sale_number):
+            return Response({'error': 'Archived sale not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            sale = restore_archived_sale(sale_number)
+        except ArchiveError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(SaleSerializer(sale).data)
+
+    @traced('sale.print_receipt', SPAN_KIND_SERVER)
     @action(detail=True, methods=['post'])
     def print_receipt(self, request, pk=None):
         from django.http import FileResponse
@@ -270,10 +339,11 @@ class SaleViewSet(viewsets.ModelViewSet):
 
         # Ensure KRA eTIMS simulation exists for printing compliance
         if not sale.etims_response:
-            try:
-                sale.simulate_etims()
-            except Exception:
-                pass
+            with span('checkout.etims'):
+                try:
+                    sale.simulate_etims()
+                except Exception:
+                    pass
 
         # Helper to read store metadata from SystemConfig (admin editable)
         def get_config(key, default=''):
@@ -352,7 +422,8 @@ class SaleViewSet(viewsets.ModelViewSet):
             if store_email: y = draw_text_center(store_email, y, "Courier", 9)
             y = draw_separator(y)
             
-            y = draw_row(f"POS: 94", (sale.created_at or sale.updated_at).strftime('%d/%m/%Y %H:%M'), y, "Courier", 9)
+            pos_number = sale.terminal.code if sale.terminal else get_config('POS_NUMBER', '94')
+            y = draw_row(f"POS: {pos_number}", (sale.created_at or sale.updated_at).strftime('%d/%m/%Y %H:%M'), y, "Courier", 9)
             y = draw_row(f"Receipt: {sale.sale_number}", "", y, "Courier", 9)
             if store_tax_id:
                 y = draw_row(f"Tax ID: {store_tax_id}", "", y, "Courier", 8)
@@ -400,13 +471,10 @@ class SaleViewSet(viewsets.ModelViewSet):
             y = draw_row("TOTAL", fmt(sale.total_amount), y, "Courier-Bold", 11)
             y -= 1*mm
             
-            payments_total = sum([p.amount for p in sale.payments.all()]) if sale.payments.exists() else sale.total_amount
-            change_amount = payments_total - sale.total_amount if sale.payments.exists() else Decimal('0.00')
-            
-            if sale.payments.exists():
-                y = draw_row("Tendered", fmt(payments_total), y, "Courier", 9)
-                if change_amount > 0:
-                    y = draw_row("Change", fmt(change_amount), y, "Courier", 9)
+            if sale.amount_paid > 0:
+                y = draw_row("Tendered", fmt(sale.amount_paid), y, "Courier", 9)
+                if sale.change_given > 0:
+                    y = draw_row("Change", fmt(sale.change_given), y, "Courier", 9)
             
             y = draw_separator(y)
             
@@ -427,8 +495,7 @@ class SaleViewSet(viewsets.ModelViewSet):
             
             try:
                 vat_rate = Decimal('16.00')
-                vat_amount = (sale.total_amount * vat_rate) / (Decimal('100.00') + vat_rate)
-                vat_amount = vat_amount.quantize(Decimal('0.01'))
+                vat_amount = included_tax(sale.total_amount, vat_rate).quantize(Decimal('0.01'))
                 vatable_amount = (sale.total_amount - vat_amount).quantize(Decimal('0.01'))
             except:
                 vat_amount = Decimal('0.00')
@@ -463,7 +530,10 @@ class SaleViewSet(viewsets.ModelViewSet):
             c.save()
             return buffer.getvalue()
 
-        pdf_bytes = generate_receipt_pdf()
+        with span('checkout.render_pdf') as current:
+            pdf_bytes = generate_receipt_pdf()
+            if current is not None:
+                current.set_attribute('pdf.bytes', len(pdf_bytes))
         
         lp = shutil.which('lp') or shutil.which('lpr')
         if lp:
@@ -533,4 +603,5 @@ class ReturnViewSet(viewsets.ModelViewSet):
         if self.request.user.role != 'admin':
             queryset = queryset.filter(branch=self.request.user.branch)
         
-        return queryset.select_related('original_sale', 'customer', 'manager_approval').order_by('-created_at')
+        return queryset.select_related('original_sale', 'customer', 'manager_approval', 'branch',
+                                       'created_by').order_by('-created_at')
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Shift, ShiftTransaction
+from .models import Shift, ShiftTransaction, Terminal
 
 
 @admin.register(Shift)
@@ -7,7 +7,9 @@ class ShiftAdmin(admin.ModelAdmin):
     list_display = ['id', 'cashier', 'branch', 'opening_time', 'closing_time', 'status', 'cash_difference', 'total_sales']
     list_filter = ['status', 'branch', 'opening_time']
     search_fields = ['cashier__username', 'branch__name']
-    readonly_fields = ['expected_cash', 'cash_difference', 'opening_time', 'created_at', 'updated_at', 'created_by', 'updated_by']
+    readonly_fields = ['expected_cash', 'cash_difference', 'opening_time', 'cash_total', 'mpesa_total', 'card_total',
+                       'airtel_money_total', 'bank_transfer_total', 'change_total', 'cash_drops_total',
+                       'payouts_total', 'created_at', 'updated_at', 'created_by', 'updated_by']
     date_hierarchy = 'opening_time'
     fieldsets = (
         ('Shift Information', {
@@ -22,6 +24,10 @@ class ShiftAdmin(admin.ModelAdmin):
         ('Summary', {
             'fields': ('total_sales', 'total_transactions', 'notes')
         }),
+        ('Running Balances', {
+            'fields': ('cash_total', 'mpesa_total', 'card_total', 'airtel_money_total', 'bank_transfer_total',
+                       'change_total', 'cash_drops_total', 'payouts_total')
+        }),
         ('Closure', {
             'fields': ('closed_by',)
         }),
@@ -34,8 +40,26 @@ class ShiftAdmin(admin.ModelAdmin):
 
 @admin.register(ShiftTransaction)
 class ShiftTransactionAdmin(admin.ModelAdmin):
-    list_display = ['shift', 'sale', 'payment_method', 'amount', 'created_at']
-    list_filter = ['payment_method', 'created_at']
-    search_fields = ['shift__id', 'sale__sale_number']
+    list_display = ['shift', 'transaction_type', 'sale', 'payment_method', 'amount', 'created_by', 'created_at']
+    list_filter = ['transaction_type', 'payment_method', 'created_at']
+    search_fields = ['shift__id', 'sale__sale_number', 'description']
     readonly_fields = ['created_at']
     date_hierarchy = 'created_at'
+
+    # The ledger is append-only; corrections go through verify_shift_ledger
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Terminal)
+class TerminalAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'branch', 'printer_name', 'current_shift', 'is_active']
+    list_filter = ['branch', 'is_active']
+    search_fields = ['code', 'name', 'printer_name']
+    readonly_fields = ['current_shift', 'created_at', 'updated_at', 'created_by', 'updated_by']
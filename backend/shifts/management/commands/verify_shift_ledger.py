@@ -0,0 +1,68 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from shifts.models import Shift, ShiftTransaction, PAYMENT_METHODS
+
+BALANCE_FIELDS = [f'{method}_total' for method in PAYMENT_METHODS] + [
+    'change_total', 'cash_drops_total', 'payouts_total'
+]
+
+
+class Command(BaseCommand):
+    help = 'Replay the shift cash ledger and verify it against the running balances on each shift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shift', type=int, help='Only verify this shift')
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched balances from the ledger')
+        parser.add_argument('--limit', type=int, default=50, help='Maximum mismatches to list')
+
+    def handle(self, *args, **options):
+        shifts = Shift.objects.order_by('id')
+        entries = ShiftTransaction.objects.all()
+        if options['shift']:
+            shifts = shifts.filter(id=options['shift'])
+            entries = entries.filter(shift_id=options['shift'])
+
+        # One grouped pass over the ledger instead of a query per shift
+        replayed = defaultdict(dict)
+        grouped = entries.values('shift_id', 'transaction_type', 'payment_method').annotate(total=Sum('amount'))
+        for row in grouped:
+            field = ShiftTransaction.balance_field(row['transaction_type'], row['payment_method'])
+            balances = replayed[row['shift_id']]
+            balances[field] = balances.get(field, Decimal('0.00')) + abs(row['total'])
+
+        count = 0
+        to_fix = []
+        for shift in shifts.only('id', *BALANCE_FIELDS).iterator(chunk_size=2000):
+            expected = replayed.get(shift.id, {})
+            mismatches = {
+                field: (getattr(shift, field), expected.get(field, Decimal('0.00')))
+                for field in BALANCE_FIELDS
+                if getattr(shift, field) != expected.get(field, Decimal('0.00'))
+            }
+            if not mismatches:
+                continue
+
+            count += 1
+            if count <= options['limit']:
+                details = ', '.join(f'{field}={actual} expected={value}'
+                                    for field, (actual, value) in mismatches.items())
+                self.stdout.write(f'Shift {shift.id}: {details}')
+            if options['fix']:
+                for field, (_, value) in mismatches.items():
+                    setattr(shift, field, value)
+                to_fix.append(shift)
+                if len(to_fix) >= 500:
+                    Shift.objects.bulk_update(to_fix, BALANCE_FIELDS)
+                    to_fix = []
+
+        if to_fix:
+            Shift.objects.bulk_update(to_fix, BALANCE_FIELDS)
+
+        if not count:
+            self.stdout.write(self.style.SUCCESS('All shift balances match the ledger'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {count} shifts'))
+        else:
+            raise CommandError(f'{count} shifts disagree with the ledger (rerun with --fix to repair)')
@@ -0,0 +1,125 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:46
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_ledger(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    Sale = apps.get_model('sales', 'Sale')
+    Shift = apps.get_model('shifts', 'Shift')
+    ShiftTransaction = apps.get_model('shifts', 'ShiftTransaction')
+
+    balances = {}
+    entries = []
+
+    payments = (Payment.objects.filter(status='completed', sale__shift__isnull=False)
+                .select_related('sale').order_by('processed_at', 'id'))
+    for payment in payments.iterator(chunk_size=2000):
+        entries.append(ShiftTransaction(
+            shift_id=payment.sale.shift_id, transaction_type='sale', sale_id=payment.sale_id,
+            payment_id=payment.id, amount=payment.amount, payment_method=payment.payment_method,
+            created_by_id=payment.processed_by_id
+        ))
+        shift_balances = balances.setdefault(payment.sale.shift_id, {})
+        field = f'{payment.payment_method}_total'
+        shift_balances[field] = shift_balances.get(field, Decimal('0.00')) + payment.amount
+
+    sales = Sale.objects.filter(shift__isnull=False, change_given__gt=0).only('id', 'shift_id', 'change_given')
+    for sale in sales.iterator(chunk_size=2000):
+        entries.append(ShiftTransaction(
+            shift_id=sale.shift_id, transaction_type='change', sale_id=sale.id,
+            amount=-sale.change_given, payment_method='cash'
+        ))
+        shift_balances = balances.setdefault(sale.shift_id, {})
+        shift_balances['change_total'] = shift_balances.get('change_total', Decimal('0.00')) + sale.change_given
+
+    ShiftTransaction.objects.bulk_create(entries, batch_size=1000)
+    for shift_id, fields in balances.items():
+        Shift.objects.filter(pk=shift_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sales', '0008_sale_change_given'),
+        ('payments', '0004_mpesacallback'),
+        ('shifts', '0002_alter_shift_branch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='airtel_money_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='bank_transfer_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='card_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='cash_drops_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='cash_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='change_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='mpesa_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='payouts_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='shifttransaction',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shift_transactions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shifttransaction',
+            name='description',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='shifttransaction',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shift_transactions', to='payments.payment'),
+        ),
+        migrations.AddField(
+            model_name='shifttransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('sale', 'Sale Payment'), ('change', 'Change Given'), ('cash_drop', 'Cash Drop'), ('payout', 'Payout')], default='sale', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='shifttransaction',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, help_text='Negative for cash leaving the till', max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='shifttransaction',
+            name='sale',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales.sale'),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shifts', '0003_shift_cash_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Terminal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('code', models.CharField(help_text='Printed on receipts as the POS number', max_length=20, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('printer_name', models.CharField(blank=True, max_length=100)),
+                ('printer_address', models.CharField(blank=True, help_text='Printer queue, IP or device path', max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='terminals', to='core.branch')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL)),
+                ('current_shift', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shifts.shift')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['branch', 'code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='terminal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shifts', to='shifts.terminal'),
+        ),
+    ]
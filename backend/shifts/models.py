@@ -1,9 +1,36 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from core.models import AuditMixin, Branch, User
 
 
+PAYMENT_METHODS = ['cash', 'mpesa', 'card', 'airtel_money', 'bank_transfer']
+
+
+class Terminal(AuditMixin):
+    """A physical till: where it is, which receipt printer it drives and which shift is open on it."""
+    code = models.CharField(max_length=20, unique=True, help_text="Printed on receipts as the POS number")
+    name = models.CharField(max_length=100, blank=True)
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='terminals')
+    printer_name = models.CharField(max_length=100, blank=True)
+    printer_address = models.CharField(max_length=200, blank=True, help_text="Printer queue, IP or device path")
+    current_shift = models.ForeignKey('Shift', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['branch', 'code']
+
+    def __str__(self):
+        return f"Terminal {self.code} ({self.branch.name})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .terminals import invalidate_terminal_context
+        # After commit, so a checkout in between cannot cache the old row again
+        code = self.code
+        transaction.on_commit(lambda: invalidate_terminal_context(code))
+
+
 class Shift(AuditMixin):
     STATUS_CHOICES = [
         ('open', 'Open'),
@@ -26,7 +53,18 @@ class Shift(AuditMixin):
     total_sales = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     total_transactions = models.IntegerField(default=0)
     
+    # Running balances maintained from the ShiftTransaction ledger
+    cash_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    mpesa_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    card_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    airtel_money_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    bank_transfer_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    change_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    cash_drops_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    payouts_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    
     closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_shifts')
+    terminal = models.ForeignKey(Terminal, on_delete=models.SET_NULL, null=True, blank=True, related_name='shifts')
     
     notes = models.TextField(blank=True)
     
@@ -41,16 +79,61 @@ class Shift(AuditMixin):
     def __str__(self):
         return f"Shift {self.id} - {self.cashier.username} ({self.opening_time.strftime('%Y-%m-%d %H:%M')})"
     
+    def record_transaction(self, transaction_type, amount, payment_method='cash', sale=None,
+                           payment=None, user=None, description=''):
+        """Append an entry to the shift ledger and bump the matching running balance.
+
+        `amount` is the positive size of the movement; outflows (change, cash
+        drops, payouts) are stored negated on the ledger entry.
+        """
+        sign = 1 if transaction_type == 'sale' else -1
+        entry = ShiftTransaction.objects.create(
+            shift=self,
+            transaction_type=transaction_type,
+            sale=sale,
+            payment=payment,
+            amount=sign * amount,
+            payment_method=payment_method,
+            description=description,
+            created_by=user
+        )
+
+        field = ShiftTransaction.balance_field(transaction_type, payment_method)
+        Shift.objects.filter(pk=self.pk).update(**{field: models.F(field) + amount})
+        setattr(self, field, getattr(self, field) + amount)
+        return entry
+
+    def payment_summary(self):
+        return {method: getattr(self, f'{method}_total') for method in PAYMENT_METHODS}
+
+    def report_totals(self):
+        """Sales and payment totals for the shift.
+
+        Payment totals come straight from the running balances; the sales
+        summary is a single aggregate over the shift's sales.
+        """
+        from sales.models import Sale
+
+        sales_summary = Sale.objects.filter(shift=self, status='completed').aggregate(
+            total_sales=models.Count('id'),
+            total_amount=models.Sum('total_amount'),
+            total_tax=models.Sum('tax_amount'),
+            total_discount=models.Sum('discount_amount')
+        )
+
+        return {
+            'sales_summary': sales_summary,
+            'payment_summary': self.payment_summary(),
+            'total_change': self.change_total,
+        }
+
+    @property
+    def net_cash(self):
+        return self.cash_total - self.change_total - self.cash_drops_total - self.payouts_total
+
     def calculate_expected_cash(self):
-        from payments.models import Payment
-        cash_payments = Payment.objects.filter(
-            sale__shift=self,
-            payment_method='cash',
-            status='completed'
-        ).aggregate(total=models.Sum('amount'))
-        
-        total_cash = cash_payments['total'] or Decimal('0.00')
-        self.expected_cash = self.opening_cash + total_cash
+        # Expected Cash = Opening Cash + Cash Payments - Change Given - Cash Drops - Payouts
+        self.expected_cash = self.opening_cash + self.net_cash
         return self.expected_cash
     
     def close_shift(self, closing_cash, closed_by_user):
@@ -64,10 +147,24 @@ class Shift(AuditMixin):
 
 
 class ShiftTransaction(models.Model):
+    """Append-only cash ledger for a shift. Entries are never updated or deleted."""
+    TRANSACTION_TYPES = [
+        ('sale', 'Sale Payment'),
+        ('change', 'Change Given'),
+        ('cash_drop', 'Cash Drop'),
+        ('payout', 'Payout'),
+    ]
+    
     shift = models.ForeignKey(Shift, on_delete=models.CASCADE, related_name='transactions')
-    sale = models.ForeignKey('sales.Sale', on_delete=models.PROTECT)
-    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES, default='sale')
+    sale = models.ForeignKey('sales.Sale', on_delete=models.SET_NULL, null=True, blank=True)
+    payment = models.ForeignKey('payments.Payment', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='shift_transactions')
+    amount = models.DecimalField(max_digits=15, decimal_places=2, help_text="Negative for cash leaving the till")
     payment_method = models.CharField(max_length=20)
+    description = models.CharField(max_length=500, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='shift_transactions')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -77,4 +174,14 @@ class ShiftTransaction(models.Model):
         ]
     
     def __str__(self):
-        return f"Shift {self.shift.id} - {self.payment_method} KES {self.amount}"
+        return f"Shift {self.shift_id} - {self.get_transaction_type_display()} {self.payment_method} KES {self.amount}"
+
+    @staticmethod
+    def balance_field(transaction_type, payment_method):
+        if transaction_type == 'sale':
+            return f'{payment_method}_total'
+        return {
+            'change': 'change_total',
+            'cash_drop': 'cash_drops_total',
+            'payout': 'payouts_total',
+        }[transaction_type]
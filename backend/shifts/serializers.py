@@ -1,15 +1,23 @@
 from rest_framework import serializers
-from .models import Shift, ShiftTransaction
+from decimal import Decimal
+from .models import Shift, ShiftTransaction, Terminal
 
 
 class ShiftTransactionSerializer(serializers.ModelSerializer):
     sale_number = serializers.CharField(source='sale.sale_number', read_only=True)
+    transaction_type_display = serializers.CharField(source='get_transaction_type_display', read_only=True)
+    created_by_name = serializers.SerializerMethodField()
     
     class Meta:
         model = ShiftTransaction
-        fields = ['id', 'shift', 'sale', 'sale_number', 'amount', 'payment_method', 'created_at']
+        fields = ['id', 'shift', 'transaction_type', 'transaction_type_display', 'sale', 'sale_number',
+                  'payment', 'amount', 'payment_method', 'description', 'created_by', 'created_by_name',
+                  'created_at']
         read_only_fields = ['created_at']
 
+    def get_created_by_name(self, obj):
+        return obj.created_by.get_full_name() if obj.created_by else None
+
 
 class ShiftSerializer(serializers.ModelSerializer):
     cashier_name = serializers.SerializerMethodField()
@@ -37,11 +45,13 @@ class ShiftSerializer(serializers.ModelSerializer):
 
 
 class ShiftDetailSerializer(serializers.ModelSerializer):
+    RECENT_TRANSACTIONS = 50
+    
     cashier_name = serializers.SerializerMethodField()
     branch_name = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     closed_by_name = serializers.SerializerMethodField()
-    transactions = ShiftTransactionSerializer(many=True, read_only=True)
+    transactions = serializers.SerializerMethodField()
     sales_summary = serializers.SerializerMethodField()
     
     class Meta:
@@ -49,10 +59,14 @@ class ShiftDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'cashier', 'cashier_name', 'branch', 'branch_name', 'opening_time', 
                   'closing_time', 'opening_cash', 'closing_cash', 'expected_cash', 
                   'cash_difference', 'status', 'status_display', 'total_sales', 
-                  'total_transactions', 'closed_by', 'closed_by_name', 'notes', 
+                  'total_transactions', 'cash_total', 'mpesa_total', 'card_total', 
+                  'airtel_money_total', 'bank_transfer_total', 'change_total', 'cash_drops_total', 
+                  'payouts_total', 'closed_by', 'closed_by_name', 'notes', 
                   'transactions', 'sales_summary']
         read_only_fields = ['opening_time', 'closing_time', 'expected_cash', 'cash_difference', 
-                           'total_sales', 'total_transactions']
+                           'total_sales', 'total_transactions', 'cash_total', 'mpesa_total', 'card_total',
+                           'airtel_money_total', 'bank_transfer_total', 'change_total', 'cash_drops_total',
+                           'payouts_total']
     
     def get_cashier_name(self, obj):
         return obj.cashier.get_full_name() or obj.cashier.username
@@ -63,47 +77,31 @@ class ShiftDetailSerializer(serializers.ModelSerializer):
     def get_closed_by_name(self, obj):
         return obj.closed_by.get_full_name() if obj.closed_by else None
 
+    def get_transactions(self, obj):
+        # The ledger grows with every payment; only the latest entries are inlined
+        transactions = obj.transactions.select_related('sale', 'created_by')[:self.RECENT_TRANSACTIONS]
+        return ShiftTransactionSerializer(transactions, many=True).data
+
+    def get_totals(self, obj):
+        # Computed once per shift and shared by sales_summary and expected_cash
+        shift_totals = self.context.setdefault('shift_totals', {})
+        if obj.pk not in shift_totals:
+            shift_totals[obj.pk] = obj.report_totals()
+        return shift_totals[obj.pk]
+
     def get_sales_summary(self, obj):
-        from sales.models import Sale
-        from django.db.models import Count, Sum
-        
-        sales = Sale.objects.filter(shift=obj, status='completed')
-        summary = sales.aggregate(
-            total_sales=Count('id'),
-            total_amount=Sum('total_amount')
-        )
-        return summary
+        summary = self.get_totals(obj)['sales_summary']
+        return {
+            'total_sales': summary['total_sales'],
+            'total_amount': summary['total_amount']
+        }
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         
         # Calculate expected cash dynamically for open shifts
         if instance.status == 'open':
-            from payments.models import Payment
-            from sales.models import Sale
-            from django.db.models import Sum
-            from decimal import Decimal
-            
-            sales = Sale.objects.filter(shift=instance, status='completed')
-            payments = Payment.objects.filter(sale__shift=instance, status='completed')
-            
-            payment_summary = {}
-            for method in ['cash', 'mpesa', 'card', 'airtel_money', 'bank_transfer']:
-                total = payments.filter(payment_method=method).aggregate(
-                    total=Sum('amount')
-                )['total'] or Decimal('0.00')
-                payment_summary[method] = total
-            
-            total_change = Decimal('0.00')
-            for sale in sales:
-                sale_payments = payments.filter(sale=sale)
-                sale_total_paid = sale_payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                if sale_total_paid > sale.total_amount:
-                    total_change += (sale_total_paid - sale.total_amount)
-            
-            cash_total = payment_summary.get('cash', Decimal('0.00'))
-            expected_cash = instance.opening_cash + cash_total - total_change
-            data['expected_cash'] = expected_cash
+            data['expected_cash'] = instance.calculate_expected_cash()
             
         return data
 
@@ -111,8 +109,30 @@ class ShiftDetailSerializer(serializers.ModelSerializer):
 class ShiftOpenSerializer(serializers.Serializer):
     opening_cash = serializers.DecimalField(max_digits=15, decimal_places=2)
     notes = serializers.CharField(required=False, allow_blank=True)
+    terminal = serializers.CharField(required=False, allow_blank=True, help_text="Code of the till the shift opens on")
 
 
 class ShiftCloseSerializer(serializers.Serializer):
     closing_cash = serializers.DecimalField(max_digits=15, decimal_places=2)
     notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class ShiftCashMovementSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=15, decimal_places=2, min_value=Decimal('0.01'))
+    notes = serializers.CharField(required=False, allow_blank=True, max_length=500)
+
+
+class TerminalSerializer(serializers.ModelSerializer):
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+    current_cashier_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Terminal
+        fields = ['id', 'code', 'name', 'branch', 'branch_name', 'printer_name', 'printer_address',
+                  'current_shift', 'current_cashier_name', 'is_active', 'created_at', 'updated_at']
+        read_only_fields = ['current_shift', 'created_at', 'updated_at']
+
+    def get_current_cashier_name(self, obj):
+        if not obj.current_shift:
+            return None
+        return obj.current_shift.cashier.get_full_name() or obj.current_shift.cashier.username
@@ -0,0 +1,69 @@
+"""In-process cache of what checkout needs to know about a terminal.
+
+Resolving a terminal means its branch, the VAT rate and its printer. These
+change rarely, so each process keeps them for TERMINAL_CONTEXT_SECONDS
+instead of querying them on every sale. Saving a terminal drops its entry
+in this process once the save commits; other processes pick the change up
+when their entry expires. The open shift is not cached: it changes at
+every shift handover, and a stale one would put sales on a closed shift.
+"""
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from core.metrics import record_cache
+from core.models import SystemConfig
+from .models import Terminal
+
+DEFAULT_TAX_RATE = Decimal('16.00')
+
+_contexts = {}
+_lock = threading.Lock()
+
+
+class TerminalContext:
+    def __init__(self, terminal, tax_rate):
+        self.terminal_id = terminal.id
+        self.code = terminal.code
+        self.branch = terminal.branch
+        self.printer_name = terminal.printer_name
+        self.printer_address = terminal.printer_address
+        self.tax_rate = tax_rate
+
+
+def configured_tax_rate():
+    value = SystemConfig.objects.filter(key='VAT_RATE').values_list('value', flat=True).first()
+    try:
+        return Decimal(value) if value else DEFAULT_TAX_RATE
+    except InvalidOperation:
+        return DEFAULT_TAX_RATE
+
+
+def get_terminal_context(code):
+    """Cached context of the active terminal `code`, or None if there is no such terminal."""
+    now = time.monotonic()
+    with _lock:
+        cached = _contexts.get(code)
+    hit = bool(cached and cached[0] > now)
+    record_cache('terminal', hit)
+    if hit:
+        return cached[1]
+
+    terminal = (Terminal.objects.select_related('branch')
+                .filter(code=code, is_active=True).first())
+    if not terminal:
+        return None
+
+    context = TerminalContext(terminal, configured_tax_rate())
+    with _lock:
+        _contexts[code] = (now + settings.TERMINAL_CONTEXT_SECONDS, context)
+    return context
+
+
+def invalidate_terminal_context(code=None):
+    """Drop the cached context of terminal `code`, or of every terminal."""
+    with _lock:
+        if code is None:
+            _contexts.clear()
+        else:
+            _contexts.pop(code, None)
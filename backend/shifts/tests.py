@@ -1,3 +1,193 @@
+import io
+from decimal import Decimal
+from django.db import connection
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from core.models import Branch, User
+from payments.models import Payment
+from inventory.models import Product
+from sales.models import Sale
+from .models import Shift, ShiftTransaction, Terminal
+from .terminals import invalidate_terminal_context
 
-# Create your tests here.
+
+class ShiftReportBenchmarkTest(TestCase):
+    """The shift report must cost the same number of queries for 20 or 2,000 sales."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Test Branch', tax_id='P001')
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+
+    def create_shift(self, sale_count):
+        shift = Shift.objects.create(cashier=self.cashier, branch=self.branch,
+                                     opening_cash=Decimal('1000.00'), created_by=self.cashier)
+        sales = Sale.objects.bulk_create([
+            Sale(sale_number=f'BENCH-{shift.id}-{i}', branch=self.branch, cashier=self.cashier, shift=shift,
+                 subtotal=Decimal('150.00'), tax_amount=Decimal('20.69'), total_amount=Decimal('150.00'),
+                 amount_paid=Decimal('200.00'), change_given=Decimal('50.00'), status='completed')
+            for i in range(sale_count)
+        ])
+        Payment.objects.bulk_create(
+            [Payment(sale=sale, payment_method='cash', amount=Decimal('100.00'), status='completed')
+             for sale in sales] +
+            [Payment(sale=sale, payment_method='mpesa', amount=Decimal('100.00'), status='completed')
+             for sale in sales]
+        )
+        # Bulk-created payments bypass the ledger; rebuild balances with a single replayed entry each
+        for transaction_type, method, amount in [('sale', 'cash', 100), ('sale', 'mpesa', 100), ('change', 'cash', 50)]:
+            shift.record_transaction(transaction_type, Decimal(amount) * sale_count, method)
+        return shift
+
+    def fetch_report(self, shift):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/shifts/{shift.id}/report/')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_report_query_count_is_constant(self):
+        small, small_queries = self.fetch_report(self.create_shift(20))
+        large, large_queries = self.fetch_report(self.create_shift(2000))
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large['sales_summary']['total_sales'], 2000)
+        self.assertEqual(large['payment_summary']['mpesa'], Decimal('200000.00'))
+        # 2,000 x (100 cash - 50 change)
+        self.assertEqual(large['payment_summary']['cash'], Decimal('100000.00'))
+        self.assertEqual(large['shift']['expected_cash'], Decimal('101000.00'))
+
+
+class ShiftLedgerTest(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Test Branch', tax_id='P001')
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+        self.shift = Shift.objects.create(cashier=self.cashier, branch=self.branch,
+                                          opening_cash=Decimal('1000.00'), created_by=self.cashier)
+
+    def pay(self, total, *tenders):
+        sale = Sale.objects.create(branch=self.branch, cashier=self.cashier, shift=self.shift,
+                                   subtotal=Decimal(total), tax_amount=Decimal('0.00'),
+                                   total_amount=Decimal(total))
+        for method, amount in tenders:
+            response = self.client.post('/api/payments/', {
+                'sale_id': sale.id, 'payment_method': method, 'amount': amount
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        return sale
+
+    def test_payments_and_cash_movements_are_ledgered(self):
+        self.pay('150.00', ('mpesa', '100.00'), ('cash', '100.00'))
+        self.pay('80.00', ('cash', '80.00'))
+
+        response = self.client.post(f'/api/shifts/{self.shift.id}/cash_drop/',
+                                    {'amount': '200.00', 'notes': 'Safe drop'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(f'/api/shifts/{self.shift.id}/payout/',
+                                    {'amount': '30.00', 'notes': 'Delivery'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(f'/api/shifts/{self.shift.id}/payout/', {'amount': '5000.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.shift.refresh_from_db()
+        self.assertEqual(self.shift.total_transactions, 2)
+        self.assertEqual(self.shift.total_sales, Decimal('230.00'))
+        self.assertEqual(self.shift.cash_total, Decimal('180.00'))
+        self.assertEqual(self.shift.mpesa_total, Decimal('100.00'))
+        self.assertEqual(self.shift.change_total, Decimal('50.00'))
+        self.assertEqual(self.shift.cash_drops_total, Decimal('200.00'))
+        self.assertEqual(self.shift.payouts_total, Decimal('30.00'))
+        # 1000 + 180 cash - 50 change - 200 drop - 30 payout
+        self.assertEqual(self.shift.calculate_expected_cash(), Decimal('900.00'))
+
+        types = list(ShiftTransaction.objects.filter(shift=self.shift)
+                     .order_by('id').values_list('transaction_type', 'amount'))
+        self.assertEqual(types, [
+            ('sale', Decimal('100.00')), ('sale', Decimal('100.00')), ('change', Decimal('-50.00')),
+            ('sale', Decimal('80.00')), ('cash_drop', Decimal('-200.00')), ('payout', Decimal('-30.00')),
+        ])
+
+        report = self.client.get(f'/api/shifts/{self.shift.id}/report/').data
+        self.assertEqual(report['shift']['expected_cash'], Decimal('900.00'))
+        self.assertEqual(report['payment_summary']['cash'], Decimal('130.00'))
+        self.assertEqual(report['cash_movements']['cash_drops'], Decimal('200.00'))
+
+    def test_verify_shift_ledger_detects_and_repairs_drift(self):
+        self.pay('100.00', ('cash', '100.00'))
+        call_command('verify_shift_ledger', stdout=io.StringIO())
+
+        Shift.objects.filter(pk=self.shift.pk).update(cash_total=Decimal('999.00'))
+        with self.assertRaises(CommandError):
+            call_command('verify_shift_ledger', stdout=io.StringIO())
+
+        call_command('verify_shift_ledger', '--fix', stdout=io.StringIO())
+        self.shift.refresh_from_db()
+        self.assertEqual(self.shift.cash_total, Decimal('100.00'))
+
+
+class TerminalTest(TestCase):
+    def setUp(self):
+        invalidate_terminal_context()
+        self.branch = Branch.objects.create(name='Test Branch', tax_id='P001')
+        self.cashier = User.objects.create_user(username='cashier', password='password',
+                                                role='cashier', branch=self.branch)
+        self.terminal = Terminal.objects.create(code='T07', branch=self.branch, printer_name='EPSON TM-T20')
+        self.product = Product.objects.create(name='Bread', barcode='111', branch=self.branch,
+                                              price=Decimal('116.00'), cost_price=Decimal('80.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+
+    def checkout(self):
+        return self.client.post('/api/sales/', {'items': [{'product_id': self.product.id, 'quantity': 1}]},
+                                format='json', HTTP_X_TERMINAL='T07')
+
+    def test_checkout_resolves_terminal_once(self):
+        response = self.client.post('/api/shifts/open_shift/', {'opening_cash': '500.00', 'terminal': 'T07'})
+        self.assertEqual(response.status_code, 201)
+        shift = Shift.objects.get(pk=response.data['id'])
+        self.terminal.refresh_from_db()
+        self.assertEqual(self.terminal.current_shift, shift)
+
+        self.assertEqual(self.checkout().status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        sale = Sale.objects.get(pk=response.data['id'])
+        self.assertEqual((sale.terminal, sale.shift, sale.branch), (self.terminal, shift, self.branch))
+        self.assertFalse([q for q in queries if 'FROM "shifts_terminal"' in q['sql']])
+
+        response = self.client.post(f'/api/shifts/{shift.id}/close_shift/', {'closing_cash': '500.00'})
+        self.assertEqual(response.status_code, 200)
+        self.terminal.refresh_from_db()
+        self.assertIsNone(self.terminal.current_shift)
+        self.assertIsNone(Sale.objects.get(pk=self.checkout().data['id']).shift)
+
+    def test_shift_closed_elsewhere_is_not_used_by_a_cached_terminal(self):
+        response = self.client.post('/api/shifts/open_shift/', {'opening_cash': '500.00', 'terminal': 'T07'})
+        shift = Shift.objects.get(pk=response.data['id'])
+        self.assertEqual(Sale.objects.get(pk=self.checkout().data['id']).shift, shift)
+
+        # Closed by another process, whose terminal save does not reach this process's cache
+        Shift.objects.filter(pk=shift.pk).update(status='closed')
+        Terminal.objects.filter(pk=self.terminal.pk).update(current_shift=None)
+        self.assertIsNone(Sale.objects.get(pk=self.checkout().data['id']).shift)
+
+        response = self.client.post('/api/shifts/open_shift/', {'opening_cash': '500.00', 'terminal': 'T07'})
+        self.assertEqual(Sale.objects.get(pk=self.checkout().data['id']).shift_id, response.data['id'])
+
+    def test_unknown_or_foreign_terminal_is_rejected(self):
+        response = self.client.post('/api/sales/', {'items': [{'product_id': self.product.id, 'quantity': 1}]},
+                                    format='json', HTTP_X_TERMINAL='NOPE')
+        self.assertEqual(response.status_code, 400)
+
+        other = Branch.objects.create(name='Other Branch', tax_id='P002')
+        self.terminal.branch = other
+        self.terminal.save()
+        self.assertEqual(self.checkout().status_code, 403)
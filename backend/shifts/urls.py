@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ShiftViewSet, ShiftTransactionViewSet
+from .views import ShiftViewSet, ShiftTransactionViewSet, TerminalViewSet
 
 router = DefaultRouter()
 router.register(r'shifts', ShiftViewSet, basename='shift')
 router.register(r'shift-transactions', ShiftTransactionViewSet, basename='shift-transaction')
+router.register(r'terminals', TerminalViewSet, basename='terminal')
 
 urlpatterns = [
     path('', include(router.urls)),
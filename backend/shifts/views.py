@@ -2,13 +2,16 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
-from .models import Shift, ShiftTransaction
+from .models import Shift, ShiftTransaction, Terminal
 from .serializers import (ShiftSerializer, ShiftDetailSerializer, ShiftOpenSerializer,
-                          ShiftCloseSerializer, ShiftTransactionSerializer)
+                          ShiftCloseSerializer, ShiftTransactionSerializer, ShiftCashMovementSerializer,
+                          TerminalSerializer)
 from core.permissions import IsCashier, IsManager
+from core.dates import parse_date, date_filter
 
 
 class ShiftViewSet(viewsets.ModelViewSet):
@@ -31,17 +34,18 @@ class ShiftViewSet(viewsets.ModelViewSet):
         
         status_filter = self.request.query_params.get('status', None)
         cashier = self.request.query_params.get('cashier', None)
-        date_from = self.request.query_params.get('date_from', None)
-        date_to = self.request.query_params.get('date_to', None)
+        try:
+            date_from = parse_date(self.request.query_params.get('date_from'))
+            date_to = parse_date(self.request.query_params.get('date_to'))
+        except ValueError:
+            raise ValidationError({'error': 'Invalid date format. Use YYYY-MM-DD'})
         
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         if cashier:
             queryset = queryset.filter(cashier_id=cashier)
-        if date_from:
-            queryset = queryset.filter(opening_time__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(opening_time__lte=date_to)
+        if date_from or date_to:
+            queryset = queryset.filter(**date_filter('opening_time', date_from, date_to))
         
         return queryset.select_related('cashier', 'branch', 'closed_by').order_by('-opening_time')
     
@@ -63,14 +67,32 @@ class ShiftViewSet(viewsets.ModelViewSet):
 
         data = serializer.validated_data
 
+        terminal = None
+        terminal_code = data.get('terminal') or request.headers.get('X-Terminal')
+        if terminal_code:
+            terminal = Terminal.objects.select_for_update().filter(code=terminal_code, is_active=True).first()
+            if not terminal:
+                return Response({'error': f'Unknown or inactive terminal {terminal_code}'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            if request.user.role != 'admin' and terminal.branch_id != request.user.branch_id:
+                return Response({'error': 'Terminal belongs to another branch'},
+                              status=status.HTTP_403_FORBIDDEN)
+            if terminal.current_shift_id and terminal.current_shift.status == 'open':
+                return Response({'error': f'Terminal {terminal.code} already has an open shift'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
         shift = Shift.objects.create(
             cashier=request.user,
-            branch=request.user.branch,
+            branch=terminal.branch if terminal else request.user.branch,
+            terminal=terminal,
             opening_cash=data['opening_cash'],
             notes=data.get('notes', ''),
             status='open',
             created_by=request.user
         )
+        if terminal:
+            terminal.current_shift = shift
+            terminal.save(update_fields=['current_shift', 'updated_at'])
 
         response_serializer = ShiftSerializer(shift)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -78,7 +100,8 @@ class ShiftViewSet(viewsets.ModelViewSet):
     @transaction.atomic
     @action(detail=True, methods=['post'])
     def close_shift(self, request, pk=None):
-        shift = self.get_object()
+        # Lock so running balances cannot move between reading and saving them
+        shift = Shift.objects.select_for_update().get(pk=self.get_object().pk)
         
         if shift.status != 'open':
             return Response({'error': 'Shift is already closed'}, 
@@ -104,9 +127,53 @@ class ShiftViewSet(viewsets.ModelViewSet):
         
         shift.save()
         
+        if shift.terminal and shift.terminal.current_shift_id == shift.id:
+            shift.terminal.current_shift = None
+            shift.terminal.save(update_fields=['current_shift', 'updated_at'])
+        
         response_serializer = ShiftDetailSerializer(shift)
         return Response(response_serializer.data)
     
+    def record_cash_movement(self, request, transaction_type):
+        shift = Shift.objects.select_for_update().get(pk=self.get_object().pk)
+        
+        if shift.status != 'open':
+            return Response({'error': 'Shift is not open'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        if shift.cashier != request.user and request.user.role not in ['manager', 'admin']:
+            return Response({'error': 'You can only record cash movements on your own shift'}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = ShiftCashMovementSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        
+        if data['amount'] > shift.calculate_expected_cash():
+            return Response({'error': 'Amount exceeds the cash in the drawer'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        entry = shift.record_transaction(
+            transaction_type,
+            data['amount'],
+            user=request.user,
+            description=data.get('notes', '')
+        )
+        
+        return Response(ShiftTransactionSerializer(entry).data, status=status.HTTP_201_CREATED)
+    
+    @transaction.atomic
+    @action(detail=True, methods=['post'])
+    def cash_drop(self, request, pk=None):
+        return self.record_cash_movement(request, 'cash_drop')
+    
+    @transaction.atomic
+    @action(detail=True, methods=['post'])
+    def payout(self, request, pk=None):
+        return self.record_cash_movement(request, 'payout')
+    
     @action(detail=False, methods=['get'])
     def current(self, request):
         shift = Shift.objects.filter(
@@ -124,52 +191,24 @@ class ShiftViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def report(self, request, pk=None):
         shift = self.get_object()
+        totals = shift.report_totals()
         
-        from sales.models import Sale
-        from payments.models import Payment
-        from django.db.models import Sum, Count
-        
-        sales = Sale.objects.filter(shift=shift, status='completed')
-        sales_summary = sales.aggregate(
-            total_sales=Count('id'),
-            total_amount=Sum('total_amount'),
-            total_tax=Sum('tax_amount'),
-            total_discount=Sum('discount_amount')
-        )
+        # Report cash net of change given
+        payment_summary = dict(totals['payment_summary'])
+        payment_summary['cash'] -= totals['total_change']
         
-        payments = Payment.objects.filter(sale__shift=shift, status='completed')
-        payment_summary = {}
-        for method in ['cash', 'mpesa', 'card', 'airtel_money', 'bank_transfer']:
-            total = payments.filter(payment_method=method).aggregate(
-                total=Sum('amount')
-            )['total'] or Decimal('0.00')
-            payment_summary[method] = total
-            
-        # Calculate expected cash dynamically
-        # Expected Cash = Opening Cash + Cash Payments - Change Given
-        # Change Given = Total Payments - Sale Total (where Total Payments > Sale Total)
-        
-        total_change = Decimal('0.00')
-        for sale in sales:
-            sale_payments = payments.filter(sale=sale)
-            sale_total_paid = sale_payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-            if sale_total_paid > sale.total_amount:
-                total_change += (sale_total_paid - sale.total_amount)
-        
-        # Update cash in payment summary to reflect net cash (after change)
-        if 'cash' in payment_summary:
-            payment_summary['cash'] -= total_change
-
-        cash_total = payment_summary.get('cash', Decimal('0.00'))
-        expected_cash = shift.opening_cash + cash_total
-        
-        shift_data = ShiftDetailSerializer(shift).data
-        shift_data['expected_cash'] = expected_cash
+        shift_data = ShiftDetailSerializer(shift, context={'shift_totals': {shift.pk: totals}}).data
+        shift_data['expected_cash'] = shift.calculate_expected_cash()
         
         report_data = {
             'shift': shift_data,
-            'sales_summary': sales_summary,
+            'sales_summary': totals['sales_summary'],
             'payment_summary': payment_summary,
+            'cash_movements': {
+                'change_given': shift.change_total,
+                'cash_drops': shift.cash_drops_total,
+                'payouts': shift.payouts_total
+            },
             'cash_variance': shift.cash_difference if shift.cash_difference else Decimal('0.00')
         }
         
@@ -186,10 +225,39 @@ class ShiftTransactionViewSet(viewsets.ReadOnlyModelViewSet):
         
         shift = self.request.query_params.get('shift', None)
         payment_method = self.request.query_params.get('payment_method', None)
+        transaction_type = self.request.query_params.get('transaction_type', None)
         
         if shift:
             queryset = queryset.filter(shift_id=shift)
         if payment_method:
             queryset = queryset.filter(payment_method=payment_method)
+        if transaction_type:
+            queryset = queryset.filter(transaction_type=transaction_type)
         
-        return queryset.select_related('shift', 'sale').order_by('-created_at')
+        return queryset.select_related('shift', 'sale', 'created_by').order_by('-created_at')
+
+
+class TerminalViewSet(viewsets.ModelViewSet):
+    queryset = Terminal.objects.all()
+    serializer_class = TerminalSerializer
+    permission_classes = [IsAuthenticated, IsCashier]
+
+    def get_permissions(self):
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return [IsAuthenticated(), IsManager()]
+        return [IsAuthenticated(), IsCashier()]
+
+    def get_queryset(self):
+        queryset = Terminal.objects.select_related('branch', 'current_shift__cashier')
+        if self.request.user.role != 'admin':
+            queryset = queryset.filter(branch=self.request.user.branch)
+        return queryset
+
+    def perform_create(self, serializer):
+        branch = serializer.validated_data.get('branch')
+        if self.request.user.role != 'admin' and branch != self.request.user.branch:
+            raise ValidationError({'branch': 'Managers can only register terminals in their own branch'})
+        serializer.save(created_by=self.request.user)
+
+    def perform_update(self, serializer):
+        serializer.save(updated_by=self.request.user)
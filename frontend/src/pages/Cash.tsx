@@ -18,7 +18,7 @@ import { LoadingSpinner } from '../components/ui/LoadingSpinner';
 import { CurrencyDisplay } from '../components/ui/CurrencyDisplay';
 import { reportsApi } from '../services/reportsApi';
 import { salesApi } from '../services/salesApi';
-import type { CashFlowStats } from '../services/reportsApi';
+import type { CashFlowStats, ReportFilters } from '../services/reportsApi';
 import type { Sale, SaleItem } from '../services/salesApi';
 
 interface CashProps {
@@ -36,6 +36,9 @@ export const Cash: React.FC<CashProps> = ({ isDark, themeClasses }) => {
     end: new Date().toISOString().split('T')[0]
   });
   const [selectedSale, setSelectedSale] = useState<Sale | null>(null);
+  // Filters of the loaded report, so further pages of transactions match it
+  const [loadedFilters, setLoadedFilters] = useState<ReportFilters | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchCashStats();
@@ -71,13 +74,15 @@ export const Cash: React.FC<CashProps> = ({ isDark, themeClasses }) => {
         end = new Date(now.getFullYear(), now.getMonth() + 1, 0).toISOString().split('T')[0];
       }
 
-      const data = await reportsApi.getCashFlow({
+      const filters = {
         start_date: start,
         end_date: end,
         payment_method: paymentMethod
-      });
+      };
+      const data = await reportsApi.getCashFlow(filters);
 
       setStats(data);
+      setLoadedFilters(filters);
 
     } catch (error) {
       console.error('Error fetching cash stats:', error);
@@ -86,6 +91,24 @@ export const Cash: React.FC<CashProps> = ({ isDark, themeClasses }) => {
     }
   };
 
+  // The report returns transactions a page at a time; append the next page to the list
+  const loadMoreTransactions = async () => {
+    if (!stats?.next_cursor || !loadedFilters) return;
+    setLoadingMore(true);
+    try {
+      const data = await reportsApi.getCashFlow(loadedFilters, stats.next_cursor);
+      setStats(prev => prev && {
+        ...prev,
+        transactions: [...prev.transactions, ...data.transactions],
+        next_cursor: data.next_cursor
+      });
+    } catch (error) {
+      console.error('Error fetching more transactions:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDateChange = (type: 'start' | 'end', value: string) => {
     setDateRange(prev => ({ ...prev, [type]: value }));
   };
@@ -278,7 +301,7 @@ export const Cash: React.FC<CashProps> = ({ isDark, themeClasses }) => {
                     };
                     return (
                       <tr
-                        key={tx.id}
+                        key={`${tx.type}-${tx.id}`}
                         className={`${themeClasses.hover} ${isSale ? 'cursor-pointer hover:bg-blue-50 dark:hover:bg-blue-900/20' : ''}`}
                         onClick={isSale ? handleClick : undefined}
                         title={isSale ? 'View sale details' : ''}
@@ -321,6 +344,20 @@ export const Cash: React.FC<CashProps> = ({ isDark, themeClasses }) => {
               </tbody>
             </table>
           </div>
+          {stats?.next_cursor && (
+            <div className="flex items-center justify-between mt-4">
+              <span className={`text-sm ${themeClasses.textSecondary}`}>
+                Showing the latest {stats.transactions.length} transactions
+              </span>
+              <button
+                onClick={loadMoreTransactions}
+                disabled={loadingMore}
+                className="text-blue-600 hover:text-blue-700 text-sm font-medium disabled:opacity-50 disabled:cursor-not-allowed"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
 
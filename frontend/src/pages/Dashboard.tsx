@@ -47,12 +47,14 @@ export const Dashboard: React.FC<DashboardProps> = ({ isDark, themeClasses }) =>
         setLoading(true);
         setError(null);
 
-        const [revenue, traffic, dashboardStats, activity] = await Promise.all([
-          dashboardApi.getRevenueData(),
+        // One composite request instead of separate stats/chart/activity calls
+        const [dashboard, traffic] = await Promise.all([
+          dashboardApi.getDashboard(),
           dashboardApi.getTrafficSources(),
-          dashboardApi.getStats(),
-          dashboardApi.getRecentActivity(),
         ]);
+        const revenue = dashboard.revenue_chart;
+        const dashboardStats = dashboard.stats;
+        const activity = dashboard.recent_activity;
 
         setRevenueData(revenue);
         setTrafficData(traffic);
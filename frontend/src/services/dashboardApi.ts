@@ -50,8 +50,27 @@ export interface RecentActivity {
   user?: string;
 }
 
+export interface SalesChannel {
+  name: string;
+  value: number;
+  count: number;
+  amount: string;
+}
+
+export interface DashboardData {
+  stats: DashboardStats;
+  recent_activity: RecentActivity[];
+  revenue_chart: RevenueDataPoint[];
+  sales_channels: SalesChannel[];
+}
+
 // Dashboard API service
 export const dashboardApi = {
+  // Get every dashboard section in a single request
+  getDashboard: async (): Promise<DashboardData> => {
+    return httpClient.get('/reports/dashboard/');
+  },
+
   // Get dashboard statistics
   getStats: async (): Promise<DashboardStats> => {
     try {
@@ -81,6 +81,15 @@ class HttpClient {
       };
     }
     
+    // Tills registered as terminals identify themselves so checkout can use the cached terminal context
+    const terminalCode = localStorage.getItem('terminal_code');
+    if (terminalCode) {
+      config.headers = {
+        ...config.headers,
+        'X-Terminal': terminalCode,
+      };
+    }
+
     console.log(`[httpClient] Final headers:`, config.headers);
 
     try {
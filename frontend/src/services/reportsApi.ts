@@ -88,6 +88,12 @@ export interface CashFlowStats {
     mpesa: number;
     other: number;
   };
+  cash_out_breakdown: {
+    cash: number;
+    card: number;
+    mpesa: number;
+    other: number;
+  };
   transactions: Array<{
     id: number;
     date: string;
@@ -97,8 +103,10 @@ export interface CashFlowStats {
     method: string;
     reference: string;
     processed_by: string;
-    sale_id?: number;
+    sale_id?: number | null;
   }>;
+  // Pass back to getCashFlow for the next page of transactions; null on the last page
+  next_cursor: string | null;
 }
 
 // Reports API service
@@ -233,13 +241,14 @@ export const reportsApi = {
   },
 
   // Get cash flow report
-  getCashFlow: async (filters?: ReportFilters): Promise<CashFlowStats> => {
+  getCashFlow: async (filters?: ReportFilters, cursor?: string): Promise<CashFlowStats> => {
     try {
       const response = await httpClient.get(ENDPOINTS.REPORTS.CASH_FLOW, {
         date_from: filters?.start_date,
         date_to: filters?.end_date,
         branch: filters?.branch_id,
-        payment_method: filters?.payment_method
+        payment_method: filters?.payment_method,
+        cursor
       });
       return response as unknown as CashFlowStats;
     } catch (error) {
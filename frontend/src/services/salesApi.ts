@@ -142,6 +142,8 @@ export const salesApi = {
   getStatistics: (params?: {
     branch?: number;
     date?: string;
+    // Comma-separated: today, week, month, YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD
+    windows?: string;
   }) => {
     return httpClient.get(`${ENDPOINTS.SALES}statistics/`, params);
   },